@@ -1,6 +1,15 @@
 from __future__ import (absolute_import)
 
+from .pool import *
+from .cache import *
+from .profiler import *
+from .plan import *
+from .slowlog import *
+from .workload import *
 from .gpconnecor import *
+from .asyncgpconnector import *
 from .stop import *
+from .checks import *
+from .flagmart import *
 from .autocheck import *
 from .repository import *
\ No newline at end of file
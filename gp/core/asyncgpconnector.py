@@ -0,0 +1,192 @@
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from .gpconnecor import GPConnector
+
+class AsyncGPConnector(object):
+    '''
+    Класс для асинхронного соединения с ПКАП CJM
+    Методы повторяют API GPConnector и возвращают корутины; запросы выполняются в пуле потоков на соединениях из пула
+    GPConnector, поэтому независимые запросы можно запускать одновременно через asyncio.gather.
+    Закрепленное соединение GPConnector.session/transaction привязано к потоку и в пул потоков не передается,
+    поэтому вызовы внутри session/transaction не поддерживаются и завершаются ошибкой
+
+    Параметры
+    ----------
+    user: имя пользователя
+    password: пароль пользователя
+    host: хост-адрес базы данных
+    dbname: имя базы данных
+    gpconnector: экземпляр класса GPConnector, по умолчанию None; если не передан, создается новый по параметрам подключения
+    max_workers: int, по умолчанию None; максимальное количество одновременно выполняемых запросов, по умолчанию равно размеру пула соединений
+
+    Атрибуты
+    ----------
+    gpconnector: экземпляр класса GPConnector, через который выполняются запросы
+    executor: пул потоков для выполнения запросов
+
+    Методы
+    ----------
+    select_list: метод для выбора данных в list
+    select_df: метод для выбора данных в датафрейм
+    select_prepared: метод для выбора данных подготовленным запросом с параметрами
+    execute: метод для запуска скриптов
+    create: метод для создания объектов
+    insert: метод для вставки записей в таблицу
+    drop: метод для удаления объектов
+    describe: метод для получения колонок и типов таргета
+    validate_target: метод для проверки корректности таргета
+    close: метод для остановки пула потоков и закрытия соединений
+    '''
+
+    def __init__(self, user: str = 'postgres', password: str = '1234', host: str = 'localhost', dbname: str = 'postgres',
+                 gpconnector: GPConnector = None, max_workers: int = None):
+        self.gpconnector = gpconnector or GPConnector(user, password, host, dbname)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or self.gpconnector.pool.max_size)
+
+    async def _run(self, method, *args, **kwargs):
+        # запрос в пуле потоков выполнился бы не на закрепленном соединении, а на другом соединении из пула,
+        # без временных таблиц и вне транзакции вызывающего кода
+        if getattr(self.gpconnector._local, 'conn', None) is not None:
+            raise Exception("ERROR: Методы AsyncGPConnector нельзя вызывать внутри GPConnector.session/transaction!")
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(method, *args, **kwargs))
+
+    async def select_list(self, query: str, limit: int = 1000000, options: str = None) -> list:
+        '''
+        Метод для выбора данных в list
+
+        Параметры
+        ----------
+        query: str; sql-запрос
+        limit: int, по умолчанию 1000000; ограничение количества выводимых строк, None - без ограничения
+        options: str, по умолчанию None; опции подключения к ДБ
+        '''
+
+        return await self._run(self.gpconnector.select_list, query, limit, options=options)
+
+    async def select_df(self, query: str, limit: int = 1000000, options: str = None, engine: str = None) -> pd.DataFrame:
+        '''
+        Метод для выбора данных в датафрейм
+
+        Параметры
+        ----------
+        query: str; sql-запрос
+        limit: int, по умолчанию 1000000; ограничение количества выводимых строк, None - без ограничения
+        options: str, по умолчанию None; опции подключения к ДБ
+        engine: str, {'read_sql', 'copy', 'columnar'}, по умолчанию None; способ выборки данных (см. GPConnector.select_df)
+        '''
+
+        return await self._run(self.gpconnector.select_df, query, limit, options=options, engine=engine)
+
+    async def select_prepared(self, query: str, params=(), limit: int = 1000000, as_df: bool = False,
+                              options: str = None):
+        '''
+        Метод для выбора данных подготовленным запросом с параметрами
+
+        Параметры
+        ----------
+        query: str; sql-запрос с параметрами $1, $2, ...
+        params: tuple или list, по умолчанию (); значения параметров запроса
+        limit: int, по умолчанию 1000000; ограничение количества выводимых строк, None - без ограничения
+        as_df: bool, по умолчанию False; указывает, что результат нужно вернуть в виде датафрейма вместо list
+        options: str, по умолчанию None; опции подключения к ДБ
+        '''
+
+        return await self._run(self.gpconnector.select_prepared, query, params, limit, as_df=as_df, options=options)
+
+    async def execute(self, script: str, data=None, options: str = None):
+        '''
+        Метод для запуска скриптов
+
+        Параметры
+        ----------
+        script: str; sql-код скрипта
+        data: датафрейм или list; данные для скрипта
+        options: str, по умолчанию None; опции подключения к ДБ
+        '''
+
+        return await self._run(self.gpconnector.execute, script, data, options=options)
+
+    async def create(self, object_type: str, object_name: str, target, columns: str = None, options: str = None,
+                     method: str = 'values', distributed_by: str = 'auto', storage=None):
+        '''
+        Метод для создания объектов
+
+        Параметры
+        ----------
+        object_type: str, {MATERIALIZED VIEW', 'VIEW', 'TABLE', 'FUNCTION'}; тип объекта
+        object_name: str; название объекта в формате схема.название
+        target: sql-код запроса, название таблицы, sql-функция, list или датафрейм; данные для создания объекта
+        columns: str, по умолчанию None; список колонок в созданной таблице в формате 'col1, col2, col3'
+        options: str, по умолчанию None; опции подключения к ДБ
+        method: str, {'values', 'copy', 'binary'}, по умолчанию 'values'; способ загрузки list/датафрейма
+        distributed_by: str, по умолчанию 'auto'; ключ распределения (см. GPConnector.create)
+        storage: dict или str, по умолчанию None; параметры хранения WITH (...) (см. GPConnector.create)
+        '''
+
+        return await self._run(self.gpconnector.create, object_type, object_name, target, columns, options=options,
+                               method=method, distributed_by=distributed_by, storage=storage)
+
+    async def insert(self, table_name: str, target, columns: str = None, options: str = None, method: str = 'values'):
+        '''
+        Метод для вставки записей в таблицу
+
+        Параметры
+        ----------
+        table_name: str; название таблицы для загрузки в формате схема.название
+        target: sql-код запроса, название таблицы, list или датафрейм; данные для вставки
+        columns: str; названия колонок для заполнения в формате 'col1, col2, col3'
+        options: str, по умолчанию None; опции подключения к ДБ
+        method: str, {'values', 'copy', 'binary'}, по умолчанию 'values'; способ загрузки list/датафрейма
+        '''
+
+        return await self._run(self.gpconnector.insert, table_name, target, columns, options=options, method=method)
+
+    async def drop(self, object_name: str, options: str = None):
+        '''
+        Метод для удаления объектов
+
+        Параметры
+        ----------
+        object_name: str; название объекта в формате схема.название
+        options: str, по умолчанию None; опции подключения к ДБ
+        '''
+
+        return await self._run(self.gpconnector.drop, object_name, options=options)
+
+    async def describe(self, target: str, columns: str = None, options: str = None) -> dict:
+        '''
+        Метод для получения колонок и типов таргета (см. GPConnector.describe)
+
+        Параметры
+        ----------
+        target: str; sql-код запроса или название таблицы в формате схема.название
+        columns: str, по умолчанию None; список колонок таргета в формате 'col1, col2, col3', None - все колонки
+        options: str, по умолчанию None; опции подключения к ДБ
+        '''
+
+        return await self._run(self.gpconnector.describe, target, columns, options)
+
+    async def validate_target(self, target, check_df: bool = True, check_list: bool = True, check_function: bool = True,
+                              check_table: bool = True, check_sql: bool = True, options: str = None) -> bool:
+        '''
+        Метод для проверки корректности таргета
+
+        Параметры
+        ----------
+        target: sql-код запроса, название таблицы, list или датафрейм
+        check_df, check_list, check_function, check_table, check_sql: bool, по умолчанию True; разрешенные типы таргета
+        options: str, по умолчанию None; опции подключения к ДБ
+        '''
+
+        return await self._run(self.gpconnector.validate_target, target, check_df, check_list, check_function,
+                               check_table, check_sql, options)
+
+    def close(self):
+        '''
+        Метод для остановки пула потоков и закрытия соединений
+        '''
+
+        self.executor.shutdown(wait=True)
+        self.gpconnector.close()
@@ -1,7 +1,13 @@
-from multipledispatch import dispatch
+import json
+import hashlib
+from datetime import date
 import pandas as pd
 import plotly.express as px
 import numpy as np
+from .profiler import traced
+from .workload import uses_workload
+from .checks import Check, CHECKS, _fields
+from .flagmart import CheckFlagMart
 
 class Autocheck(object):
     '''
@@ -27,11 +33,32 @@ class Autocheck(object):
         данные для фильтрации
     columns: str, по умолчанию None; список колонок для таргета типа list
     correct: датафрейм; записи из таргета, прошедшие проверку
-    errors: датафрейм; записи из таргета, не прошедшие проверку
+    errors: датафрейм; записи из таргета, не прошедшие проверку (в режиме 'aggregate' - выборка таких записей)
+    summary: pd.Series; количество записей таргета, записей с ошибками и записей, не прошедших каждую из проверок
+    statistics: датафрейм; количество записей по сочетаниям проверок, не пройденных записью (только в режиме 'aggregate')
+    result_table: str; временная таблица с результатом проверки в режиме 'aggregate'
+    correct_query: str; sql-запрос корректных записей из result_table (только в режиме 'aggregate')
+    result_like: str, по умолчанию None; таблица, из которой берутся типы колонок result_table при проверке
+        датафрейма/list в режиме 'aggregate' (например, таблица, в которую затем вставляются корректные строки),
+        None - типы определяются по первым copy_sample_size строкам (см. GPConnector.create)
+    checks: list; проверки таргета (см. Check), по умолчанию копия списка CHECKS
+    cache_table: str; таблица с результатами проверок по витринам для инкрементальной проверки (см. check)
+    freshness: str, {'hash', 'catalog'}, по умолчанию 'hash'; способ определения изменения витрин для инкрементальной проверки:
+        'hash' - по количеству строк и сумме хэшей строк справочников проверки (см. Check.lookups), то есть только тех данных
+        витрин, которые читает проверка; обнаруживает INSERT/UPDATE/DELETE, но каждый запуск один раз читает справочники
+        (без соединения с таргетом), а витрины, на которые ссылается predicate без справочника, - целиком;
+        совпадение суммы хэшей у разных данных теоретически возможно,
+        'catalog' - по файлу таблицы, оценке количества строк и времени последней операции из каталога без чтения витрин;
+        INSERT/UPDATE/DELETE в каталоге не отражаются, поэтому способ подходит только для витрин, которые полностью
+        пересоздаются (CREATE TABLE AS) или очищаются (TRUNCATE) перед загрузкой
+    flag_mart: экземпляр класса CheckFlagMart; витрина предрасчитанных признаков клиентов и продуктов
+    tables: dict; названия витрин, подставляемые в sql-выражения проверок
 
     Методы
     ----------
     check: метод для проверки таргета
+    add_check: метод для добавления проверки
+    remove_check: метод для удаления проверки
     show_statistics: метод для вывода статистики проверки таргета
 
     Таблицы
@@ -41,40 +68,90 @@ class Autocheck(object):
     prom.ma_task: витрина с задачами из CMDM
     prom.ma_agreement: витрина с договорами из CMDM
     prom.ma_unified_customer: витрина с атрибутами организации из CMDM
+    prom.request_segment: сегменты клиентов из заявки
     '''
 
     def __init__(self, gpconnector, target, columns: str = None):
-        self.autocheck_template = "sandbox.autocheck_"
+        # временные таблицы указываются со схемой pg_temp, чтобы drop не удалил одноименную постоянную таблицу из search_path
+        self.autocheck_table = "pg_temp.autocheck_target"
+        self.result_table = "pg_temp.autocheck_result"
+        self.cache_table = "sandbox.autocheck_cache"
+        self.result_like = None
+        self.freshness = 'hash'
         self.gpconnector = gpconnector
         self.target = target
         self.columns = columns
         self.correct = None
         self.error = None
+        self.errors = None
+        self.summary = None
+        self.statistics = None
+        self.correct_query = None
         self.deal = "prom.ma_deal"
         self.product_offer = "prom.ma_product_offer"
         self.task = "prom.ma_task"
         self.agreement = "prom.ma_agreement"
         self.unified_customer = "prom.ma_unified_customer"
         self.request_segment = "prom.request_segment"
+        self.flag_mart = CheckFlagMart(gpconnector)
 
-        self.check_attributes_join = ""
-        self.check_attributes_column = "case when {check_attributes} = True then 1 end"
-        self.check_dates_column = "case when {check_attributes} = True then 1 end"
-        self.check_segment_join = ""
-        self.check_segment_column = "case when {check_segment} = True then 1 end"
-        self.check_double_join = ""
-        self.check_double_column = "case when {check_double} = True then 1 end"
-        self.check_product_task_join = ""
-        self.check_product_task_column = "case when {check_product_task} = True then 1 end"
-        self.check_product_prpr_join = ""
-        self.check_product_prpr_column = "case when {check_product_prpr} = True then 1 end"
-        self.check_product_deal_join = ""
-        self.check_product_deal_column = "case when {check_product_deal} = True then 1 end"
-        self.check_product_agr_join = ""
-        self.check_product_agr_column = "case when {check_product_agr} = True then 1 end"
-
-        self.check_columns = ['Ошибки', 'Дубли', 'Незаполненные атрибуты', 'Некорректные даты', 'Задача по продукту Т-90', 'ПрПр по продукту Т-90', 'Сделка по продукту', 'Договор по продукту', 'Некорректная длина ИНН', 'Неактивный клиент', 'Некорректный сегмент']
+        self.checks = list(CHECKS)
+        self._set_check_names()
 
+    @property
+    def tables(self) -> dict:
+        '''
+        Названия витрин, подставляемые в sql-выражения проверок (см. Check.predicate)
+        '''
+
+        return {'deal': self.deal
+              , 'product_offer': self.product_offer
+              , 'task': self.task
+              , 'agreement': self.agreement
+              , 'unified_customer': self.unified_customer
+              , 'request_segment': self.request_segment
+              , 'product_flags': self.flag_mart.product_flags
+              , 'client_flags': self.flag_mart.client_flags}
+
+    def _set_check_names(self):
+        self.check_names = dict([('check_error', 'Ошибки')] + [(x.column, x.title) for x in self.checks])
+        self.check_columns = list(self.check_names.values())
+
+    def add_check(self, check: Check, replace: bool = False):
+        '''
+        Метод для добавления проверки (см. Check), проверка добавляется в конец списка проверок экземпляра
+
+        Параметры
+        ----------
+        check: экземпляр класса Check
+        replace: bool, по умолчанию False; указывает, что проверку с таким же названием нужно заменить
+        '''
+
+        names = [x.name for x in self.checks]
+        if check.name in names:
+            if not replace:
+                raise Exception("ERROR: Проверка {name} уже добавлена!".format(name=check.name))
+            self.checks[names.index(check.name)] = check
+        else:
+            self.checks.append(check)
+        self._set_check_names()
+
+    def remove_check(self, name: str):
+        '''
+        Метод для удаления проверки
+
+        Параметры
+        ----------
+        name: str; название проверки
+        '''
+
+        if name not in [x.name for x in self.checks]:
+            raise Exception("ERROR: Проверка {name} не найдена!".format(name=name))
+        self.checks = [x for x in self.checks if x.name != name]
+        self._set_check_names()
+
+    @uses_workload('autocheck')
+    @traced
     def check(self
               , check_double: bool = True
               , check_attributes: bool = False
@@ -85,11 +162,17 @@ class Autocheck(object):
               , check_inn_len: bool = True
               , check_active: bool = True
               , check_segment: bool = True
-              , limit: int = 100) -> pd.DataFrame:
+              , limit: int = 100
+              , mode: str = 'rows'
+              , checks: dict = None
+              , incremental: bool = False
+              , use_flag_mart: bool = True) -> pd.DataFrame:
         '''
         Метод для проверки таргета
         Корректные строки сохраняются в атрибут-датафрейм correct, а строки с ошибками сохраняются в атрибут-датафрейм error
         После проверок на печать выводится сообщение с информацией о том, сколько строк не прошли по той или иной проверке
+        Для таргетов типа датафрейм/list проверки без витрин (дубли, атрибуты, даты, длина ИНН) выполняются на клиенте,
+        а на сервер загружаются только уникальные сочетания ключей (inn, product_id, request_id) для проверок по витринам
         Проверки:
             -Дубли
             -Незаполненные атрибуты
@@ -101,6 +184,7 @@ class Autocheck(object):
             -Некорректная длина ИНН
             -Неактивный клиент
             -Некорректный сегмент
+            -проверки, добавленные методом add_check или функцией register_check
 
         Параметры
         ----------
@@ -113,244 +197,362 @@ class Autocheck(object):
         check_inn_len: bool, по умолчанию True; указывает нужно ли использовать проверку на длину ИНН
         check_active: bool, по умолчанию True; указывает нужно ли использовать проверку на активность клиента
         check_segment: bool, по умолчанию True; указывает нужно ли использовать проверку на соответствие сегмента клиента и сегмента из заявки
-        limit: int, по умолчанию 100; ограничение количества выводимых строк
+        limit: int, по умолчанию 100; ограничение количества выводимых строк,
+            в режиме 'aggregate' - количество выбираемых строк с ошибками, 0 - строки с ошибками не выбираются
+        mode: str, {'rows', 'aggregate'}, по умолчанию 'rows'; режим проверки:
+            'rows' - построчный результат проверки выбирается в датафреймы correct/errors,
+            'aggregate' - результат проверки сохраняется во временную таблицу result_table, количество ошибок по проверкам
+            считается на сервере, в errors выбирается только limit строк с ошибками, correct не заполняется,
+            а корректные строки доступны запросом correct_query; временная таблица живет в рамках сессии,
+            поэтому для дальнейшей загрузки корректных строк метод нужно вызывать внутри GPConnector.session
+        checks: dict, по умолчанию None; включение/выключение проверок по названию параметра проверки (см. Check.option),
+            например {'check_inn_len': False, 'check_custom': True}; для добавленных проверок без параметра
+            используется Check.enabled
+        incremental: bool, по умолчанию False; указывает, что результаты проверок по витринам нужно брать из таблицы cache_table:
+            проверка выполняется только для ключей, которых нет в cache_table, или если витрины проверки изменились
+            (см. freshness), результаты сохраняются в cache_table для следующих запусков; проверки, выполняемые по витрине
+            flag_mart (use_flag_mart), не кэшируются
+        use_flag_mart: bool, по умолчанию True; указывает, что при актуальной витрине flag_mart проверки по витринам CMDM
+            выполняются одним соединением таргета с предрасчитанными признаками (см. Check.mart_predicate, CheckFlagMart)
         '''
         # TODO: 
         # выбор типа проверок в зависимости от целевого репозитория
         # реализовать вариант проверок для загрузки в SAS
 
-        def set_check_product_sql(self):
-            self.check_double_column = """case when {check_double} = True and row_number() over (partition by t.inn, t.product_id order by t.inn, t.product_id) > 1 then 1 end"""
-            self.check_product_task_join = """left join {task} as ts on ts.inn = t.inn and ts.host_prod_id = t.product_id and ts.create_dt >= current_date - 90"""
-            self.check_product_task_column = """case when {check_product_task} = True and ts.inn is not null then 1 end"""
-            self.check_product_prpr_join = """left join {product_offer} as po on po.inn = t.inn and po.host_prod_id = t.product_id and po.creation_dttm >= current_date - 90"""
-            self.check_product_prpr_column = """case when {check_product_prpr} = True and po.inn is not null then 1 end"""
-            self.check_product_deal_join = """left join {deal} as d on d.inn = t.inn and d.host_prod_id = t.product_id and d.deal_status_nm = 'Заключена'"""
-            self.check_product_deal_column = """case when {check_product_deal} = True and d.inn is not null then 1 end"""
-            self.check_product_agr_join = """left join {agreement} as a on a.inn = t.inn and a.host_prod_id = t.product_id and a.active_flg = 1"""
-            self.check_product_agr_column = """case when {check_product_agr} = True and a.inn is not null then 1 end"""
-
-        def set_check_segment_sql(self):
-            self.check_segment_join = """left join {request_segment} as rs on rs.request_id = t.request_id"""
-            self.check_segment_column = """case when {check_segment} = True and (max(case when rs.crm_segment_type_nm = uc.crm_segment_type_nm then 1 end) over (partition by t.inn) != 1) then 1 end"""
-
-        def set_check_attributes_sql(self):
-            self.check_attributes_column = """case when {check_attributes} = True and (t.request_id is null or t.scenario_id is null or t.inn is null or t.product_id is null or t.insight_desc is null or t.insight_sum_val is null or t.insight_income_val is null or t.insight_start_dt is null or t.insight_end_dt is null) then 1 end"""
-            self.check_dates_column = """case when {check_attributes} = True and (t.insight_start_dt < current_date or t.insight_end_dt <= current_date) then 1 end"""
-
-        @dispatch(pd.DataFrame)
-        def check_dispatch(target):
-            target_columns = ', '.join(list(target.columns))
-
-            if 'product_id' in target_columns.lower():
-                set_check_product_sql(self)
-            if 'request_id' in target_columns.lower():
-                set_check_segment_sql(self)
-            if all(elem in target_columns.upper() for elem in ['request_id', 'scenario_id', 'inn', 'product_id', 'insight_desc', 'insight_sum_val', 'insight_income_val', 'insight_start_dt', 'insight_end_dt']):
-                set_check_attributes_sql(self)
-
-        @dispatch(pd.DataFrame, str)
-        def check_dispatch(target, columns):
-            target_columns = ', '.join(list(target.columns))
-
-            if 'product_id' in columns.lower() and 'product_id' in target_columns.lower():
-                set_check_product_sql(self)
-            if 'request_id' in columns.lower() and 'request_id' in target_columns.lower():
-                set_check_segment_sql(self)
-            if all(elem in columns.lower() for elem in ['request_id', 'scenario_id', 'inn', 'product_id', 'insight_desc', 'insight_sum_val', 'insight_income_val', 'insight_start_dt', 'insight_end_dt']) and all(elem in target_columns.lower() for elem in ['inn']):
-                set_check_attributes_sql(self)
-
-        @dispatch(list, str)
-        def check_dispatch(target, columns):
-            if 'product_id' in columns.lower():
-                set_check_product_sql(self)
-            if 'request_id' in columns.lower():
-                set_check_segment_sql(self)
-            if all(elem in columns.lower() for elem in ['request_id', 'scenario_id', 'inn', 'product_id', 'insight_desc', 'insight_sum_val', 'insight_income_val', 'insight_start_dt', 'insight_end_dt']):
-                set_check_attributes_sql(self)
-
-        @dispatch(str)
-        def check_dispatch(target):
-            if 'select' not in target.lower():
-                if self.gpconnector.validate_target('select product_id from {source_name}'.format(source_name=target), check_function=False):
-                    set_check_product_sql(self)
-                if self.gpconnector.validate_target('select request_id from {source_name}'.format(source_name=target), check_function=False):
-                    set_check_segment_sql(self)
-                if self.gpconnector.validate_target('select request_id, scenario_id, inn, product_id, insight_desc, insight_sum_val, insight_income_val, insight_start_dt, insight_end_dt from {source_name}'.format(source_name=target), check_function=False):
-                    set_check_attributes_sql(self)
-            else:
-                if self.gpconnector.validate_target('select product_id from ({sql}) as t'.format(sql=target), check_function=False):
-                    set_check_product_sql(self)
-                if self.gpconnector.validate_target('select request_id from ({sql}) as t'.format(sql=target), check_function=False):
-                    set_check_segment_sql(self)
-                if self.gpconnector.validate_target('select request_id, scenario_id, inn, product_id, insight_desc, insight_sum_val, insight_income_val, insight_start_dt, insight_end_dt from ({sql}) as t'.format(sql=target), check_function=False):
-                    set_check_attributes_sql(self)
-
-        @dispatch(str, str)
-        def check_dispatch(target, columns):
-            if 'select' not in target.lower():
-                if self.gpconnector.validate_target('select product_id from (select {columns} from {source_name}) as t'.format(columns=columns, source_name=target), check_function=False):
-                    set_check_product_sql(self)
-                if self.gpconnector.validate_target('select request_id from (select {columns} from {source_name}) as t'.format(columns=columns, source_name=target), check_function=False):
-                    set_check_segment_sql(self)
-                if self.gpconnector.validate_target('select request_id, scenario_id, inn, product_id, insight_desc, insight_sum_val, insight_income_val, insight_start_dt, insight_end_dt from (select {columns} from {source_name}) as t'.format(columns=columns, source_name=target), check_function=False):
-                    set_check_attributes_sql(self)
+        if mode not in ('rows', 'aggregate'):
+            raise Exception("ERROR: Укажите режим проверки mode: 'rows' или 'aggregate'!")
+        if incremental and self.freshness not in ('hash', 'catalog'):
+            raise Exception("ERROR: Укажите способ определения изменения витрин freshness: 'hash' или 'catalog'!")
+
+        options = {'check_double': check_double
+                 , 'check_attributes': check_attributes
+                 , 'check_product_task': check_product_task
+                 , 'check_product_prpr': check_product_prpr
+                 , 'check_product_deal': check_product_deal
+                 , 'check_product_agr': check_product_agr
+                 , 'check_inn_len': check_inn_len
+                 , 'check_active': check_active
+                 , 'check_segment': check_segment}
+        options.update(checks or {})
+        self._set_check_names()
+
+        # временная таблица с таргетом живет только в рамках сессии, поэтому все шаги проверки выполняются на одном соединении
+        with self.gpconnector.session():
+            flag_mart = use_flag_mart and self.flag_mart is not None and self.flag_mart.is_fresh()
+            if isinstance(self.target, (pd.DataFrame, list)):
+                # проверки, не требующие витрин, выполняются на клиенте, на сервер загружаются только ключи для остальных проверок
+                df_check = self._check_local(options, incremental, flag_mart)
+                if mode == 'aggregate':
+                    self.statistics = df_check.assign(records=1, inn=df_check['inn'].notna() if 'inn' in df_check.columns else 1) \
+                                              .groupby(list(self.check_names), dropna=False)[['records', 'inn']].sum().reset_index()
+                    # корректные строки загружаются на сервер для дальнейшей загрузки запросом correct_query
+                    result_columns = [x for x in df_check.columns if x not in self.check_names]
+                    df_correct = df_check.loc[df_check['check_error'].isna(), result_columns]
+                    if self.result_like is not None:
+                        # типы колонок берутся из таблицы result_like, а не по первым строкам таргета,
+                        # иначе колонка без значений в этих строках создается с типом text и не вставляется в целевую таблицу
+                        like_columns = self.gpconnector.describe(self.result_like) or {}
+                        self.gpconnector.create('TEMPORARY TABLE', self.result_table
+                                                , "select {columns} from {result_like} limit 0"
+                                                .format(columns=', '.join(x if x in like_columns else 'null::text as ' + x
+                                                                          for x in result_columns)
+                                                        , result_like=self.result_like))
+                        if len(df_correct):
+                            self.gpconnector.insert(self.result_table, df_correct, method='copy')
+                        self.correct_query = "select {columns} from {result_table}" \
+                            .format(columns=', '.join(result_columns), result_table=self.result_table)
+                    elif len(df_correct):
+                        self.gpconnector.create('TEMPORARY TABLE', self.result_table, df_correct, method='copy')
+                        self.correct_query = "select {columns} from {result_table}" \
+                            .format(columns=', '.join(result_columns), result_table=self.result_table)
+                    else:
+                        # если все строки не прошли проверку, типы колонок таблицы берутся по первой строке с ошибкой
+                        self.gpconnector.create('TEMPORARY TABLE', self.result_table, df_check[result_columns].head(1),
+                                                method='copy')
+                        self.correct_query = "select {columns} from {result_table} where false" \
+                            .format(columns=', '.join(result_columns), result_table=self.result_table)
+                    df_check = df_check[df_check['check_error'] == 1].head(limit or 0)
             else:
-                if self.gpconnector.validate_target('select product_id from (select {columns} from ({sql}) as t) as t'.format(columns=columns, sql=target), check_function=False):
-                    set_check_product_sql(self)
-                if self.gpconnector.validate_target('select request_id from (select {columns} from ({sql}) as t) as t'.format(columns=columns, sql=target), check_function=False):
-                    set_check_segment_sql(self)
-                if self.gpconnector.validate_target('select request_id, scenario_id, inn, product_id, insight_desc, insight_sum_val, insight_income_val, insight_start_dt, insight_end_dt from (select {columns} from ({sql}) as t) as t'.format(columns=columns, sql=target), check_function=False):
-                    set_check_attributes_sql(self)
-
-        if self.columns:
-            check_dispatch(self.target, self.columns)
+                self.gpconnector.create('TEMPORARY TABLE', self.autocheck_table, self.target, self.columns, method='copy')
+                target_columns = list(self.gpconnector.describe(self.autocheck_table) or {})
+                result_query = self._check_query(target_columns, self.checks, options, incremental=incremental, flag_mart=flag_mart)
+
+                if mode == 'aggregate':
+                    # результат проверки остается на сервере, на клиент выбираются только статистика и выборка строк с ошибками
+                    self.gpconnector.create('TEMPORARY TABLE', self.result_table, result_query, distributed_by='inn')
+                    self.gpconnector.execute("drop table if exists {autocheck_table}".format(autocheck_table=self.autocheck_table))
+
+                    check_flags = ', '.join(self.check_names)
+                    self.statistics = self.gpconnector.select_df("""select {check_flags}
+                                                                         , count(*) as records
+                                                                         , count(inn) as inn
+                                                                      from {result_table}
+                                                                     group by {check_flags}"""
+                                                                 .format(check_flags=check_flags, result_table=self.result_table)
+                                                                 , None, use_cache=False)
+
+                    result_columns = [x for x in (self.gpconnector.describe(self.result_table) or {}) if x not in self.check_names]
+                    self.correct_query = "select {columns} from {result_table} where check_error is null" \
+                        .format(columns=', '.join(result_columns), result_table=self.result_table)
+                    if limit:
+                        df_check = self.gpconnector.select_df("select * from {result_table} where check_error = 1"
+                                                              .format(result_table=self.result_table)
+                                                              , limit, engine='copy', use_cache=False)
+                    else:
+                        df_check = pd.DataFrame(columns=result_columns + list(self.check_names))
+                else:
+                    df_check = self.gpconnector.select_df(result_query, limit, engine='copy', use_cache=False)
+                    self.gpconnector.execute("drop table if exists {autocheck_table}".format(autocheck_table=self.autocheck_table))
+
+        df_check = df_check.rename(columns=self.check_names)
+        df_check = df_check[[x for x in df_check.columns.tolist() if x not in self.check_columns] + self.check_columns]
+        if mode == 'aggregate':
+            self.statistics = self.statistics.rename(columns=self.check_names)
+            check_counts = pd.Series([self.statistics['inn'].sum()]
+                                     + [self.statistics.loc[self.statistics[x] == 1, 'records'].sum() for x in self.check_columns]
+                                     , index=['Таргет'] + self.check_columns)
+            self.errors = df_check
+            self.correct = None
         else:
-            check_dispatch(self.target)
-
-        autocheck_id = self.gpconnector.select_list("select nextval('sandbox.autocheck'::regclass)")[0][0]
-        self.gpconnector.create('TABLE', '{autocheck_template}{autocheck_id}'
-                                .format(autocheck_template=self.autocheck_template, autocheck_id=autocheck_id)
-                                , self.target, self.columns)
+            self.statistics = None
+            self.correct_query = None
+            self.errors = df_check[df_check['Ошибки'] == 1]
+            self.correct = df_check[df_check['Ошибки'] != 1]
+            self.correct = self.correct.drop(self.check_columns, axis = 1)
+            check_counts = pd.Series([df_check['inn'].count() if 'inn' in df_check.columns else len(df_check)]
+                                     + df_check[self.check_columns].count().tolist()
+                                     , index=['Таргет'] + self.check_columns)
+
+        self.summary = check_counts
+        for check in self.checks:
+            if check_counts[check.title] > 0:
+                print("WARNING: {message}: {count}".format(message=check.message, count=check_counts[check.title]))
+        if check_counts['Ошибки'] == 0:
+            print("SUCCESS: Все проверки пройдены успешно")
 
-        result_query = \
+        return self.summary if mode == 'aggregate' else self.correct
+
+    def _check_query(self, target_columns: list, checks: list, options: dict, columns: str = 't.*',
+                     incremental: bool = False, flag_mart: bool = False) -> str:
+        joins = ''
+        if flag_mart:
+            mart_checks, joins = self._flag_mart_checks(target_columns, checks, options)
+            served = [x.name for x, y in zip(checks, mart_checks) if x is not y]
+            if incremental and served:
+                # проверки по витрине признаков не ссылаются на витрины CMDM, поэтому в cache_table не сохраняются
+                print("WARNING: Проверки {names} выполняются по витрине признаков без инкрементального кэша"
+                      .format(names=', '.join(served)))
+            checks = mart_checks
+        if incremental:
+            checks = self._cached_checks(target_columns, checks, options)
+        # каждая проверка - отдельная колонка, справочники подключаются через left join по ключам, поэтому проверки
+        # выполняются соединениями, а не подзапросами для каждой строки, и строки таргета не размножаются
+        check_columns_sql = '\n                         , '.join(
+            x.sql(target_columns, self.tables, options.get(x.option, x.enabled)) for x in checks)
+        joins += ''.join(x.joins(target_columns, self.tables, options.get(x.option, x.enabled)) for x in checks)
+        return \
             """
-            select distinct
-                   t.*
-                 , case when check_double = 1
-                         or check_attributes = 1
-                         or check_dates = 1
-                         or check_product_task = 1
-                         or check_product_prpr = 1
-                         or check_product_deal = 1
-                         or check_product_agr = 1
-                         or check_inn_len = 1
-                         or check_active = 1
-                         or check_segment = 1
-                        then 1
-                   end as check_error
-              from (select t.*
-                         , {check_attributes_column} as check_attributes
-                         , {check_dates_column} as check_dates
-                         , {check_product_task_column} as check_product_task
-                         , {check_product_prpr_column} as check_product_prpr
-                         , {check_product_deal_column} as check_product_deal
-                         , {check_product_agr_column} as check_product_agr
-                         , case when {check_inn_len} = True and length(t.inn) not in (10, 12) then 1 end as check_inn_len
-                         , case when {check_active} = True and (uc.active_flg = 0 or uc.active_flg is null) then 1 end as check_active
-                         , {check_segment_column} as check_segment
-                      from (select t.*
-                                 , {check_double_column} as check_double
-                              from {autocheck_template}{autocheck_id} as t) as t
-                       {check_product_deal_join}
-                       {check_product_task_join}
-                       {check_product_prpr_join}
-                       {check_product_agr_join}
-                       {check_segment_join}
-                       left join {unified_customer} as uc
-                        on uc.inn = t.inn) as t
+            select t.*
+                 , case when coalesce({check_flags}) = 1 then 1 end as check_error
+              from (select {columns}
+                         , {check_columns}
+                      from {autocheck_table} as t{joins}) as t
             """ \
-                .format(check_double_column=self.check_double_column.format(check_double=check_double)
-                      , check_attributes_column=self.check_attributes_column.format(check_attributes=check_attributes)
-                      , check_dates_column=self.check_dates_column.format(check_attributes=check_attributes)
-                      , check_product_task_join=self.check_product_task_join.format(task=self.task)
-                      , check_product_task_column=self.check_product_task_column.format(check_product_task=check_product_task)
-                      , check_product_prpr_join=self.check_product_prpr_join.format(product_offer=self.product_offer)
-                      , check_product_prpr_column=self.check_product_prpr_column.format(check_product_prpr=check_product_prpr)
-                      , check_product_deal_join=self.check_product_deal_join.format(deal=self.deal)
-                      , check_product_deal_column=self.check_product_deal_column.format(check_product_deal=check_product_deal)
-                      , check_product_agr_join=self.check_product_agr_join.format(agreement=self.agreement)
-                      , check_product_agr_column=self.check_product_agr_column.format(check_product_agr=check_product_agr)
-                      , check_segment_join=self.check_segment_join.format(request_segment=self.request_segment)
-                      , check_segment_column=self.check_segment_column.format(check_segment=check_segment)
-                      , check_inn_len=check_inn_len
-                      , check_active=check_active
-                      , autocheck_template=self.autocheck_template
-                      , autocheck_id=autocheck_id
-                      , unified_customer=self.unified_customer)
-
-        df_check = self.gpconnector.select_df(result_query, limit)
-        df_check = df_check.rename(columns={'check_error' : 'Ошибки'
-                                          , 'check_double' : 'Дубли'
-                                          , 'check_attributes' : 'Незаполненные атрибуты'
-                                          , 'check_dates' : 'Некорректные даты'
-                                          , 'check_product_task' : 'Задача по продукту Т-90'
-                                          , 'check_product_prpr' : 'ПрПр по продукту Т-90'
-                                          , 'check_product_deal' : 'Сделка по продукту'
-                                          , 'check_product_agr' : 'Договор по продукту'
-                                          , 'check_inn_len' : 'Некорректная длина ИНН'
-                                          , 'check_active' : 'Неактивный клиент'
-                                          , 'check_segment' : 'Некорректный сегмент'})
-        df_check_columns = df_check.columns.tolist()
-        df_check = df_check[[x for x in df_check_columns if x not in self.check_columns] + self.check_columns]
-
-        self.gpconnector.drop("{autocheck_template}{autocheck_id}"
-                              .format(autocheck_template=self.autocheck_template, autocheck_id=autocheck_id))
-
-        self.errors = df_check[df_check['Ошибки'] == 1]
-        self.correct = df_check[df_check['Ошибки'] != 1]
-        self.correct = self.correct.drop(self.check_columns, axis = 1)
-
-        check_double_count, check_attributes_count, check_dates_count, check_product_task_count, check_product_prpr_count, check_product_deal_count, check_product_agr_count, check_inn_len_count, check_active_count, check_segment_count = \
-            df_check[self.check_columns[1:]].count()
-
-        if check_double_count > 0:
-            print("WARNING: Количество записей с дублями: {count}".format(count=check_double_count))
-        if check_attributes_count > 0:
-            print("WARNING: Количество записей с незаполненными атрибутами: {count}".format(count=check_attributes_count))
-        if check_dates_count > 0:
-            print("WARNING: Количество записей с некорректно заполненными датами начала/окончания: {count}".format(count=check_dates_count))    
-        if check_product_task_count > 0:
-            print("WARNING: Количество записей с продуктами, по которым у клиента была задача за последние 90 дней: {count}".format(count=check_product_task_count))
-        if check_product_prpr_count > 0:
-            print("WARNING: Количество записей с продуктами, по которым у клиента было ПрПр за последние 90 дней: {count}".format(count=check_product_prpr_count))
-        if check_product_deal_count > 0:
-            print("WARNING: Количество записей с продуктами, по которым у клиента была сделка: {count}".format(count=check_product_deal_count))
-        if check_product_agr_count > 0:
-            print("WARNING: Количество записей с продуктами, по которым у клиента есть договор: {count}".format(count=check_product_agr_count))
-        if check_inn_len_count > 0:
-            print("WARNING: Количество записей с ИНН некорректной длины: {count}".format(count=check_inn_len_count))
-        if check_active_count > 0:
-            print("WARNING: Количество записей с неактивными клиентами: {count}".format(count=check_active_count))
-        if check_segment_count > 0:
-            print("WARNING: Количество записей с некорректным сегментом: {count}".format(count=check_segment_count))
-        if len(self.errors) == 0:
-            print("SUCCESS: Все проверки пройдены успешно")
-
-        return self.correct
+                .format(check_flags=', '.join(x.column for x in checks) or 'null'
+                      , columns=columns
+                      , joins=joins
+                      , check_columns=check_columns_sql
+                      , autocheck_table=self.autocheck_table)
+
+    def _mart_tokens(self, marts: list) -> dict:
+        tables = dict((x, self.tables[x].lower()) for x in marts)
+        df = self.gpconnector.select_df(
+            """select n.nspname || '.' || c.relname as table_name
+                    , c.relfilenode
+                    , c.reltuples::bigint as estimated_rows
+                    , (select max(o.statime)
+                         from pg_stat_last_operation o
+                        where o.classid = 'pg_class'::regclass and o.objid = c.oid) as last_operation
+                 from pg_class c
+                 join pg_namespace n on n.oid = c.relnamespace
+                where n.nspname || '.' || c.relname in ('{tables}')""".format(tables="', '".join(tables.values()))
+            , None, engine='read_sql', use_cache=False)
+        catalog = dict((x[0], [str(y) for y in x[1:]]) for x in df.itertuples(index=False))
+
+        return dict((mart, catalog.get(table_name, [])) for mart, table_name in tables.items())
+
+    def _freshness_tokens(self, checks: list) -> dict:
+        if self.freshness == 'catalog':
+            mart_tokens = self._mart_tokens(sorted(set(x for check in checks for x in check.tables)))
+            return dict((check.name, [mart_tokens[x] for x in check.tables]) for check in checks)
+
+        # данные, которые читает проверка: справочники и витрины, на которые predicate ссылается напрямую
+        sources = []
+        for check in checks:
+            sources += [(check.name, sql.format(**self.tables)) for sql, _ in check.lookups.values()]
+            sources += [(check.name, "select * from {table_name}".format(table_name=self.tables[x]))
+                        for x in _fields(check.predicate) if x not in check.lookups]
+        # сумма хэшей не зависит от порядка строк, все источники считаются одним запросом
+        row = self.gpconnector.select_list(
+            "select {hashes}".format(hashes='\n                     , '.join(
+                "(select count(*) || ':' || coalesce(sum(hashtext(s::text)::bigint), 0) from ({sql}) as s)".format(sql=sql)
+                for _, sql in sources)), None)[0]
+
+        tokens = dict((check.name, []) for check in checks)
+        for (name, _), value in zip(sources, row):
+            tokens[name].append(value)
+        return tokens
+
+    def _flag_mart_checks(self, target_columns: list, checks: list, options: dict):
+        # признаки в витрине уникальны по ключу соединения, поэтому соединение не размножает строки таргета
+        result = []
+        aliases = set()
+        for check in checks:
+            if check.mart_predicate and options.get(check.option, check.enabled) and all(x in target_columns for x in check.columns):
+                aliases.update(x for x in ('pf', 'cf') if x + '.' in check.mart_predicate)
+                check = Check(check.name, check.title, check.mart_predicate, check.columns, check.message, check.option,
+                              check.enabled, check.local, lookups=check.mart_lookups)
+            result.append(check)
+
+        joins = ''
+        if 'pf' in aliases:
+            joins += "\n                      left join {product_flags} as pf on pf.inn = t.inn and pf.product_id = t.product_id" \
+                .format(product_flags=self.flag_mart.product_flags)
+        if 'cf' in aliases:
+            joins += "\n                      left join {client_flags} as cf on cf.inn = t.inn".format(client_flags=self.flag_mart.client_flags)
+        return result, joins
+
+    def _cached_checks(self, target_columns: list, checks: list, options: dict) -> list:
+        cached = [x for x in checks
+                  if x.tables and options.get(x.option, x.enabled) and all(y in target_columns for y in x.columns)]
+        if not cached:
+            return checks
+
+        self.gpconnector.execute("""create table if not exists {cache_table}
+                                    (check_name text, key text, token text, flag int, checked_dttm timestamp default now())
+                                    distributed by (key)""".format(cache_table=self.cache_table))
+        freshness_tokens = self._freshness_tokens(cached)
+
+        result = []
+        for check in checks:
+            if check not in cached:
+                result.append(check)
+                continue
+            # результат проверки актуален, пока не изменились ее sql-код и витрины, а для проверок от текущей даты - и дата
+            token = hashlib.sha1(json.dumps([check.predicate, check.lookups, self.freshness, freshness_tokens[check.name],
+                                             str(date.today()) if 'current_date' in json.dumps([check.predicate, check.lookups]) else None]
+                                            , default=str).encode('utf-8')).hexdigest()
+            # текстовое представление записи различает null и пустую строку и экранирует разделители
+            key = "row({columns})::text".format(columns=', '.join('t.' + x for x in check.columns))
+            self.gpconnector.execute("delete from {cache_table} where check_name = '{check_name}' and token <> '{token}'"
+                                     .format(cache_table=self.cache_table, check_name=check.name, token=token))
+            self.gpconnector.execute(
+                """insert into {cache_table} (check_name, key, token, flag)
+                   select '{check_name}', {key}, '{token}', {check_sql}
+                     from (select distinct {columns} from {autocheck_table} as t) as t{joins}
+                    where not exists (select 1
+                                        from {cache_table} as c
+                                       where c.check_name = '{check_name}' and c.token = '{token}' and c.key = {key})"""
+                .format(cache_table=self.cache_table
+                        , check_name=check.name
+                        , key=key
+                        , token=token
+                        , check_sql=check.sql(check.columns, self.tables)
+                        , joins=check.joins(check.columns, self.tables)
+                        , columns=', '.join('t.' + x for x in check.columns)
+                        , autocheck_table=self.autocheck_table))
+            # в основном запросе проверка заменяется соединением с сохраненными результатами по ключу
+            result.append(Check(check.name, check.title, "{c}.key is not null", check.columns, check.message, check.option,
+                                check.enabled, check.local
+                                , lookups={'c': ("select distinct key from {cache_table} where check_name = '{check_name}' "
+                                                 "and token = '{token}' and flag = 1".format(cache_table=self.cache_table,
+                                                                                             check_name=check.name, token=token)
+                                                 , {'key': key})}))
+        return result
+
+    def _check_local(self, options: dict, incremental: bool = False, flag_mart: bool = False) -> pd.DataFrame:
+        if isinstance(self.target, list):
+            df = pd.DataFrame(self.target, columns=[x.strip() for x in self.columns.split(',')])
+        elif self.columns:
+            df = self.target[[x.strip() for x in self.columns.split(',')]].reset_index(drop=True)
+        else:
+            df = self.target.reset_index(drop=True)
+
+        flags = {}
+        server_checks = []
+        for check in self.checks:
+            enabled = options.get(check.option, check.enabled)
+            if check.local is None and enabled and all(x in df.columns for x in check.columns):
+                server_checks.append(check)
+            else:
+                flags[check.column] = check.evaluate(df, enabled)
+
+        if server_checks:
+            # проверки по витринам выполняются по уникальным сочетаниям ключей таргета, результат сопоставляется строкам по номеру ключа
+            keys = sorted(set(x for check in server_checks for x in check.columns))
+            key_ids = df.groupby(keys, sort=False, dropna=False).ngroup().values
+            df_keys = df[keys].drop_duplicates().reset_index(drop=True)
+            df_keys['autocheck_key'] = np.arange(len(df_keys))
+            self.gpconnector.create('TEMPORARY TABLE', self.autocheck_table, df_keys, method='copy')
+            df_flags = self.gpconnector.select_df(self._check_query(keys + ['autocheck_key'], server_checks, options, 't.autocheck_key',
+                                                                    incremental, flag_mart)
+                                                  , None, engine='copy', use_cache=False)
+            self.gpconnector.execute("drop table if exists {autocheck_table}".format(autocheck_table=self.autocheck_table))
+            df_flags = df_flags.set_index('autocheck_key').reindex(np.arange(len(df_keys)))
+            for check in server_checks:
+                flags[check.column] = df_flags[check.column].values[key_ids]
+
+        df_flags = pd.DataFrame({x.column: flags[x.column] for x in self.checks}, index=df.index, dtype=float)
+        df_flags['check_error'] = np.where((df_flags == 1).any(axis='columns'), 1, np.nan)
+        return pd.concat([df, df_flags], axis=1)
 
     def show_statistics(self):
         '''
         Метод для вывода статистики проверки таргета
         '''
 
-        df = pd.concat([self.correct, self.errors], sort=False)
-        df = df.replace({0: np.nan})
-        df = df[['inn'] + self.check_columns]
-        df_funnel = df.rename(columns={'inn': 'Таргет'}).count().reset_index(
-            name='count').rename(columns={'index': 'Уровни воронки'})
-        df_funnel['sort_column'] = df_funnel['Уровни воронки'].map({'Таргет' : 2, 'Ошибки' : 1})
-        df_funnel = df_funnel.sort_values(['sort_column', 'count'], ascending=False).drop('sort_column',
-                                                                                          axis=1).reset_index(drop=True)
-        df_funnel['Кол-во клиентов'] = 'Всего'
-        check_columns = [x for x in list(list(df_funnel['Уровни воронки'].get_values())) if x in self.check_columns[1:]]
-        df_funnel = df_funnel.append(
-            pd.DataFrame(
-                [['Таргет', df_funnel[df_funnel['Уровни воронки'] == 'Таргет']['count'].get_values()[0], 'Уникальных'],
-                 ['Ошибки',
-                  df_funnel[df_funnel['Уровни воронки'] == 'Ошибки']['count'].get_values()[0],
-                  'Уникальных']]
-                , columns=['Уровни воронки', 'count', 'Кол-во клиентов']), ignore_index=True, sort=False)
-        for i in range(len(check_columns)):
-            records_count = 0
-            if i == 0:
-                records_count += len(df[df[check_columns[i]] == 1]['inn'])
-            else:
-                records_count += len(df[df[check_columns[:i]].isna().all(axis='columns') & df[check_columns[i]] == 1]['inn'])
-            df_funnel = df_funnel.append(pd.DataFrame([[check_columns[i], records_count, 'Уникальных']],
-                                                      columns=['Уровни воронки', 'count', 'Кол-во клиентов']),
-                                         ignore_index=True,
-                                         sort=False)
+        if self.statistics is not None:
+            # в режиме 'aggregate' воронка строится по количеству записей для каждого сочетания непройденных проверок
+            df_funnel = self.summary.reset_index(name='count').rename(columns={'index': 'Уровни воронки'})
+            df_funnel['sort_column'] = df_funnel['Уровни воронки'].map({'Таргет' : 2, 'Ошибки' : 1})
+            df_funnel = df_funnel.sort_values(['sort_column', 'count'], ascending=False).drop('sort_column',
+                                                                                              axis=1).reset_index(drop=True)
+            df_funnel['Кол-во клиентов'] = 'Всего'
+            check_columns = [x for x in df_funnel['Уровни воронки'].tolist() if x in self.check_columns[1:]]
+            funnel_rows = [['Таргет', self.summary['Таргет'], 'Уникальных'], ['Ошибки', self.summary['Ошибки'], 'Уникальных']]
+            for i in range(len(check_columns)):
+                records = self.statistics[check_columns[:i]].isna().all(axis='columns') & (self.statistics[check_columns[i]] == 1)
+                funnel_rows.append([check_columns[i], self.statistics.loc[records, 'records'].sum(), 'Уникальных'])
+            df_funnel = pd.concat([df_funnel, pd.DataFrame(funnel_rows, columns=['Уровни воронки', 'count', 'Кол-во клиентов'])],
+                                  ignore_index=True, sort=False)
+        else:
+            df = pd.concat([self.correct, self.errors], sort=False)
+            df = df.replace({0: np.nan})
+            df = df[['inn'] + self.check_columns]
+            df_funnel = df.rename(columns={'inn': 'Таргет'}).count().reset_index(
+                name='count').rename(columns={'index': 'Уровни воронки'})
+            df_funnel['sort_column'] = df_funnel['Уровни воронки'].map({'Таргет' : 2, 'Ошибки' : 1})
+            df_funnel = df_funnel.sort_values(['sort_column', 'count'], ascending=False).drop('sort_column',
+                                                                                              axis=1).reset_index(drop=True)
+            df_funnel['Кол-во клиентов'] = 'Всего'
+            check_columns = [x for x in list(list(df_funnel['Уровни воронки'].get_values())) if x in self.check_columns[1:]]
+            df_funnel = df_funnel.append(
+                pd.DataFrame(
+                    [['Таргет', df_funnel[df_funnel['Уровни воронки'] == 'Таргет']['count'].get_values()[0], 'Уникальных'],
+                     ['Ошибки',
+                      df_funnel[df_funnel['Уровни воронки'] == 'Ошибки']['count'].get_values()[0],
+                      'Уникальных']]
+                    , columns=['Уровни воронки', 'count', 'Кол-во клиентов']), ignore_index=True, sort=False)
+            for i in range(len(check_columns)):
+                records_count = 0
+                if i == 0:
+                    records_count += len(df[df[check_columns[i]] == 1]['inn'])
+                else:
+                    records_count += len(df[df[check_columns[:i]].isna().all(axis='columns') & df[check_columns[i]] == 1]['inn'])
+                df_funnel = df_funnel.append(pd.DataFrame([[check_columns[i], records_count, 'Уникальных']],
+                                                          columns=['Уровни воронки', 'count', 'Кол-во клиентов']),
+                                             ignore_index=True,
+                                             sort=False)
 
         fig0 = px.funnel(df_funnel,
                          x='count',
@@ -0,0 +1,204 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import pandas as pd
+
+class QueryCache(object):
+    '''
+    Класс дискового кэша результатов запросов
+    Результаты хранятся в файлах Parquet/Feather/pickle, ключ кэша - нормализованный sql-код и опции подключения;
+    при превышении max_size удаляются давно не использованные записи
+
+    Параметры
+    ----------
+    path: str, по умолчанию '~/.cache/gp'; директория кэша
+    ttl: int, по умолчанию 86400; время жизни записи в секундах
+    max_size: int, по умолчанию 1 ГБ; максимальный размер кэша в байтах
+    fmt: str, {'parquet', 'feather', 'pickle'}, по умолчанию 'parquet'; формат файлов кэша
+
+    Атрибуты
+    ----------
+    path: str; директория кэша
+    ttl: int; время жизни записи в секундах
+    max_size: int; максимальный размер кэша в байтах
+    fmt: str; формат файлов кэша
+
+    Методы
+    ----------
+    get: метод для получения результата запроса из кэша
+    put: метод для сохранения результата запроса в кэш
+    invalidate: метод для удаления из кэша результатов запросов, ссылающихся на таблицу
+    clear: метод для очистки кэша
+    '''
+
+    def __init__(self, path: str = '~/.cache/gp', ttl: int = 86400, max_size: int = 1024 ** 3, fmt: str = 'parquet'):
+        if fmt not in ('parquet', 'feather', 'pickle'):
+            raise Exception("ERROR: Укажите формат кэша fmt: 'parquet', 'feather' или 'pickle'!")
+
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.fmt = fmt
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        '''
+        Метод для нормализации sql-кода: удаляются комментарии и лишние пробельные символы
+
+        Параметры
+        ----------
+        query: str; sql-код запроса
+        '''
+
+        query = re.sub(r'--[^\n]*', ' ', query)
+        query = re.sub(r'/\*.*?\*/', ' ', query, flags=re.DOTALL)
+        return ' '.join(query.split()).rstrip(';').strip()
+
+    @staticmethod
+    def tables(query: str) -> list:
+        '''
+        Метод для получения списка таблиц формата схема.название, на которые ссылается sql-запрос
+
+        Параметры
+        ----------
+        query: str; sql-код запроса
+        '''
+
+        tables = re.findall(r'(?:from|join)\s+([a-z_][\w$]*\.[a-z_][\w$]*)', query, flags=re.IGNORECASE)
+        if 'select' not in query.lower():
+            tables.append(query.strip())
+        return sorted(set(x.lower() for x in tables))
+
+    def _key(self, query: str, options: str = None, engine: str = None) -> str:
+        return hashlib.sha1(json.dumps([self.normalize(query), options, engine]).encode('utf-8')).hexdigest()
+
+    def _files(self, key: str):
+        return os.path.join(self.path, key + '.' + self.fmt), os.path.join(self.path, key + '.json')
+
+    def _remove(self, key: str):
+        for file in self._files(key):
+            if os.path.exists(file):
+                os.remove(file)
+
+    def _entries(self) -> list:
+        entries = []
+        for file in os.listdir(self.path):
+            if file.endswith('.json'):
+                key = file[:-5]
+                data_file, meta_file = self._files(key)
+                try:
+                    with open(meta_file) as f:
+                        meta = json.load(f)
+                    stat = os.stat(data_file)
+                except (OSError, ValueError):
+                    self._remove(key)
+                    continue
+                entries.append((key, meta, stat.st_size, stat.st_atime))
+        return entries
+
+    def get(self, query: str, options: str = None, engine: str = None) -> pd.DataFrame:
+        '''
+        Метод для получения результата запроса из кэша, возвращает None, если записи нет или она устарела
+
+        Параметры
+        ----------
+        query: str; sql-код запроса
+        options: str, по умолчанию None; опции подключения к ДБ
+        engine: str, по умолчанию None; способ выборки данных, которым получен результат
+        '''
+
+        key = self._key(query, options, engine)
+        data_file, meta_file = self._files(key)
+        with self._lock:
+            try:
+                with open(meta_file) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                return None
+            if time.time() - meta['created'] > self.ttl:
+                self._remove(key)
+                return None
+            try:
+                if self.fmt == 'parquet':
+                    df = pd.read_parquet(data_file)
+                elif self.fmt == 'feather':
+                    df = pd.read_feather(data_file)
+                else:
+                    df = pd.read_pickle(data_file)
+            except Exception:
+                self._remove(key)
+                return None
+            # время доступа используется для вытеснения давно не использованных записей
+            os.utime(data_file, None)
+            return df
+
+    def put(self, query: str, df: pd.DataFrame, options: str = None, engine: str = None):
+        '''
+        Метод для сохранения результата запроса в кэш
+
+        Параметры
+        ----------
+        query: str; sql-код запроса
+        df: датафрейм; результат запроса
+        options: str, по умолчанию None; опции подключения к ДБ
+        engine: str, по умолчанию None; способ выборки данных, которым получен результат
+        '''
+
+        key = self._key(query, options, engine)
+        data_file, meta_file = self._files(key)
+        with self._lock:
+            try:
+                if self.fmt == 'parquet':
+                    df.to_parquet(data_file)
+                elif self.fmt == 'feather':
+                    df.reset_index(drop=True).to_feather(data_file)
+                else:
+                    df.to_pickle(data_file)
+            except Exception as error:
+                # типы колонок, которые не сериализуются в выбранный формат, не должны ломать выборку
+                print('WARNING: Результат запроса не сохранен в кэш: {error}'.format(error=error))
+                self._remove(key)
+                return
+            with open(meta_file, 'w') as f:
+                json.dump({'query': self.normalize(query), 'options': options, 'tables': self.tables(query),
+                           'created': time.time()}, f)
+
+            entries = sorted(self._entries(), key=lambda x: x[3])
+            size = sum(x[2] for x in entries)
+            for entry_key, _, entry_size, _ in entries:
+                if size <= self.max_size:
+                    break
+                self._remove(entry_key)
+                size -= entry_size
+
+    def invalidate(self, table_name: str) -> int:
+        '''
+        Метод для удаления из кэша результатов запросов, ссылающихся на таблицу
+        Возвращает количество удаленных записей
+
+        Параметры
+        ----------
+        table_name: str; название таблицы в формате схема.название
+        '''
+
+        count = 0
+        with self._lock:
+            for key, meta, _, _ in self._entries():
+                if table_name.lower() in meta['tables']:
+                    self._remove(key)
+                    count += 1
+        return count
+
+    def clear(self):
+        '''
+        Метод для очистки кэша
+        '''
+
+        with self._lock:
+            for key, _, _, _ in self._entries():
+                self._remove(key)
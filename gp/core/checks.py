@@ -0,0 +1,260 @@
+import string
+import numpy as np
+import pandas as pd
+
+class Check(object):
+    '''
+    Класс проверки для автопроверок (см. Autocheck)
+    Проверка задается логическим sql-выражением над строкой таргета с псевдонимом t: строка не проходит проверку,
+    если выражение истинно; витрины подключаются справочниками lookups через left join по уникальным ключам,
+    поэтому проверка не размножает строки таргета, а планировщик выполняет ее соединением, а не подзапросом для каждой строки
+
+    Параметры
+    ----------
+    name: str; название проверки, колонка с результатом проверки называется check_{name}
+    title: str; название колонки с результатом проверки в датафреймах Autocheck
+    predicate: str; sql-выражение, истинное для строк с ошибкой, например "{d}.inn is not null"; в фигурных скобках
+        указываются псевдонимы справочников из lookups и названия витрин из Autocheck.tables
+    columns: list, по умолчанию None; колонки таргета, необходимые для проверки; если какой-то колонки нет,
+        проверку не проходят все строки таргета
+    message: str, по умолчанию None; текст предупреждения с количеством не прошедших проверку записей
+    option: str, по умолчанию None; название параметра метода Autocheck.check, которым включается проверка
+    enabled: bool, по умолчанию True; указывает, что проверка включена, если она не включена/выключена явно
+    local: функция, по умолчанию None; векторная реализация проверки для таргетов типа датафрейм/list: принимает датафрейм
+        таргета и возвращает булеву серию, истинную для строк с ошибкой; проверки с local выполняются на клиенте без загрузки
+        таргета на сервер, остальные - на сервере по уникальным сочетаниям колонок columns
+    mart_predicate: str, по умолчанию None; sql-выражение, заменяющее predicate, если витрина предрасчитанных признаков
+        актуальна (см. CheckFlagMart): pf - признаки по связке ИНН-продукт, cf - признаки по ИНН
+    lookups: dict, по умолчанию None; справочники проверки {псевдоним: (sql-запрос, ключи)}: sql-запрос к витринам возвращает
+        не более одной строки на ключ, ключи - list колонок справочника, совпадающих по названию с колонками таргета,
+        или dict {колонка справочника: sql-выражение над t}, например
+        {'d': ("select distinct inn, host_prod_id as product_id from {deal}", ['inn', 'product_id'])}
+    mart_lookups: dict, по умолчанию None; справочники, заменяющие lookups вместе с mart_predicate
+
+    Атрибуты
+    ----------
+    name: str; название проверки
+    title: str; название колонки с результатом проверки
+    predicate: str; sql-выражение, истинное для строк с ошибкой
+    columns: list; колонки таргета, необходимые для проверки
+    message: str; текст предупреждения
+    option: str; название параметра метода Autocheck.check
+    enabled: bool; указывает, что проверка включена по умолчанию
+    local: функция; векторная реализация проверки
+    mart_predicate: str; sql-выражение над витриной предрасчитанных признаков
+    lookups: dict; справочники проверки
+    mart_lookups: dict; справочники для mart_predicate
+    tables: list; витрины, на которые ссылаются predicate и lookups
+
+    Методы
+    ----------
+    sql: метод для получения sql-кода колонки с результатом проверки
+    joins: метод для получения sql-кода подключения справочников проверки
+    evaluate: метод для выполнения проверки на клиенте
+    '''
+
+    def __init__(self, name: str, title: str, predicate: str, columns: list = None, message: str = None,
+                 option: str = None, enabled: bool = True, local=None, mart_predicate: str = None, lookups: dict = None,
+                 mart_lookups: dict = None):
+        self.name = name
+        self.title = title
+        self.predicate = predicate
+        self.columns = columns or []
+        self.message = message or "Количество записей, не прошедших проверку '{title}'".format(title=title)
+        self.option = option or 'check_' + name
+        self.enabled = enabled
+        self.local = local
+        self.mart_predicate = mart_predicate
+        self.lookups = lookups or {}
+        self.mart_lookups = mart_lookups or {}
+
+    def __repr__(self):
+        return "Check('{name}')".format(name=self.name)
+
+    @property
+    def column(self) -> str:
+        return 'check_' + self.name
+
+    @property
+    def tables(self) -> list:
+        '''
+        Витрины, на которые ссылаются predicate и lookups (названия из Autocheck.tables)
+        '''
+
+        fields = set(x for text in [self.predicate] + [sql for sql, _ in self.lookups.values()]
+                     for x in _fields(text))
+        return sorted(fields - set(self.lookups))
+
+    @property
+    def aliases(self) -> dict:
+        '''
+        Псевдонимы справочников в sql-коде проверки: к псевдониму из lookups добавляется название проверки
+        '''
+
+        return dict((x, 'l_{name}_{alias}'.format(name=self.name, alias=x)) for x in self.lookups)
+
+    def _ready(self, target_columns, enabled: bool) -> bool:
+        return enabled and all(x in target_columns for x in self.columns)
+
+    def sql(self, target_columns, tables: dict, enabled: bool = True) -> str:
+        '''
+        Метод для получения sql-кода колонки с результатом проверки: 1 - строка не прошла проверку, null - прошла
+
+        Параметры
+        ----------
+        target_columns: list; колонки таргета
+        tables: dict; названия витрин, подставляемые в predicate
+        enabled: bool, по умолчанию True; указывает, что проверка включена
+        '''
+
+        if not enabled:
+            return "cast(null as int) as {column}".format(column=self.column)
+        if not self._ready(target_columns, enabled):
+            return "1 as {column}".format(column=self.column)
+        return "case when {predicate} then 1 end as {column}".format(predicate=self.predicate.format(**dict(tables, **self.aliases)),
+                                                                      column=self.column)
+
+    def joins(self, target_columns, tables: dict, enabled: bool = True) -> str:
+        '''
+        Метод для получения sql-кода подключения справочников проверки к таргету t через left join по ключам
+
+        Параметры
+        ----------
+        target_columns: list; колонки таргета
+        tables: dict; названия витрин, подставляемые в sql-запросы справочников
+        enabled: bool, по умолчанию True; указывает, что проверка включена
+        '''
+
+        if not self._ready(target_columns, enabled):
+            return ''
+        joins = ''
+        for alias, (sql, keys) in self.lookups.items():
+            keys = keys if isinstance(keys, dict) else dict((x, 't.' + x) for x in keys)
+            joins += "\n                      left join ({sql}) as {alias} on {condition}" \
+                .format(sql=sql.format(**tables)
+                        , alias=self.aliases[alias]
+                        , condition=' and '.join('{alias}.{key} = {value}'.format(alias=self.aliases[alias], key=key, value=value)
+                                                 for key, value in keys.items()))
+        return joins
+
+    def evaluate(self, df: pd.DataFrame, enabled: bool = True) -> np.ndarray:
+        '''
+        Метод для выполнения проверки на клиенте: 1 - строка не прошла проверку, nan - прошла
+
+        Параметры
+        ----------
+        df: датафрейм; таргет
+        enabled: bool, по умолчанию True; указывает, что проверка включена
+        '''
+
+        if not enabled:
+            return np.full(len(df), np.nan)
+        if not all(x in df.columns for x in self.columns):
+            return np.ones(len(df))
+        if self.local is None:
+            raise Exception("ERROR: Для проверки {name} не задана реализация на клиенте!".format(name=self.name))
+        return np.where(np.asarray(self.local(df), dtype=bool), 1, np.nan)
+
+
+def _fields(text: str) -> list:
+    return [x[1] for x in string.Formatter().parse(text) if x[1]]
+
+
+def _double(df: pd.DataFrame) -> pd.Series:
+    return df.duplicated(['inn', 'product_id'])
+
+
+def _attributes(df: pd.DataFrame) -> pd.Series:
+    return df[_ATTRIBUTES].isna().any(axis='columns')
+
+
+def _dates(df: pd.DataFrame) -> pd.Series:
+    today = pd.Timestamp.today().normalize()
+    return (pd.to_datetime(df['insight_start_dt'], errors='coerce') < today) \
+        | (pd.to_datetime(df['insight_end_dt'], errors='coerce') <= today)
+
+
+def _inn_len(df: pd.DataFrame) -> pd.Series:
+    # как и length(inn) в sql, пустой ИНН не считается ошибкой длины; ИНН из числовой колонки с пропусками приходит как float
+    inn = df['inn'].astype(str).str.replace(r'\.0$', '', regex=True)
+    return df['inn'].notna() & ~inn.str.len().isin([10, 12])
+
+
+_ATTRIBUTES = ['request_id', 'scenario_id', 'inn', 'product_id', 'insight_desc', 'insight_sum_val', 'insight_income_val',
+               'insight_start_dt', 'insight_end_dt']
+
+_REQUEST_SEGMENTS = "select request_id, array_agg(distinct crm_segment_type_nm) as segments from {request_segment} group by request_id"
+
+# проверки по умолчанию в порядке колонок результата
+CHECKS = [
+    Check('double', 'Дубли'
+          , "row_number() over (partition by t.inn, t.product_id order by t.inn, t.product_id) > 1"
+          , ['inn', 'product_id'], "Количество записей с дублями", local=_double),
+    Check('attributes', 'Незаполненные атрибуты'
+          , "(t.request_id is null or t.scenario_id is null or t.inn is null or t.product_id is null or t.insight_desc is null "
+            "or t.insight_sum_val is null or t.insight_income_val is null or t.insight_start_dt is null or t.insight_end_dt is null)"
+          , _ATTRIBUTES, "Количество записей с незаполненными атрибутами", enabled=False, local=_attributes),
+    Check('dates', 'Некорректные даты'
+          , "(t.insight_start_dt < current_date or t.insight_end_dt <= current_date)"
+          , _ATTRIBUTES, "Количество записей с некорректно заполненными датами начала/окончания", option='check_attributes',
+          enabled=False, local=_dates),
+    Check('product_task', 'Задача по продукту Т-90'
+          , "{ts}.inn is not null"
+          , ['inn', 'product_id'], "Количество записей с продуктами, по которым у клиента была задача за последние 90 дней",
+          mart_predicate="pf.has_task_90d = 1",
+          lookups={'ts': ("select distinct inn, host_prod_id as product_id from {task} where create_dt >= current_date - 90",
+                          ['inn', 'product_id'])}),
+    Check('product_prpr', 'ПрПр по продукту Т-90'
+          , "{po}.inn is not null"
+          , ['inn', 'product_id'], "Количество записей с продуктами, по которым у клиента было ПрПр за последние 90 дней",
+          mart_predicate="pf.has_prpr_90d = 1",
+          lookups={'po': ("select distinct inn, host_prod_id as product_id from {product_offer} where creation_dttm >= current_date - 90",
+                          ['inn', 'product_id'])}),
+    Check('product_deal', 'Сделка по продукту'
+          , "{d}.inn is not null"
+          , ['inn', 'product_id'], "Количество записей с продуктами, по которым у клиента была сделка",
+          mart_predicate="pf.has_closed_deal = 1",
+          lookups={'d': ("select distinct inn, host_prod_id as product_id from {deal} where deal_status_nm = 'Заключена'",
+                         ['inn', 'product_id'])}),
+    Check('product_agr', 'Договор по продукту'
+          , "{a}.inn is not null"
+          , ['inn', 'product_id'], "Количество записей с продуктами, по которым у клиента есть договор",
+          mart_predicate="pf.has_active_agreement = 1",
+          lookups={'a': ("select distinct inn, host_prod_id as product_id from {agreement} where active_flg = 1", ['inn', 'product_id'])}),
+    Check('inn_len', 'Некорректная длина ИНН'
+          , "length(t.inn) not in (10, 12)"
+          , ['inn'], "Количество записей с ИНН некорректной длины", local=_inn_len),
+    Check('active', 'Неактивный клиент'
+          , "{uc}.inn is null"
+          , ['inn'], "Количество записей с неактивными клиентами",
+          mart_predicate="coalesce(cf.active_flg, 0) = 0",
+          lookups={'uc': ("select distinct inn from {unified_customer} where active_flg <> 0", ['inn'])}),
+    Check('segment', 'Некорректный сегмент'
+          , "{rs}.request_id is not null and not coalesce({uc}.segments && {rs}.segments, false)"
+          , ['inn', 'request_id'], "Количество записей с некорректным сегментом",
+          mart_predicate="{rs}.request_id is not null and not coalesce(cf.crm_segment_type_nm = any({rs}.segments), false)",
+          lookups={'rs': (_REQUEST_SEGMENTS, ['request_id']),
+                   'uc': ("select inn, array_agg(distinct crm_segment_type_nm) as segments from {unified_customer} group by inn",
+                          ['inn'])},
+          mart_lookups={'rs': (_REQUEST_SEGMENTS, ['request_id'])}),
+]
+
+
+def register_check(check: Check, replace: bool = False):
+    '''
+    Функция для добавления проверки в список проверок по умолчанию CHECKS,
+    проверка используется всеми экземплярами Autocheck, созданными после регистрации
+
+    Параметры
+    ----------
+    check: экземпляр класса Check
+    replace: bool, по умолчанию False; указывает, что проверку с таким же названием нужно заменить
+    '''
+
+    names = [x.name for x in CHECKS]
+    if check.name in names:
+        if not replace:
+            raise Exception("ERROR: Проверка {name} уже зарегистрирована!".format(name=check.name))
+        CHECKS[names.index(check.name)] = check
+    else:
+        CHECKS.append(check)
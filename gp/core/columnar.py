@@ -0,0 +1,144 @@
+import pandas as pd
+from .copyio import _PG_DATETIME_TYPES, _PG_DECIMAL_TYPES, _PG_TIMESTAMPTZ_TYPES, _decimal_values, _utc_values
+
+# типы колонок фиксированной ширины по OID PostgreSQL
+_PANDAS_TYPES = {16: 'boolean', 20: 'Int64', 21: 'Int16', 23: 'Int32', 26: 'UInt32', 700: 'float32', 701: 'float64'}
+_ARROW_TYPES = {16: 'bool_', 20: 'int64', 21: 'int16', 23: 'int32', 26: 'uint32', 700: 'float32', 701: 'float64',
+                1082: 'date32', 1114: 'timestamp', 1184: 'timestamptz'}
+# максимальная точность decimal128 и decimal256 в pyarrow
+_ARROW_DECIMAL_PRECISION = (38, 76)
+
+
+def _is_text(type_code) -> bool:
+    return type_code not in _PANDAS_TYPES and type_code not in _PG_DATETIME_TYPES and type_code not in _PG_DECIMAL_TYPES
+
+
+def _category_columns(description, cardinality, categories, category_threshold) -> list:
+    # колонки для словарного кодирования: явно переданные или текстовые с долей уникальных значений не выше порога
+    if categories is not None:
+        return [i for i, x in enumerate(description) if x.name in categories]
+    columns = []
+    for i, x in enumerate(description):
+        if _is_text(x.type_code):
+            unique, total = cardinality(i)
+            if total > 0 and unique <= category_threshold * total:
+                columns.append(i)
+    return columns
+
+
+def _arrow_decimal(pa, pa_compute, column, precision, scale):
+    # точность и масштаб берутся из модификатора типа numeric(p, s), для numeric без модификатора - по значениям колонки;
+    # NaN и числа точнее decimal256 в decimal не представимы, такие колонки остаются строками
+    if precision is None or scale is None:
+        fraction = pa_compute.utf8_length(pa_compute.replace_substring_regex(column, r'^[^.]*\.?', ''))
+        integer = pa_compute.utf8_length(pa_compute.replace_substring_regex(column, r'^-?0*([0-9]*).*$', r'\1'))
+        scale = pa_compute.max(fraction).as_py() or 0
+        precision = max((pa_compute.max(integer).as_py() or 0) + scale, 1)
+    if precision > _ARROW_DECIMAL_PRECISION[1]:
+        return column
+    decimal = pa.decimal128 if precision <= _ARROW_DECIMAL_PRECISION[0] else pa.decimal256
+    try:
+        return pa_compute.cast(column, decimal(precision, scale))
+    except pa.ArrowInvalid:
+        return column
+
+
+def _read_pandas(buffer, description, encoding, categories, category_threshold) -> pd.DataFrame:
+    dtype = {}
+    for i, x in enumerate(description):
+        if x.type_code in _PANDAS_TYPES:
+            dtype[i] = _PANDAS_TYPES[x.type_code]
+        elif x.type_code in _PG_DECIMAL_TYPES | _PG_TIMESTAMPTZ_TYPES:
+            dtype[i] = str
+        elif _is_text(x.type_code):
+            dtype[i] = 'category' if categories is not None and x.name in categories else str
+    parse_dates = [i for i, x in enumerate(description) if x.type_code in _PG_DATETIME_TYPES - _PG_TIMESTAMPTZ_TYPES]
+
+    try:
+        df = pd.read_csv(buffer, header=None, dtype=dtype, parse_dates=parse_dates, encoding=encoding,
+                         keep_default_na=False, na_values=['\\N'], true_values=['t'], false_values=['f'])
+    except pd.errors.EmptyDataError:
+        df = pd.DataFrame({i: pd.Series(dtype=dtype.get(i, 'datetime64[ns]')) for i in range(len(description))})
+
+    for i, x in enumerate(description):
+        if x.type_code in _PG_DECIMAL_TYPES:
+            df[i] = _decimal_values(df[i])
+        elif x.type_code in _PG_TIMESTAMPTZ_TYPES:
+            df[i] = _utc_values(df[i])
+
+    if categories is None:
+        for i in _category_columns(description, lambda i: (df[i].nunique(), len(df)), categories, category_threshold):
+            df[i] = df[i].astype('category')
+
+    df.columns = [x.name for x in description]
+    return df
+
+
+def _read_arrow(buffer, description, encoding, categories, category_threshold):
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+        import pyarrow.compute as pa_compute
+    except ImportError:
+        raise Exception("ERROR: Для backend='arrow' необходим пакет pyarrow!")
+
+    names = ['f{i}'.format(i=i) for i in range(len(description))]
+    column_types = {}
+    for name, x in zip(names, description):
+        if x.type_code in _ARROW_TYPES:
+            arrow_type = _ARROW_TYPES[x.type_code]
+            if arrow_type == 'timestamp':
+                column_types[name] = pa.timestamp('us')
+            elif arrow_type == 'timestamptz':
+                # значения timestamptz приходят со смещением часового пояса сессии и приводятся к UTC
+                column_types[name] = pa.timestamp('us', tz='UTC')
+            else:
+                column_types[name] = getattr(pa, arrow_type)()
+        else:
+            column_types[name] = pa.string()
+
+    table = pa_csv.read_csv(buffer
+                            , read_options=pa_csv.ReadOptions(column_names=names, encoding=encoding)
+                            , convert_options=pa_csv.ConvertOptions(column_types=column_types
+                                                                    , null_values=['\\N']
+                                                                    , strings_can_be_null=True
+                                                                    , quoted_strings_can_be_null=False
+                                                                    , true_values=['t']
+                                                                    , false_values=['f']))
+
+    for i, x in enumerate(description):
+        if x.type_code in _PG_DECIMAL_TYPES:
+            table = table.set_column(i, names[i], _arrow_decimal(pa, pa_compute, table.column(i), getattr(x, 'precision', None)
+                                                                 , getattr(x, 'scale', None)))
+
+    for i in _category_columns(description, lambda i: (pa_compute.count_distinct(table.column(i)).as_py(), len(table))
+                               , categories, category_threshold):
+        table = table.set_column(i, names[i], table.column(i).dictionary_encode())
+
+    return table.rename_columns([x.name for x in description])
+
+
+def _read_columnar(buffer, description, encoding: str = 'utf-8', backend: str = 'pandas', categories: list = None,
+                   category_threshold: float = 0.5):
+    '''
+    Функция для разбора результата COPY ... TO STDOUT в формате CSV в колоночное представление
+    Целые, дробные, логические колонки и даты декодируются в массивы фиксированной ширины,
+    малокардинальные текстовые колонки кодируются словарем (category/dictionary).
+    numeric декодируется без потери точности: в Decimal для pandas и в decimal128/decimal256 для arrow,
+    timestamptz приводится к UTC
+
+    Параметры
+    ----------
+    buffer: файлоподобный объект с результатом COPY
+    description: cursor.description запроса
+    encoding: str, по умолчанию 'utf-8'; кодировка соединения
+    backend: str, {'pandas', 'arrow'}, по умолчанию 'pandas'; формат результата: датафрейм или pyarrow.Table
+    categories: list, по умолчанию None; колонки для словарного кодирования, None - определяются автоматически
+    category_threshold: float, по умолчанию 0.5; максимальная доля уникальных значений текстовой колонки для автоматического словарного кодирования
+    '''
+
+    if backend == 'pandas':
+        return _read_pandas(buffer, description, encoding, categories, category_threshold)
+    elif backend == 'arrow':
+        return _read_arrow(buffer, description, encoding, categories, category_threshold)
+    raise Exception("ERROR: Укажите формат результата backend: 'pandas' или 'arrow'!")
@@ -0,0 +1,228 @@
+import struct
+from datetime import datetime, date
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+
+# форматы COPY FROM STDIN: текстовый и бинарный формат PostgreSQL
+
+_PG_EPOCH_DATE = date(2000, 1, 1)
+_PG_EPOCH_DATETIME = datetime(2000, 1, 1)
+_BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+_BINARY_TRAILER = struct.pack('!h', -1)
+
+
+def _is_null(value) -> bool:
+    # pd.isna распознает None, NaN, NaT и pd.NA из nullable-колонок (Int64, boolean, string);
+    # Decimal('NaN') - допустимое значение numeric, а не пропуск
+    if isinstance(value, Decimal) or not pd.api.types.is_scalar(value):
+        return False
+    return bool(pd.isna(value))
+
+
+def _text_value(value) -> str:
+    if _is_null(value):
+        return '\\N'
+    if isinstance(value, (bool, np.bool_)):
+        return 't' if value else 'f'
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        # целые значения из колонок с пропусками приходят как float и должны приниматься integer-колонками
+        return str(int(value))
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _binary_numeric(value) -> bytes:
+    value = value if isinstance(value, Decimal) else Decimal(str(value))
+    if value.is_nan():
+        return struct.pack('!hhHH', 0, 0, 0xC000, 0)
+
+    sign, _, exponent = value.as_tuple()
+    int_part, _, frac_part = format(abs(value), 'f').partition('.')
+    int_part = int_part.lstrip('0')
+    int_part = '0' * (-len(int_part) % 4) + int_part
+    frac_part = frac_part + '0' * (-len(frac_part) % 4)
+    digits = [int(int_part[i:i + 4]) for i in range(0, len(int_part), 4)] \
+             + [int(frac_part[i:i + 4]) for i in range(0, len(frac_part), 4)]
+    weight = len(int_part) // 4 - 1
+    while digits and digits[0] == 0:
+        digits.pop(0)
+        weight -= 1
+    while digits and digits[-1] == 0:
+        digits.pop()
+    if not digits:
+        weight = 0
+
+    return struct.pack('!hhHH', len(digits), weight, 0x4000 if sign else 0, max(-exponent, 0)) \
+           + struct.pack('!{count}H'.format(count=len(digits)), *digits)
+
+
+def _binary_timestamp(value) -> bytes:
+    value = pd.Timestamp(value).to_pydatetime().replace(tzinfo=None)
+    delta = value - _PG_EPOCH_DATETIME
+    return struct.pack('!q', (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds)
+
+
+def _binary_timestamptz(value) -> bytes:
+    value = pd.Timestamp(value)
+    if value.tzinfo is not None:
+        value = value.tz_convert('UTC')
+    return _binary_timestamp(value)
+
+
+def _binary_date(value) -> bytes:
+    if isinstance(value, datetime):
+        value = value.date()
+    return struct.pack('!i', (value - _PG_EPOCH_DATE).days)
+
+
+# кодировщики бинарного формата по OID типа колонки таблицы
+_BINARY_ENCODERS = {
+    16: lambda x, encoding: b'\x01' if x else b'\x00',
+    20: lambda x, encoding: struct.pack('!q', int(x)),
+    21: lambda x, encoding: struct.pack('!h', int(x)),
+    23: lambda x, encoding: struct.pack('!i', int(x)),
+    700: lambda x, encoding: struct.pack('!f', float(x)),
+    701: lambda x, encoding: struct.pack('!d', float(x)),
+    1700: lambda x, encoding: _binary_numeric(x),
+    1082: lambda x, encoding: _binary_date(x),
+    1114: lambda x, encoding: _binary_timestamp(x),
+    1184: lambda x, encoding: _binary_timestamptz(x),
+    25: lambda x, encoding: str(x).encode(encoding),
+    1042: lambda x, encoding: str(x).encode(encoding),
+    1043: lambda x, encoding: str(x).encode(encoding),
+}
+
+
+class _CopyStream(object):
+    '''
+    Файлоподобный объект для COPY FROM STDIN, кодирующий строки по мере чтения
+
+    Параметры
+    ----------
+    rows: итератор по кортежам значений
+    encoding: str, по умолчанию 'utf-8'; кодировка соединения
+    type_codes: list, по умолчанию None; OID типов колонок, при передаче используется бинарный формат
+    '''
+
+    def __init__(self, rows, encoding: str = 'utf-8', type_codes: list = None):
+        self.rows = iter(rows)
+        self.encoding = encoding
+        self.encoders = None
+        self.bytes = 0
+        self.records = 0
+        self._buffer = b''
+        self._finished = False
+
+        if type_codes is not None:
+            unsupported = [x for x in type_codes if x not in _BINARY_ENCODERS]
+            if unsupported:
+                raise Exception("ERROR: Бинарный COPY не поддерживает типы колонок с OID {oids}, используйте method='copy'!"
+                                .format(oids=', '.join(map(str, unsupported))))
+            self.encoders = [_BINARY_ENCODERS[x] for x in type_codes]
+            self._buffer = _BINARY_HEADER
+
+    def _encode(self, row) -> bytes:
+        if self.encoders is None:
+            return ('\t'.join(_text_value(x) for x in row) + '\n').encode(self.encoding)
+
+        if len(row) != len(self.encoders):
+            raise Exception("ERROR: Количество значений в строке не совпадает с количеством колонок таблицы!")
+        chunks = [struct.pack('!h', len(row))]
+        for value, encoder in zip(row, self.encoders):
+            if _is_null(value):
+                chunks.append(struct.pack('!i', -1))
+            else:
+                value = encoder(value, self.encoding)
+                chunks.append(struct.pack('!i', len(value)))
+                chunks.append(value)
+        return b''.join(chunks)
+
+    def read(self, size: int = -1) -> bytes:
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while not self._finished and (size < 0 or length < size):
+            row = next(self.rows, None)
+            if row is None:
+                self._finished = True
+                if self.encoders is not None:
+                    chunks.append(_BINARY_TRAILER)
+                    length += len(_BINARY_TRAILER)
+                break
+            chunk = self._encode(row)
+            chunks.append(chunk)
+            length += len(chunk)
+            self.records += 1
+
+        data = b''.join(chunks)
+        if size >= 0:
+            data, self._buffer = data[:size], data[size:]
+        else:
+            self._buffer = b''
+        self.bytes += len(data)
+        return data
+
+
+# OID типов PostgreSQL, используемые при разборе результатов COPY TO STDOUT
+_PG_BOOL_TYPES = {16}
+_PG_DATETIME_TYPES = {1082, 1114, 1184}
+_PG_NUMBER_TYPES = {20, 21, 23, 26, 700, 701, 1700}
+_PG_DECIMAL_TYPES = {1700}
+_PG_DATE_TYPES = {1082}
+_PG_TIMESTAMPTZ_TYPES = {1184}
+
+
+def _decimal_values(series) -> pd.Series:
+    # numeric декодируется в Decimal без потери точности, как его возвращает psycopg2
+    return series.map(Decimal, na_action='ignore').astype(object).where(series.notna(), None)
+
+
+def _date_values(series) -> pd.Series:
+    # date декодируется в datetime.date, как его возвращает psycopg2, без ограничения диапазона datetime64
+    return series.map(date.fromisoformat, na_action='ignore').astype(object).where(series.notna(), None)
+
+
+def _utc_values(series) -> pd.Series:
+    # смещение часового пояса сессии различается между строками при переходе на летнее время,
+    # поэтому значения timestamptz приводятся к UTC
+    return pd.to_datetime(series, utc=True, format='ISO8601')
+
+
+def _read_csv(buffer, description, encoding: str = 'utf-8') -> pd.DataFrame:
+    '''
+    Функция для разбора результата COPY ... TO STDOUT в формате CSV в датафрейм
+    Колонки типизируются по OID из cursor.description так же, как их возвращает read_sql:
+    текстовые колонки остаются строками, date - объектами datetime.date, timestamp - datetime64,
+    timestamptz - datetime64 в UTC. В отличие от read_sql, numeric не приводится к float64,
+    а декодируется в Decimal без потери точности
+
+    Параметры
+    ----------
+    buffer: файлоподобный объект с результатом COPY
+    description: cursor.description запроса
+    encoding: str, по умолчанию 'utf-8'; кодировка соединения
+    '''
+
+    columns = [x.name for x in description]
+    dtype = {i: str for i, x in enumerate(description)
+             if x.type_code not in _PG_BOOL_TYPES | _PG_DATETIME_TYPES | _PG_NUMBER_TYPES
+             or x.type_code in _PG_DECIMAL_TYPES | _PG_DATE_TYPES | _PG_TIMESTAMPTZ_TYPES}
+    parse_dates = [i for i, x in enumerate(description)
+                   if x.type_code in _PG_DATETIME_TYPES - _PG_DATE_TYPES - _PG_TIMESTAMPTZ_TYPES]
+
+    try:
+        df = pd.read_csv(buffer, header=None, dtype=dtype, parse_dates=parse_dates, encoding=encoding,
+                         keep_default_na=False, na_values=['\\N'], true_values=['t'], false_values=['f'])
+    except pd.errors.EmptyDataError:
+        df = pd.DataFrame(columns=range(len(columns)))
+
+    for i, x in enumerate(description):
+        if x.type_code in _PG_DECIMAL_TYPES:
+            df[i] = _decimal_values(df[i])
+        elif x.type_code in _PG_DATE_TYPES:
+            df[i] = _date_values(df[i])
+        elif x.type_code in _PG_TIMESTAMPTZ_TYPES:
+            df[i] = _utc_values(df[i])
+    df.columns = columns
+    return df
@@ -0,0 +1,125 @@
+from .profiler import traced
+from .workload import uses_workload
+
+class CheckFlagMart(object):
+    '''
+    Класс витрины предрасчитанных признаков клиентов и продуктов для автопроверок
+    Витрина обновляется раз в день методом refresh, после чего Autocheck вместо чтения витрин CMDM при каждой проверке
+    соединяет таргет с предрасчитанными признаками по inn (таблицы признаков распределены по inn)
+
+    Параметры
+    ----------
+    gpconnector: экземпляр класса GPConnector для подключения к БД
+    product_flags: str, по умолчанию 'sandbox.autocheck_product_flags'; таблица признаков по связке ИНН-продукт
+    client_flags: str, по умолчанию 'sandbox.autocheck_client_flags'; таблица признаков по ИНН
+
+    Атрибуты
+    ----------
+    gpconnector: экземпляр класса GPConnector для подключения к БД
+    product_flags: str; таблица признаков по связке ИНН-продукт, одна строка на inn, product_id:
+        has_task_90d - задача по продукту за последние 90 дней,
+        has_prpr_90d - ПрПр по продукту за последние 90 дней,
+        has_closed_deal - заключенная сделка по продукту,
+        has_active_agreement - действующий договор по продукту
+    client_flags: str; таблица признаков по ИНН, одна строка на inn: active_flg - признак активного клиента,
+        crm_segment_type_nm - сегмент клиента
+
+    Методы
+    ----------
+    refresh: метод для обновления витрины
+    is_fresh: метод для проверки актуальности витрины
+    drop: метод для удаления витрины
+
+    Таблицы
+    ----------
+    prom.ma_deal: витрина со сделками из CMDM
+    prom.ma_product_offer: витрина с продуктовыми предложениями из CMDM
+    prom.ma_task: витрина с задачами из CMDM
+    prom.ma_agreement: витрина с договорами из CMDM
+    prom.ma_unified_customer: витрина с атрибутами организации из CMDM
+    '''
+
+    def __init__(self, gpconnector, product_flags: str = 'sandbox.autocheck_product_flags',
+                 client_flags: str = 'sandbox.autocheck_client_flags'):
+        self.gpconnector = gpconnector
+        self.product_flags = product_flags
+        self.client_flags = client_flags
+        self.deal = "prom.ma_deal"
+        self.product_offer = "prom.ma_product_offer"
+        self.task = "prom.ma_task"
+        self.agreement = "prom.ma_agreement"
+        self.unified_customer = "prom.ma_unified_customer"
+
+    def is_fresh(self) -> bool:
+        '''
+        Метод для проверки актуальности витрины: обе таблицы признаков созданы сегодня
+        '''
+
+        return bool(self.gpconnector.select_list(
+            """select count(distinct o.objid) = 2
+                 from pg_stat_last_operation o
+                 join pg_class c on c.oid = o.objid
+                 join pg_namespace n on n.oid = c.relnamespace
+                where o.classid = 'pg_class'::regclass
+                  and o.staactionname = 'CREATE'
+                  and o.statime >= current_date
+                  and n.nspname || '.' || c.relname in ('{product_flags}', '{client_flags}')"""
+            .format(product_flags=self.product_flags.lower(), client_flags=self.client_flags.lower()))[0][0])
+
+    @uses_workload('bulk_load')
+    @traced
+    def refresh(self, force: bool = False):
+        '''
+        Метод для обновления витрины: таблицы признаков пересоздаются в одной транзакции
+
+        Параметры
+        ----------
+        force: bool, по умолчанию False; указывает, что витрину нужно обновить, даже если она уже обновлена сегодня
+        '''
+
+        if not force and self.is_fresh():
+            print('SUCCESS: Витрина признаков автопроверок {product_flags} актуальна'.format(product_flags=self.product_flags))
+            return
+
+        with self.gpconnector.transaction():
+            self.gpconnector.create('TABLE', self.product_flags,
+                                    """select inn
+                                            , product_id
+                                            , max(has_task_90d) as has_task_90d
+                                            , max(has_prpr_90d) as has_prpr_90d
+                                            , max(has_closed_deal) as has_closed_deal
+                                            , max(has_active_agreement) as has_active_agreement
+                                         from (select inn, host_prod_id as product_id, 1 as has_task_90d, 0 as has_prpr_90d, 0 as has_closed_deal, 0 as has_active_agreement
+                                                 from {task}
+                                                where create_dt >= current_date - 90
+                                                union all
+                                               select inn, host_prod_id, 0, 1, 0, 0
+                                                 from {product_offer}
+                                                where creation_dttm >= current_date - 90
+                                                union all
+                                               select inn, host_prod_id, 0, 0, 1, 0
+                                                 from {deal}
+                                                where deal_status_nm = 'Заключена'
+                                                union all
+                                               select inn, host_prod_id, 0, 0, 0, 1
+                                                 from {agreement}
+                                                where active_flg = 1) as t
+                                        group by inn, product_id"""
+                                    .format(task=self.task, product_offer=self.product_offer, deal=self.deal,
+                                            agreement=self.agreement)
+                                    , distributed_by='inn')
+            self.gpconnector.create('TABLE', self.client_flags,
+                                    """select inn
+                                            , max(case when active_flg <> 0 then 1 else 0 end) as active_flg
+                                            , max(crm_segment_type_nm) as crm_segment_type_nm
+                                         from {unified_customer}
+                                        group by inn""".format(unified_customer=self.unified_customer)
+                                    , distributed_by='inn')
+
+    def drop(self):
+        '''
+        Метод для удаления витрины
+        '''
+
+        self.gpconnector.drop(self.product_flags)
+        self.gpconnector.drop(self.client_flags)
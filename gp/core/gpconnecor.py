@@ -1,6 +1,25 @@
+import re
+import time
+import uuid
+import numpy as np
+import tempfile
+import threading
 import psycopg2
 import pandas as pd
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from multipledispatch import dispatch
+from .pool import ConnectionPool
+from .copyio import _CopyStream, _read_csv
+from .columnar import _read_columnar
+from .cache import QueryCache
+from .profiler import QueryProfiler
+from .plan import QueryPlan
+from .slowlog import SlowQueryLog
+from .workload import WORKLOADS
+
+# ограничение select_df по умолчанию: 1000000 строк, а при выборке порциями (chunksize) - без ограничения
+_DEFAULT_LIMIT = object()
 
 class GPConnector():
     '''
@@ -12,6 +31,14 @@ class GPConnector():
     password: пароль пользователя
     host: хост-адрес базы данных
     dbname: имя базы данных
+    pool_min_size: int, по умолчанию 0; количество простаивающих соединений для каждого набора опций, которые не закрываются
+        по pool_idle_timeout (соединения открываются по требованию)
+    pool_max_size: int, по умолчанию 10; максимальное количество открытых соединений с БД
+    pool_idle_timeout: int, по умолчанию 300; время простоя соединения в секундах, после которого оно закрывается
+    catalog_ttl: int, по умолчанию 300; время жизни кэша каталога объектов в секундах, 0 - кэш отключен
+    analyze_policy: str или int, по умолчанию 10000; сбор статистики (ANALYZE) после create, insert и refresh:
+        'always' - всегда, 'never' - никогда, число N - если записано больше N строк или количество строк неизвестно
+    workloads: dict, по умолчанию None; профили нагрузки {название: {параметр: значение}}, дополняющие и переопределяющие профили по умолчанию
 
     Атрибуты
     ----------
@@ -19,30 +46,474 @@ class GPConnector():
     password: str; пароль пользователя
     host: str; хост-адрес базы данных
     dbname: str; имя базы данных
+    pool: экземпляр класса ConnectionPool; пул соединений, используемый всеми методами
+    copy_sample_size: int, по умолчанию 1000; количество строк, по которым определяются типы колонок таблицы при создании через COPY
+    fetch_engine: str, {'read_sql', 'copy', 'columnar'}, по умолчанию 'read_sql'; способ выборки данных в датафрейм по умолчанию для select_df
+    catalog_ttl: int; время жизни кэша каталога объектов в секундах, 0 - кэш отключен
+    catalog_schemas: list, по умолчанию ['sandbox', 'prom']; схемы, объекты которых хранятся в кэше каталога
+    analyze_policy: str или int; сбор статистики после create, insert и refresh ('always', 'never' или порог количества строк)
+    analyze_columns: list, по умолчанию None; колонки, по которым собирается статистика при автоматическом ANALYZE,
+        например ['inn']; None или отсутствие колонок в таблице - по всем колонкам
+    workloads: dict; профили нагрузки {название: {параметр сессии: значение}}, по умолчанию 'bulk_load', 'autocheck',
+        'stop_filter' и 'interactive_preview'; применяются к запросам без явно переданных опций подключения (см. workload)
+    health_patterns: list, по умолчанию ['prom.stop_%', 'prom.insight_repository%', 'sandbox.%']; шаблоны названий таблиц для отчета table_health
+    cache: экземпляр класса QueryCache, по умолчанию None; дисковый кэш результатов select_df, включается методом enable_cache
+    hooks: dict, {'before': [...], 'after': [...]}; обработчики, вызываемые до и после выполнения каждого запроса (см. add_hook)
+    profiler: экземпляр класса QueryProfiler, по умолчанию None; профилировщик запросов, включается методом enable_profiler
+    slow_log: экземпляр класса SlowQueryLog, по умолчанию None; журнал медленных запросов, включается методом enable_slow_log
 
     Методы
     ----------
     select: метод для вывода результатов запроса на печать
     select_list: метод для выбора данных в list
     select_df: метод для выбора данных в датафрейм
+    select_prepared: метод для выбора данных подготовленным запросом с параметрами
+    select_iter: метод для потокового выбора данных через серверный курсор
+    select_columnar: метод для выбора данных в колоночном представлении с типизированными колонками
     get_object_type: метод для получения типа объекта
+    refresh_catalog: метод для загрузки кэша каталога объектов
+    get_object_types: метод для получения типов нескольких объектов за одно обращение к БД
     get_source_code: метод для вывода исходного кода объекта на печать
+    get_source_codes: метод для получения исходного кода нескольких объектов за одно обращение к БД
     explain: метод для вывода плана запроса
+    explain_plan: метод для получения разобранного плана запроса с анализом motion-операций и перекосов
+    describe: метод для получения колонок и типов таргета за одно обращение к БД
     validate_target: метод для проверки корректности таргета
     execute: метод для запуска скриптов
     create: метод для создания объектов
     truncate: метод для очистки таблиц
+    analyze: метод для сбора статистики таблицы
     insert: метод для вставки записей в таблицу
     refresh: метод для обновления объекта
     drop: метод для удаления объектов
+    run_many: метод для параллельного выполнения списка запросов
+    table_health: метод для получения отчета о распределении по сегментам, размере и статистике таблиц
+    enable_cache: метод для включения дискового кэша результатов select_df
+    disable_cache: метод для отключения дискового кэша результатов select_df
+    add_hook: метод для добавления обработчика выполнения запросов
+    remove_hook: метод для удаления обработчика выполнения запросов
+    enable_profiler: метод для включения профилировщика запросов
+    disable_profiler: метод для отключения профилировщика запросов
+    enable_slow_log: метод для включения журнала медленных запросов с планами
+    disable_slow_log: метод для отключения журнала медленных запросов
+    operation: контекстный менеджер для указания высокоуровневой операции, к которой относятся запросы
+    workload: контекстный менеджер для выполнения запросов с параметрами профиля нагрузки
+    session: контекстный менеджер для выполнения вызовов на одном соединении
+    transaction: контекстный менеджер для выполнения вызовов в одной транзакции
+    close: метод для закрытия соединений пула
     '''
 
     def __init__(self, user: str = 'postgres', password: str = '1234', host: str = 'localhost',
-                 dbname: str = 'postgres'):
+                 dbname: str = 'postgres', pool_min_size: int = 0, pool_max_size: int = 10, pool_idle_timeout: int = 300,
+                 catalog_ttl: int = 300, analyze_policy=10000, workloads: dict = None):
         self.user = user
         self.password = password
         self.host = host
         self.dbname = dbname
+        self.pool = ConnectionPool(user, password, host, dbname, min_size=pool_min_size, max_size=pool_max_size,
+                                   idle_timeout=pool_idle_timeout)
+        self.copy_sample_size = 1000
+        self.fetch_engine = 'read_sql'
+        self.catalog_ttl = catalog_ttl
+        self.catalog_schemas = ['sandbox', 'prom']
+        self.analyze_policy = analyze_policy
+        self.workloads = {name: dict(settings) for name, settings in WORKLOADS.items()}
+        self.workloads.update(workloads or {})
+        self.analyze_columns = None
+        self.health_patterns = ['prom.stop\\_%', 'prom.insight\\_repository%', 'sandbox.%']
+        self._catalog = None
+        self._catalog_loaded = 0
+        self._catalog_stale = set()
+        self._catalog_lock = threading.RLock()
+        self.cache = None
+        self.hooks = {'before': [], 'after': []}
+        self.profiler = None
+        self.slow_log = None
+        self._local = threading.local()
+        self._prepared = {}
+        self._described = {}
+        self._prepared_lock = threading.Lock()
+        self.pool.on_close.append(self._forget_prepared)
+
+    def _workload_settings(self, name: str) -> dict:
+        return dict((key, ('on' if value else 'off') if isinstance(value, bool) else str(value))
+                    for key, value in sorted((self.workloads.get(name) or {}).items()))
+
+    def _options(self, options: str = None, workload: str = None) -> str:
+        # явно переданные опции важнее профиля нагрузки, профиль блока workload важнее профиля метода по умолчанию
+        if options is not None:
+            return options
+        workloads = getattr(self._local, 'workloads', None)
+        name = (workloads[-1] if workloads else None) or workload
+        if not self.workloads.get(name):
+            return None
+        return ' '.join('-c {key}={value}'.format(key=key, value=value) for key, value in self._workload_settings(name).items())
+
+    def _set_settings(self, conn, settings: dict, local: bool = False) -> dict:
+        # параметры сессии меняются командой SET (SET LOCAL внутри транзакции), возвращаются прежние значения параметров
+        with conn.cursor() as cur:
+            cur.execute("select {values}".format(values=', '.join(['current_setting(%s)'] * len(settings))), list(settings))
+            previous = dict(zip(settings, cur.fetchone()))
+            for key, value in settings.items():
+                cur.execute("set {local}{key} = %s".format(local='local ' if local else '', key=key), (value,))
+        if not local:
+            conn.commit()
+        return previous
+
+    @contextmanager
+    def _connect(self, options: str = None, record: dict = None):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            options = self._options(options)
+            start = time.perf_counter()
+            with self.pool.connection(options) as conn:
+                if record is not None:
+                    record['connect_time'] = time.perf_counter() - start
+                yield conn
+        elif self._local.transaction:
+            # внутри transaction() фиксация выполняется при выходе из транзакции
+            yield conn
+        else:
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def add_hook(self, event: str, hook):
+        '''
+        Метод для добавления обработчика выполнения запросов
+        Обработчик получает словарь с описанием запроса (см. QueryProfiler.records); обработчики 'before' вызываются
+        до выполнения запроса и могут дополнить словарь, обработчики 'after' - после выполнения, в том числе завершившегося ошибкой
+
+        Параметры
+        ----------
+        event: str, {'before', 'after'}; событие, на которое вызывается обработчик
+        hook: функция от одного аргумента - словаря с описанием запроса
+        '''
+
+        if event not in self.hooks:
+            raise Exception("ERROR: Укажите событие event: 'before' или 'after'!")
+        self.hooks[event].append(hook)
+
+    def remove_hook(self, event: str, hook):
+        '''
+        Метод для удаления обработчика выполнения запросов
+
+        Параметры
+        ----------
+        event: str, {'before', 'after'}; событие, на которое вызывается обработчик
+        hook: обработчик, добавленный методом add_hook
+        '''
+
+        if hook in self.hooks.get(event, []):
+            self.hooks[event].remove(hook)
+
+    def enable_profiler(self, max_records: int = 100000) -> QueryProfiler:
+        '''
+        Метод для включения профилировщика запросов
+        Возвращает профилировщик, записи которого выгружаются методами to_df, to_jsonl и summary
+
+        Параметры
+        ----------
+        max_records: int, по умолчанию 100000; максимальное количество хранимых записей
+        '''
+
+        self.disable_profiler()
+        self.profiler = QueryProfiler(max_records)
+        self.add_hook('after', self.profiler)
+        return self.profiler
+
+    def disable_profiler(self):
+        '''
+        Метод для отключения профилировщика запросов
+        '''
+
+        if self.profiler is not None:
+            self.remove_hook('after', self.profiler)
+            self.profiler = None
+
+    def enable_slow_log(self, threshold: float = 60, path: str = '~/.cache/gp/slow_queries.jsonl', explain: bool = True,
+                        analyze_sample: float = 0) -> SlowQueryLog:
+        '''
+        Метод для включения журнала медленных запросов с планами
+        Возвращает журнал, записи которого выгружаются методом entries, а планы одного запроса сравниваются методом diff_plans
+
+        Параметры
+        ----------
+        threshold: float, по умолчанию 60; время выполнения запроса в секундах, начиная с которого запрос записывается в журнал
+        path: str, по умолчанию '~/.cache/gp/slow_queries.jsonl'; файл журнала
+        explain: bool, по умолчанию True; указывает, что для медленного запроса нужно сохранить план (EXPLAIN)
+        analyze_sample: float, по умолчанию 0; доля медленных читающих запросов, которые повторно выполняются с EXPLAIN ANALYZE
+        '''
+
+        self.disable_slow_log()
+        self.slow_log = SlowQueryLog(self, path, threshold, explain, analyze_sample)
+        self.add_hook('after', self.slow_log)
+        return self.slow_log
+
+    def disable_slow_log(self):
+        '''
+        Метод для отключения журнала медленных запросов
+        '''
+
+        if self.slow_log is not None:
+            self.remove_hook('after', self.slow_log)
+            self.slow_log = None
+
+    @contextmanager
+    def operation(self, name: str):
+        '''
+        Контекстный менеджер для указания высокоуровневой операции, к которой относятся запросы внутри блока
+        Вложенные операции записываются через ' > ', например 'RepositoryLoader.load > Autocheck.check'
+
+        Параметры
+        ----------
+        name: str; название операции
+        '''
+
+        operations = getattr(self._local, 'operations', None)
+        if operations is None:
+            operations = self._local.operations = []
+        operations.append(name)
+        try:
+            yield self
+        finally:
+            operations.pop()
+
+    @contextmanager
+    def workload(self, name: str):
+        '''
+        Контекстный менеджер для выполнения запросов с параметрами профиля нагрузки
+        Запросы внутри блока, для которых не переданы опции подключения, выполняются на соединениях с параметрами профиля
+        (например, statement_mem, optimizer, statement_timeout); во вложенных блоках действует внутренний профиль;
+        внутри session/transaction параметры профиля устанавливаются на соединении сессии командой SET
+        (SET LOCAL в транзакции) и возвращаются к прежним значениям при выходе из блока
+
+        Параметры
+        ----------
+        name: str; название профиля нагрузки из атрибута workloads
+        '''
+
+        if name not in self.workloads:
+            raise Exception("ERROR: Профиль нагрузки {name} не найден!".format(name=name))
+        workloads = getattr(self._local, 'workloads', None)
+        if workloads is None:
+            workloads = self._local.workloads = []
+
+        # опции подключения применяются только при выдаче соединения из пула, поэтому на закрепленном соединении нужен SET
+        conn = getattr(self._local, 'conn', None)
+        settings = self._workload_settings(name)
+        local = conn is not None and self._local.transaction
+        previous = self._set_settings(conn, settings, local) if conn is not None and settings else None
+
+        workloads.append(name)
+        try:
+            yield self
+        finally:
+            workloads.pop()
+            if previous:
+                try:
+                    self._set_settings(conn, previous, local)
+                except psycopg2.Error:
+                    # в прерванной транзакции SET LOCAL отменяется откатом транзакции
+                    if not local:
+                        raise
+
+    @contextmanager
+    def _trace(self, kind: str, statement: str, options: str = None, params=None):
+        record = {'operation': ' > '.join(getattr(self._local, 'operations', None) or []) or None, 'kind': kind,
+                  'statement': statement, 'params': params, 'options': options, 'started': time.time(), 'wall_time': None,
+                  'connect_time': 0.0, 'execute_time': None, 'fetch_time': None, 'rows': None, 'bytes': None,
+                  'error': None}
+        for hook in self.hooks['before']:
+            hook(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        except GeneratorExit:
+            # генератор select_iter закрыт до окончания выборки
+            raise
+        except BaseException as error:
+            record['error'] = str(error).strip() or type(error).__name__
+            raise
+        finally:
+            record['wall_time'] = time.perf_counter() - start
+            for hook in self.hooks['after']:
+                hook(record)
+
+    @contextmanager
+    def session(self, options: str = None):
+        '''
+        Контекстный менеджер сессии: все вызовы методов коннектора внутри блока в текущем потоке выполняются на одном соединении
+        Позволяет использовать временные таблицы и подготовленные запросы между шагами; каждый вызов фиксируется отдельно,
+        временные таблицы сессии удаляются при выходе из блока
+        Опции подключения вызовов внутри сессии игнорируются, используются опции сессии
+
+        Параметры
+        ----------
+        options: str, по умолчанию None; опции подключения к ДБ
+        '''
+
+        if getattr(self._local, 'conn', None) is not None:
+            yield self
+            return
+
+        conn = self.pool.getconn(self._options(options))
+        self._local.conn, self._local.transaction = conn, False
+        discard = False
+        try:
+            yield self
+        finally:
+            self._local.conn = None
+            try:
+                conn.rollback()
+                with conn.cursor() as cur:
+                    # курсоры WITH HOLD недочитанных select_iter не должны остаться на соединении пула
+                    cur.execute("close all")
+                    cur.execute("discard temp")
+                    # параметры, установленные внутри сессии (см. workload), не должны остаться на соединении пула
+                    cur.execute("reset all")
+                conn.commit()
+            except psycopg2.Error:
+                discard = True
+            self.pool.putconn(conn, discard=discard)
+
+    @contextmanager
+    def transaction(self, options: str = None):
+        '''
+        Контекстный менеджер транзакции: все вызовы методов коннектора внутри блока в текущем потоке выполняются
+        на одном соединении в одной транзакции, которая фиксируется при выходе из блока или откатывается при исключении
+
+        Параметры
+        ----------
+        options: str, по умолчанию None; опции подключения к ДБ
+        '''
+
+        if getattr(self._local, 'transaction', False):
+            yield self
+            return
+
+        with self.session(options):
+            conn = self._local.conn
+            self._local.transaction = True
+            try:
+                yield self
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                # объекты, созданные или удаленные в откаченной транзакции, могли попасть в кэш каталога
+                self._invalidate_catalog()
+                raise
+            finally:
+                self._local.transaction = False
+
+    @staticmethod
+    def _limit_query(query: str, limit: int = None) -> str:
+        if 'select' not in query.lower():
+            query = "select * from {query}".format(query=query)
+        return "{query} limit {limit}".format(query=query, limit='all' if limit is None else limit)
+
+    @staticmethod
+    def _split_columns(columns: str) -> list:
+        return [x.strip() for x in columns.split(',')] if columns else None
+
+    def _copy(self, table_name: str, rows, columns: list = None, method: str = 'copy', options: str = None) -> int:
+        if self.cache is not None:
+            self.cache.invalidate(table_name)
+        columns_sql = ' ({columns})'.format(columns=', '.join(columns)) if columns else ''
+        statement = "copy {table_name}{columns} from stdin{binary}".format(table_name=table_name
+                                                                          , columns=columns_sql
+                                                                          , binary=' with binary' if method == 'binary' else '')
+
+        with self._trace('copy_in', statement, options) as record, self._connect(options, record) as conn:
+            with conn.cursor() as cur:
+                type_codes = None
+                if method == 'binary':
+                    cur.execute("select {columns} from {table_name} limit 0"
+                                .format(columns=', '.join(columns) if columns else '*', table_name=table_name))
+                    type_codes = [x.type_code for x in cur.description]
+                stream = _CopyStream(rows, psycopg2.extensions.encodings[conn.encoding], type_codes)
+                start = time.perf_counter()
+                cur.copy_expert(statement, stream, size=65536)
+                record['execute_time'] = time.perf_counter() - start
+                record['rows'], record['bytes'] = stream.records, stream.bytes
+                return stream.records
+
+    def _copy_rows(self, target, columns: str = None):
+        if isinstance(target, pd.DataFrame):
+            copy_columns = self._split_columns(columns) or list(target.columns)
+            return target[copy_columns].itertuples(index=False, name=None), copy_columns
+        return target, self._split_columns(columns)
+
+    @staticmethod
+    def _storage_clause(storage) -> str:
+        if not storage:
+            return ''
+        if isinstance(storage, dict):
+            storage = ', '.join('{key}={value}'.format(key=key, value=str(value).lower() if isinstance(value, bool) else value)
+                                for key, value in storage.items())
+        return ' with ({storage})'.format(storage=storage)
+
+    def _distributed_clause(self, distributed_by: str, target, columns: str = None, options: str = None) -> str:
+        if not distributed_by:
+            return ''
+        if distributed_by.lower() == 'auto':
+            # по умолчанию объекты распределяются по inn, чтобы соединения по inn выполнялись без перераспределения
+            if isinstance(target, pd.DataFrame):
+                target_columns = self._split_columns(columns) or list(target.columns)
+            elif isinstance(target, list):
+                target_columns = self._split_columns(columns) or []
+            elif 'create or replace function' in target.lower():
+                target_columns = []
+            else:
+                target_columns = list(self.describe(target, columns, options) or [])
+            if 'inn' not in [x.lower() for x in target_columns]:
+                return ''
+            distributed_by = 'inn'
+        if distributed_by.upper() in ('RANDOMLY', 'REPLICATED'):
+            return '\ndistributed {policy}'.format(policy=distributed_by.lower())
+        return '\ndistributed by ({columns})'.format(columns=distributed_by)
+
+    def enable_cache(self, path: str = '~/.cache/gp', ttl: int = 86400, max_size: int = 1024 ** 3, fmt: str = 'parquet'):
+        '''
+        Метод для включения дискового кэша результатов select_df
+        Записи кэша, ссылающиеся на таблицы, в которые пишет этот коннектор, удаляются автоматически
+
+        Параметры
+        ----------
+        path: str, по умолчанию '~/.cache/gp'; директория кэша
+        ttl: int, по умолчанию 86400; время жизни записи в секундах
+        max_size: int, по умолчанию 1 ГБ; максимальный размер кэша в байтах
+        fmt: str, {'parquet', 'feather', 'pickle'}, по умолчанию 'parquet'; формат файлов кэша
+        '''
+
+        self.cache = QueryCache(path, ttl, max_size, fmt)
+
+    def disable_cache(self):
+        '''
+        Метод для отключения дискового кэша результатов select_df
+        '''
+
+        self.cache = None
+
+    def _invalidate_cache(self, script: str):
+        # удаляем из кэша результаты запросов к таблицам, в которые пишет скрипт
+        if self.cache is None:
+            return
+        for table_name in re.findall(
+                r"(?:^|;)\s*(?:insert\s+into|update|delete\s+from|truncate(?:\s+table)?|copy|"
+                r"refresh\s+materialized\s+view|(?:create|drop|alter)\s+(?:or\s+replace\s+)?(?:materialized\s+view|view|table)"
+                r"(?:\s+if\s+(?:not\s+)?exists)?)\s+([\w.\"]+)", script, flags=re.IGNORECASE):
+            self.cache.invalidate(table_name.replace('"', ''))
+
+    def close(self):
+        '''
+        Метод для закрытия соединений пула
+        '''
+
+        self.pool.closeall()
 
     def select(self, query, limit=100, options: str = None):
         '''
@@ -55,49 +526,218 @@ class GPConnector():
         options: str, по умолчанию None; опции подключения к ДБ
         '''
 
-        with psycopg2.connect(user=self.user, password=self.password, host=self.host, dbname=self.dbname, options=options) as conn:
-            if 'select' not in query.lower():
-                print(pd.read_sql("""select * from {query} limit {limit}""".format(query=query, limit=limit),
-                                  conn).to_string(index=False))
-            else:
-                print(pd.read_sql("""{query} limit {limit}""".format(query=query, limit=limit), conn).to_string(
-                    index=False))
+        query = self._limit_query(query, limit)
+        options = self._options(options, 'interactive_preview')
+        with self._trace('select', query, options) as record, self._connect(options, record) as conn:
+            df = pd.read_sql(query, conn)
+            record['rows'] = len(df)
+        print(df.to_string(index=False))
 
-    def select_list(self, query: str, limit: int = 1000000, options: str = None) -> list:
+    def select_list(self, query: str, limit: int = 1000000, options: str = None, params=None) -> list:
         '''
         Метод для выбора данных в list
 
         Параметры
         ----------
         query: str; sql-запрос
-        limit: int, по умолчанию 1000000; ограничение количества выводимых строк
+        limit: int, по умолчанию 1000000; ограничение количества выводимых строк, None - без ограничения
         options: str, по умолчанию None; опции подключения к ДБ
+        params: tuple или dict, по умолчанию None; значения параметров запроса (%s или %(name)s)
         '''
 
-        with psycopg2.connect(user=self.user, password=self.password, host=self.host, dbname=self.dbname, options=options) as conn:
+        query = self._limit_query(query, limit)
+        with self._trace('select', query, options, params) as record, self._connect(options, record) as conn:
             with conn.cursor() as cur:
-                if 'select' not in query.lower():
-                    cur.execute("""select * from {query} limit {limit}""".format(query=query, limit=limit))
-                else:
-                    cur.execute("""{query} limit {limit}""".format(query=query, limit=limit))
-                return cur.fetchall()
-
-    def select_df(self, query: str, limit: int = 1000000, options: str = None) -> pd.DataFrame:
+                start = time.perf_counter()
+                cur.execute(query, params)
+                record['execute_time'] = time.perf_counter() - start
+                rows = cur.fetchall()
+                record['fetch_time'] = time.perf_counter() - start - record['execute_time']
+                record['rows'] = len(rows)
+                return rows
+
+    def select_df(self, query: str, limit: int = _DEFAULT_LIMIT, options: str = None, chunksize: int = None,
+                  engine: str = None, use_cache: bool = True) -> pd.DataFrame:
         '''
         Метод для выбора данных в датафрейм
 
         Параметры
         ----------
         query: str; sql-запрос
-        limit: int, по умолчанию 1000000; ограничение количества выводимых строк
+        limit: int, по умолчанию 1000000, при указании chunksize - без ограничения; ограничение количества выводимых строк,
+            None - без ограничения
         options: str, по умолчанию None; опции подключения к ДБ
+        chunksize: int, по умолчанию None; при указании возвращается генератор датафреймов по chunksize строк (см. select_iter)
+        engine: str, {'read_sql', 'copy', 'columnar'}, по умолчанию None; способ выборки данных, по умолчанию берется из атрибута fetch_engine:
+            'read_sql' - через pandas.read_sql,
+            'copy' - через COPY (query) TO STDOUT с разбором CSV средствами pandas, значительно быстрее на больших выборках;
+                типы колонок совпадают с read_sql, кроме numeric, который декодируется в Decimal вместо float64,
+            'columnar' - как 'copy', но с типизированными колонками и словарным кодированием (см. select_columnar)
+        use_cache: bool, по умолчанию True; указывает, что можно использовать дисковый кэш результатов, если он включен (см. enable_cache)
         '''
 
-        with psycopg2.connect(user=self.user, password=self.password, host=self.host, dbname=self.dbname, options=options) as conn:
-            if 'select' not in query.lower():
-                return pd.read_sql("""select * from {query} limit {limit}""".format(query=query, limit=limit), conn)
-            else:
-                return pd.read_sql("""{query} limit {limit}""".format(query=query, limit=limit), conn)
+        if chunksize:
+            return self.select_iter(query, chunk_rows=chunksize, as_df=True, limit=None if limit is _DEFAULT_LIMIT else limit,
+                                    options=options)
+        if limit is _DEFAULT_LIMIT:
+            limit = 1000000
+
+        engine = engine or self.fetch_engine
+        if engine not in ('read_sql', 'copy', 'columnar'):
+            raise Exception("ERROR: Укажите способ выборки engine: 'read_sql', 'copy' или 'columnar'!")
+
+        limited_query = self._limit_query(query, limit)
+        cache = self.cache if use_cache else None
+        if cache is not None:
+            df = cache.get(limited_query, options, engine)
+            if df is not None:
+                return df
+
+        if engine == 'copy':
+            df = self._copy_out(limited_query, _read_csv, options)
+        elif engine == 'columnar':
+            df = self.select_columnar(query, limit, options=options)
+        else:
+            with self._trace('select', limited_query, options) as record, self._connect(options, record) as conn:
+                df = pd.read_sql(limited_query, conn)
+                record['rows'] = len(df)
+
+        if cache is not None:
+            cache.put(limited_query, df, options, engine)
+        return df
+
+    def _copy_out(self, query: str, reader, options: str = None):
+        statement = "copy ({query}) to stdout with csv null '\\N'".format(query=query)
+        with self._trace('copy_out', statement, options) as record, self._connect(options, record) as conn:
+            with conn.cursor() as cur:
+                cur.execute("select * from ({query}) as t limit 0".format(query=query))
+                description = cur.description
+                # результат до 64 МБ держим в памяти, больший - во временном файле
+                with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as buffer:
+                    start = time.perf_counter()
+                    cur.copy_expert(statement, buffer, size=65536)
+                    record['execute_time'] = time.perf_counter() - start
+                    record['bytes'] = buffer.tell()
+                    buffer.seek(0)
+                    result = reader(buffer, description, psycopg2.extensions.encodings[conn.encoding])
+                    record['fetch_time'] = time.perf_counter() - start - record['execute_time']
+                    record['rows'] = len(result)
+                    return result
+
+    def select_columnar(self, query: str, limit: int = 1000000, backend: str = 'pandas', categories: list = None,
+                        category_threshold: float = 0.5, options: str = None):
+        '''
+        Метод для выбора данных в колоночном представлении с типизированными колонками
+        Целые числа, дроби, логические значения и даты декодируются в массивы фиксированной ширины,
+        малокардинальные текстовые колонки (например, product_id, crm_segment_type_nm) кодируются словарем
+
+        Параметры
+        ----------
+        query: str; sql-запрос или название таблицы в формате схема.название
+        limit: int, по умолчанию 1000000; ограничение количества выводимых строк, None - без ограничения
+        backend: str, {'pandas', 'arrow'}, по умолчанию 'pandas'; формат результата:
+            'pandas' - датафрейм с nullable-типами и category,
+            'arrow' - pyarrow.Table со словарным кодированием, преобразуется в датафрейм методом to_pandas()
+        categories: list, по умолчанию None; колонки для словарного кодирования, None - текстовые колонки с долей уникальных значений не выше category_threshold
+        category_threshold: float, по умолчанию 0.5; максимальная доля уникальных значений для автоматического словарного кодирования
+        options: str, по умолчанию None; опции подключения к ДБ
+        '''
+
+        return self._copy_out(self._limit_query(query, limit)
+                              , lambda buffer, description, encoding: _read_columnar(buffer, description, encoding, backend,
+                                                                                     categories, category_threshold)
+                              , options)
+
+    def _forget_prepared(self, conn):
+        # пул закрывает соединение: его подготовленные запросы больше недоступны, а id может достаться новому соединению
+        with self._prepared_lock:
+            entry = self._prepared.get(id(conn))
+            if entry is not None and entry[0] is conn:
+                del self._prepared[id(conn)]
+
+    def _prepare(self, conn, query: str) -> str:
+        # подготовленные запросы живут в рамках соединения, поэтому храним их отдельно для каждого соединения пула
+        with self._prepared_lock:
+            entry = self._prepared.get(id(conn))
+            if entry is None or entry[0] is not conn:
+                entry = self._prepared[id(conn)] = (conn, {})
+        statements = entry[1]
+
+        name = statements.get(query)
+        if name is None:
+            name = 'gp_prepared_{id}'.format(id=len(statements))
+            with conn.cursor() as cur:
+                cur.execute("prepare {name} as {query}".format(name=name, query=query))
+            statements[query] = name
+        return name
+
+    def select_prepared(self, query: str, params=(), limit: int = 1000000, as_df: bool = False, options: str = None):
+        '''
+        Метод для выбора данных подготовленным запросом с параметрами
+        Запрос разбирается и планируется один раз на каждом соединении пула (PREPARE), повторные вызовы с другими
+        значениями параметров выполняются через EXECUTE без повторного разбора на мастере
+
+        Параметры
+        ----------
+        query: str; sql-запрос с параметрами $1, $2, ..., например 'select * from prom.stop_dict where stop_cd = $1'
+        params: tuple или list, по умолчанию (); значения параметров запроса
+        limit: int, по умолчанию 1000000; ограничение количества выводимых строк, None - без ограничения
+        as_df: bool, по умолчанию False; указывает, что результат нужно вернуть в виде датафрейма вместо list
+        options: str, по умолчанию None; опции подключения к ДБ
+        '''
+
+        params = list(params) + [limit]
+        # ограничение передается последним параметром, чтобы разные limit использовали один подготовленный запрос
+        query = "{query} limit ${n}".format(query=query, n=len(params))
+        with self._trace('prepared', query, options, params) as record, self._connect(options, record) as conn:
+            name = self._prepare(conn, query)
+            with conn.cursor() as cur:
+                start = time.perf_counter()
+                cur.execute("execute {name} ({params})".format(name=name, params=', '.join(['%s'] * len(params))), params)
+                record['execute_time'] = time.perf_counter() - start
+                rows = cur.fetchall()
+                record['fetch_time'] = time.perf_counter() - start - record['execute_time']
+                record['rows'] = len(rows)
+                if as_df:
+                    return pd.DataFrame(rows, columns=[x.name for x in cur.description])
+                return rows
+
+    def select_iter(self, query: str, chunk_rows: int = 10000, as_df: bool = False, limit: int = None,
+                    options: str = None):
+        '''
+        Метод для потокового выбора данных через серверный курсор
+        Генератор возвращает строки-кортежи или датафреймы по chunk_rows строк, в памяти одновременно находится не более одной порции
+
+        Параметры
+        ----------
+        query: str; sql-запрос или название таблицы в формате схема.название
+        chunk_rows: int, по умолчанию 10000; количество строк, запрашиваемых с сервера за одно обращение
+        as_df: bool, по умолчанию False; указывает, что вместо кортежей нужно возвращать датафреймы по chunk_rows строк
+        limit: int, по умолчанию None; ограничение количества выводимых строк, None - без ограничения
+        options: str, по умолчанию None; опции подключения к ДБ
+        '''
+
+        query = self._limit_query(query, limit)
+        # внутри session() каждый запрос, выполненный между порциями, фиксируется и закрыл бы обычный серверный курсор,
+        # поэтому курсор объявляется WITH HOLD; внутри transaction() фиксации до выхода из транзакции нет
+        withhold = getattr(self._local, 'conn', None) is not None and not self._local.transaction
+        with self._trace('iter', query, options) as record, self._connect(options, record) as conn:
+            with conn.cursor(name='gp_select_iter_{id}'.format(id=uuid.uuid4().hex), withhold=withhold) as cur:
+                cur.itersize = chunk_rows
+                cur.execute(query)
+                record['rows'], record['fetch_time'] = 0, 0.0
+                while True:
+                    start = time.perf_counter()
+                    rows = cur.fetchmany(chunk_rows)
+                    record['fetch_time'] += time.perf_counter() - start
+                    if not rows:
+                        break
+                    record['rows'] += len(rows)
+                    if as_df:
+                        yield pd.DataFrame(rows, columns=[x.name for x in cur.description])
+                    else:
+                        for row in rows:
+                            yield row
 
     def execute(self, script: str, data=None, options: str = None):
         '''
@@ -112,29 +752,98 @@ class GPConnector():
 
         @dispatch(str, object)
         def execute_dispatch(script, options):
-            with psycopg2.connect(user=self.user, password=self.password, host=self.host, dbname=self.dbname, options=options) as conn:
+            with self._trace('execute', script, options) as record, self._connect(options, record) as conn:
                 with conn.cursor() as cur:
                     cur.execute(script)
+                    record['rows'] = self._local.rowcount = cur.rowcount
 
         @dispatch(str, pd.DataFrame, object)
         def execute_dispatch(script, data, options):
             data = [tuple(x) for x in data.get_values()]
 
-            with psycopg2.connect(user=self.user, password=self.password, host=self.host, dbname=self.dbname, options=options) as conn:
+            with self._trace('execute', script, options, data) as record, self._connect(options, record) as conn:
                 with conn.cursor() as cur:
                     cur.execute(script, data)
+                    record['rows'] = self._local.rowcount = cur.rowcount
 
         @dispatch(str, list, object)
         def execute_dispatch(script, data, options):
-            with psycopg2.connect(user=self.user, password=self.password, host=self.host, dbname=self.dbname, options=options) as conn:
+            with self._trace('execute', script, options, data) as record, self._connect(options, record) as conn:
                 with conn.cursor() as cur:
                     cur.execute(script, data)
+                    record['rows'] = self._local.rowcount = cur.rowcount
 
         if data is not None:
             execute_dispatch(script, data, options)
         else:
             execute_dispatch(script, options)
 
+        self._invalidate_catalog_ddl(script)
+        self._invalidate_cache(script)
+
+    def _invalidate_catalog_ddl(self, script: str):
+        # после DDL-команд состав колонок таргетов мог измениться
+        if re.search(r"(?:^|;)\s*(?:create|drop|alter)\s", script, flags=re.IGNORECASE):
+            self._described = {}
+        # объекты, затронутые DDL-командами скрипта, помечаются в кэше каталога как устаревшие
+        for command, object_name in re.findall(
+                r"(?:^|;)\s*(create|drop|alter)\s+(?:or\s+replace\s+)?(?:materialized\s+view|view|table|function)\s+"
+                r"(?:if\s+(?:not\s+)?exists\s+)?([\w.\"]+)", script, flags=re.IGNORECASE):
+            if command.lower() == 'alter':
+                self._invalidate_catalog()
+            else:
+                self._invalidate_catalog(object_name.replace('"', ''))
+
+    def _invalidate_catalog(self, object_name: str = None):
+        with self._catalog_lock:
+            if object_name is None:
+                self._catalog = None
+            else:
+                self._catalog_stale.add(object_name.lower())
+
+    def _set_catalog(self, object_name: str, object_type: str = None):
+        with self._catalog_lock:
+            if self._catalog is not None:
+                key = tuple(object_name.lower().split('.'))
+                if object_type:
+                    self._catalog[key] = object_type.upper()
+                else:
+                    self._catalog.pop(key, None)
+            self._catalog_stale.discard(object_name.lower())
+
+    def refresh_catalog(self) -> dict:
+        '''
+        Метод для загрузки кэша каталога объектов
+        Типы всех таблиц, представлений и функций схем catalog_schemas загружаются одним запросом
+        '''
+
+        catalog = {}
+        for schema_name, object_name, object_type in self.select_list(
+                """select n.nspname, c.relname
+                        , case c.relkind when 'm' then 'MATERIALIZED VIEW' when 'v' then 'VIEW' else 'TABLE' end
+                     from pg_class c
+                     join pg_namespace n on n.oid = c.relnamespace
+                    where n.nspname = any(array['{schemas}']) and c.relkind in ('r', 'v', 'm')
+                   union all
+                   select distinct n.nspname, p.proname, 'FUNCTION'
+                     from pg_proc p
+                     join pg_namespace n on n.oid = p.pronamespace
+                    where n.nspname = any(array['{schemas}'])""".format(schemas="', '".join(self.catalog_schemas)), limit=None):
+            # при совпадении имен берется максимальный тип, как в prom.pg_objects
+            catalog[(schema_name, object_name)] = max(catalog.get((schema_name, object_name), object_type), object_type)
+
+        with self._catalog_lock:
+            self._catalog = catalog
+            self._catalog_loaded = time.time()
+            self._catalog_stale = set()
+        return catalog
+
+    def _get_catalog(self) -> dict:
+        with self._catalog_lock:
+            if self._catalog is not None and time.time() - self._catalog_loaded <= self.catalog_ttl:
+                return self._catalog
+        return self.refresh_catalog()
+
     def get_object_type(self, object_name: str) -> str:
         '''
         Метод для получения типа объекта
@@ -146,12 +855,103 @@ class GPConnector():
         '''
 
         object_schema_tmp, object_name_tmp = object_name.split('.')
+
+        if self.catalog_ttl and object_schema_tmp.lower() in self.catalog_schemas:
+            catalog = self._get_catalog()
+            with self._catalog_lock:
+                stale = object_name.lower() in self._catalog_stale
+            if not stale:
+                return catalog.get((object_schema_tmp.lower(), object_name_tmp.lower()))
+
         object_type = self.select_list(
             """select max(object_type) from prom.pg_objects where schemaname = '{object_schema}' and objectname = '{object_name}'"""
             .format(object_schema=object_schema_tmp, object_name=object_name_tmp))
+        if self.catalog_ttl and object_schema_tmp.lower() in self.catalog_schemas:
+            self._set_catalog(object_name, object_type[0][0] if len(object_type) > 0 else None)
         if len(object_type) > 0:
             return object_type[0][0]
 
+    def get_object_types(self, object_names: list) -> dict:
+        '''
+        Метод для получения типов нескольких объектов за одно обращение к БД
+        Возвращает словарь {название объекта: тип объекта или None, если объект не найден}
+
+        Параметры
+        ----------
+        object_names: list; названия объектов в формате схема.название
+        '''
+
+        object_types = {}
+        unresolved = []
+        if self.catalog_ttl:
+            catalog = self._get_catalog()
+            with self._catalog_lock:
+                stale = set(self._catalog_stale)
+            for object_name in object_names:
+                key = tuple(object_name.lower().split('.'))
+                if key[0] in self.catalog_schemas and object_name.lower() not in stale:
+                    object_types[object_name] = catalog.get(key)
+                else:
+                    unresolved.append(object_name)
+        else:
+            unresolved = list(object_names)
+
+        if unresolved:
+            # как и в get_object_type, названия ищутся в каталоге в переданном регистре
+            keys = [tuple(x.split('.')) for x in unresolved]
+            resolved = {}
+            for schema_name, object_name, object_type in self.select_list(
+                    """with x as (select unnest(%(schemas)s::text[]) as schemaname, unnest(%(names)s::text[]) as objectname)
+                       select x.schemaname, x.objectname
+                            , case c.relkind when 'm' then 'MATERIALIZED VIEW' when 'v' then 'VIEW' else 'TABLE' end
+                         from x
+                         join pg_namespace n on n.nspname = x.schemaname
+                         join pg_class c on c.relnamespace = n.oid and c.relname = x.objectname and c.relkind in ('r', 'v', 'm')
+                       union all
+                       select distinct x.schemaname, x.objectname, 'FUNCTION'
+                         from x
+                         join pg_namespace n on n.nspname = x.schemaname
+                         join pg_proc p on p.pronamespace = n.oid and p.proname = x.objectname"""
+                    , limit=None, params={'schemas': [x[0] for x in keys], 'names': [x[1] for x in keys]}):
+                resolved[(schema_name, object_name)] = max(resolved.get((schema_name, object_name), object_type), object_type)
+
+            for object_name, key in zip(unresolved, keys):
+                object_types[object_name] = resolved.get(key)
+                if self.catalog_ttl and key[0] in self.catalog_schemas:
+                    self._set_catalog(object_name, resolved.get(key))
+
+        return object_types
+
+    def get_source_codes(self, object_names: list) -> dict:
+        '''
+        Метод для получения исходного кода нескольких представлений и функций за одно обращение к БД
+        Возвращает словарь {название объекта: исходный код или None, если объект не найден или является таблицей}
+
+        Параметры
+        ----------
+        object_names: list; названия объектов в формате схема.название
+        '''
+
+        # как и в get_object_type, названия ищутся в каталоге в переданном регистре
+        keys = [tuple(x.split('.')) for x in object_names]
+        source_codes = {}
+        for schema_name, object_name, source_code in self.select_list(
+                """with x as (select unnest(%(schemas)s::text[]) as schemaname, unnest(%(names)s::text[]) as objectname)
+                   select x.schemaname, x.objectname, pg_get_viewdef(c.oid)
+                     from x
+                     join pg_namespace n on n.nspname = x.schemaname
+                     join pg_class c on c.relnamespace = n.oid and c.relname = x.objectname and c.relkind in ('v', 'm')
+                   union all
+                   select x.schemaname, x.objectname, (array_agg(p.prosrc order by p.oid desc))[1]
+                     from x
+                     join pg_namespace n on n.nspname = x.schemaname
+                     join pg_proc p on p.pronamespace = n.oid and p.proname = x.objectname
+                    group by x.schemaname, x.objectname"""
+                , limit=None, params={'schemas': [x[0] for x in keys], 'names': [x[1] for x in keys]}):
+            source_codes[(schema_name, object_name)] = source_code.strip() if source_code is not None else None
+
+        return {object_name: source_codes.get(key) for object_name, key in zip(object_names, keys)}
+
     def get_source_code(self, object_name: str) -> str:
         '''
         Метод для вывода исходного кода объекта на печать
@@ -161,29 +961,26 @@ class GPConnector():
         '''
 
         object_type = self.get_object_type(object_name)
-        object_schema_tmp, object_name_tmp = object_name.split('.')
 
         if object_type == 'TABLE':
             print('WARNING: Объект {object_name} является таблицей'.format(object_name=object_name))
         else:
-            source_code = self.select_df("""select max(definition) from prom.pg_objects 
-                                         where schemaname = '{object_schema}' and objectname = '{object_name}' and object_type = '{object_type}'"""
-                                         .format(object_schema=object_schema_tmp
-                                                 , object_name=object_name_tmp
-                                                 , object_type=object_type)).get_values()[0][0].strip()
+            source_code = self.get_source_codes([object_name])[object_name]
 
             if source_code is not None:
                 return source_code
             else:
                 print('WARNING: Исходный код не найден')
 
-    def create(self, object_type: str, object_name: str, target, columns: str = None, options: str = None):
+    def create(self, object_type: str, object_name: str, target, columns: str = None, options: str = None,
+               method: str = 'values', distributed_by: str = 'auto', storage=None):
         '''
         Метод для создания объектов
 
         Параметры
         ----------
-        object_type: str, {MATERIALIZED VIEW', 'VIEW', 'TABLE', 'FUNCTION'}; тип объекта
+        object_type: str, {MATERIALIZED VIEW', 'VIEW', 'TABLE', 'TEMPORARY TABLE', 'FUNCTION'}; тип объекта,
+            'TEMPORARY TABLE' создается без схемы и доступна только внутри сессии (см. session)
         object_name: str; название объекта в формате схема.название
         target: sql-код запроса
             или название таблицы в формате схема.название
@@ -193,6 +990,19 @@ class GPConnector():
             данные для создания объекта
         columns: str, по умолчанию None; список колонок в созданной таблице в формате 'col1, col2, col3'
         options: str, по умолчанию None; опции подключения к ДБ
+        method: str, {'values', 'copy', 'binary'}, по умолчанию 'values'; способ загрузки list/датафрейма:
+            'values' - одним запросом insert ... values,
+            'copy' - потоково через COPY FROM STDIN в текстовом формате,
+            'binary' - потоково через COPY FROM STDIN в бинарном формате;
+            типы колонок при загрузке через COPY определяются по первым copy_sample_size строкам
+        distributed_by: str, по умолчанию 'auto'; ключ распределения таблицы/материализованного представления:
+            'auto' - DISTRIBUTED BY (inn), если в объекте есть колонка inn, иначе распределение по умолчанию,
+            'RANDOMLY' - DISTRIBUTED RANDOMLY, 'REPLICATED' - DISTRIBUTED REPLICATED,
+            список колонок в формате 'col1, col2' - DISTRIBUTED BY (col1, col2),
+            None - распределение по умолчанию
+        storage: dict или str, по умолчанию None; параметры хранения WITH (...), например
+            {'appendoptimized': True, 'orientation': 'column', 'compresstype': 'zstd', 'compresslevel': 1}
+            или 'appendoptimized=true, orientation=column'
         '''
 
         @dispatch(str, str, pd.DataFrame, object)
@@ -202,11 +1012,13 @@ class GPConnector():
 
             target_records = ", ".join(["%s"] * len(target))
 
-            self.execute("""create {object_type} {object_name} as
-                         select {columns} from (VALUES {target_records}) AS t ({columns})"""
+            self.execute("""create {object_type} {object_name}{storage} as
+                         select {columns} from (VALUES {target_records}) AS t ({columns}){distributed}"""
                          .format(columns=target_columns
                                  , object_type=object_type
                                  , object_name=object_name
+                                 , storage=storage_sql
+                                 , distributed=distributed_sql
                                  , target_records=target_records), target, options=options)
 
         @dispatch(str, str, pd.DataFrame, str, object)
@@ -216,23 +1028,27 @@ class GPConnector():
 
             target_records = ", ".join(["%s"] * len(target))
 
-            self.execute("""create {object_type} {object_name} as
-                         select {columns} from (VALUES {target_records}) AS t ({target_columns})"""
+            self.execute("""create {object_type} {object_name}{storage} as
+                         select {columns} from (VALUES {target_records}) AS t ({target_columns}){distributed}"""
                          .format(columns=columns
                                  , target_columns=target_columns
                                  , object_type=object_type
                                  , object_name=object_name
+                                 , storage=storage_sql
+                                 , distributed=distributed_sql
                                  , target_records=target_records), target, options=options)
 
         @dispatch(str, str, list, str, object)
         def create_dispatch(object_type, object_name, target, columns, options):
             target_records = ", ".join(["%s"] * len(target))
 
-            self.execute("""create {object_type} {object_name} as
-                         select {columns} from (VALUES {target_records}) AS t ({columns})"""
+            self.execute("""create {object_type} {object_name}{storage} as
+                         select {columns} from (VALUES {target_records}) AS t ({columns}){distributed}"""
                          .format(columns=columns
                                  , object_type=object_type
                                  , object_name=object_name
+                                 , storage=storage_sql
+                                 , distributed=distributed_sql
                                  , target_records=target_records), target, options=options)
 
         @dispatch(str, str, str, object)
@@ -245,13 +1061,16 @@ class GPConnector():
                     self.execute(target.format(function_name=object_name), options=options)
             else:
                 if 'select' not in target.lower():
-                    self.execute("""create {object_type} {object_name} as
-                                 select * from {source_name}""".format(object_type=object_type
+                    self.execute("""create {object_type} {object_name}{storage} as
+                                 select * from {source_name}{distributed}""".format(object_type=object_type
                                                                        , source_name=target
-                                                                       , object_name=object_name), options=options)
+                                                                       , object_name=object_name
+                                                                       , storage=storage_sql
+                                                                       , distributed=distributed_sql), options=options)
                 else:
-                    self.execute("""create {object_type} {object_name} as
-                                 {sql}""".format(object_type=object_type, object_name=object_name, sql=target), options=options)
+                    self.execute("""create {object_type} {object_name}{storage} as
+                                 {sql}{distributed}""".format(object_type=object_type, object_name=object_name, sql=target.rstrip().rstrip(';'),
+                                                                     storage=storage_sql, distributed=distributed_sql), options=options)
 
         @dispatch(str, str, str, str, object)
         def create_dispatch(object_type, object_name, target, columns, options):
@@ -263,29 +1082,78 @@ class GPConnector():
                     self.execute(target.format(function_name=object_name), options=options)
             else:
                 if 'select' not in target.lower():
-                    self.execute("""create {object_type} {object_name} as
-                                 select {columns} from {source_name}""".format(object_type=object_type
+                    self.execute("""create {object_type} {object_name}{storage} as
+                                 select {columns} from {source_name}{distributed}""".format(object_type=object_type
                                                                                , source_name=target
                                                                                , columns=columns
-                                                                               , object_name=object_name), options=options)
+                                                                               , object_name=object_name
+                                                                               , storage=storage_sql
+                                                                               , distributed=distributed_sql), options=options)
                 else:
-                    self.execute("""create {object_type} {object_name} as
-                                 select {columns} from ({sql}) as t""".format(object_type=object_type
+                    self.execute("""create {object_type} {object_name}{storage} as
+                                 select {columns} from ({sql}) as t{distributed}""".format(object_type=object_type
                                                                               , object_name=object_name
-                                                                              , sql=target
+                                                                              , storage=storage_sql
+                                                                              , distributed=distributed_sql
+                                                                              , sql=target.rstrip().rstrip(';')
                                                                               , columns=columns), options=options)
 
-        self.drop(object_name)
+        def create_copy(object_type, object_name, target, columns, options):
+            if object_type.upper() not in ('TABLE', 'TEMPORARY TABLE', 'TEMP TABLE'):
+                raise Exception("ERROR: Загрузка через COPY доступна только для объектов с типом 'TABLE'!")
+            if isinstance(target, pd.DataFrame):
+                target_columns = ', '.join(list(target.columns))
+                target_sample = list(target.head(self.copy_sample_size).itertuples(index=False, name=None))
+            elif columns:
+                target_columns = columns
+                target_sample = target[:self.copy_sample_size]
+            else:
+                raise Exception("ERROR: Для создания таблицы из list необходимы названия колонок!")
+            if not target_sample:
+                raise Exception("ERROR: Для создания таблицы через COPY таргет не должен быть пустым!")
+
+            self.execute("""create {object_type} {object_name}{storage} as
+                         select {columns} from (VALUES {target_records}) AS t ({target_columns}) limit 0{distributed}"""
+                         .format(columns=columns or target_columns
+                                 , target_columns=target_columns
+                                 , object_type=object_type
+                                 , object_name=object_name
+                                 , storage=storage_sql
+                                 , distributed=distributed_sql
+                                 , target_records=", ".join(["%s"] * len(target_sample))), target_sample, options=options)
+            rows, copy_columns = self._copy_rows(target, columns)
+            return self._copy(object_name, rows, copy_columns, method, options)
+
+        if method not in ('values', 'copy', 'binary'):
+            raise Exception("ERROR: Укажите способ загрузки method: 'values', 'copy' или 'binary'!")
+
+        storage_sql, distributed_sql = '', ''
+        if object_type.upper() in ('TABLE', 'TEMPORARY TABLE', 'TEMP TABLE', 'MATERIALIZED VIEW'):
+            storage_sql = self._storage_clause(storage)
+            distributed_sql = self._distributed_clause(distributed_by, target, columns, options)
+
+        if object_type.upper() in ('TEMPORARY TABLE', 'TEMP TABLE'):
+            self.execute("drop table if exists {object_name}".format(object_name=object_name), options=options)
+        else:
+            self.drop(object_name)
 
-        if columns:
+        self._local.rowcount = None
+        if method != 'values' and isinstance(target, (pd.DataFrame, list)):
+            self._local.rowcount = create_copy(object_type, object_name, target, columns, options)
+        elif columns:
             create_dispatch(object_type, object_name, target, columns, options)
         else:
             create_dispatch(object_type, object_name, target, options)
 
+        if '.' in object_name:
+            self._set_catalog(object_name, object_type)
+        if object_type.upper() in ('TABLE', 'TEMPORARY TABLE', 'TEMP TABLE', 'MATERIALIZED VIEW'):
+            self._auto_analyze(object_name, self._local.rowcount, options)
+
         print('SUCCESS: Объект {object_type} {object_name} создан'.format(object_type=object_type.upper()
                                                                           , object_name=object_name))
 
-    def insert(self, table_name: str, target, columns: str = None, options: str = None):
+    def insert(self, table_name: str, target, columns: str = None, options: str = None, method: str = 'values'):
         '''
         Метод для вставки записей в таблицу
 
@@ -299,6 +1167,10 @@ class GPConnector():
             данные для создания объекта
         columns: str; названия колонок для заполнения в формате 'col1, col2, col3'
         options: str, по умолчанию None; опции подключения к ДБ
+        method: str, {'values', 'copy', 'binary'}, по умолчанию 'values'; способ загрузки list/датафрейма:
+            'values' - одним запросом insert ... values,
+            'copy' - потоково через COPY FROM STDIN в текстовом формате,
+            'binary' - потоково через COPY FROM STDIN в бинарном формате
         '''
 
         @dispatch(str, pd.DataFrame, object)
@@ -368,10 +1240,18 @@ class GPConnector():
                                      , columns=columns
                                      , sql=target), options=options)
 
-        if columns:
+        if method not in ('values', 'copy', 'binary'):
+            raise Exception("ERROR: Укажите способ загрузки method: 'values', 'copy' или 'binary'!")
+
+        self._local.rowcount = None
+        if method != 'values' and isinstance(target, (pd.DataFrame, list)):
+            rows, copy_columns = self._copy_rows(target, columns)
+            self._local.rowcount = self._copy(table_name, rows, copy_columns, method, options)
+        elif columns:
             insert_dispatch(table_name, target, columns, options)
         else:
             insert_dispatch(table_name, target, options)
+        self._auto_analyze(table_name, self._local.rowcount, options)
 
         print('SUCCESS: Вставка записей в таблицу {table_name} завершена'.format(table_name=table_name))
 
@@ -388,6 +1268,34 @@ class GPConnector():
         self.execute("truncate {table_name}".format(table_name=table_name), options=options)
         print('SUCCESS: Таблица {table_name} очищена'.format(table_name=table_name))
 
+    def analyze(self, table_name: str, columns: list = None, options: str = None):
+        '''
+        Метод для сбора статистики таблицы
+
+        Параметры
+        ----------
+        table_name: str; название таблицы в формате схема.название
+        columns: list, по умолчанию None; колонки, по которым собирается статистика, None - все колонки
+        options: str, по умолчанию None; опции подключения к ДБ
+        '''
+
+        self.execute("analyze {table_name}{columns}".format(table_name=table_name
+                                                            , columns=' ({columns})'.format(columns=', '.join(columns)) if columns else '')
+                     , options=options)
+
+    def _auto_analyze(self, table_name: str, rows: int = None, options: str = None):
+        # без статистики оптимизатор считает только что загруженные таблицы пустыми и выбирает broadcast
+        policy = self.analyze_policy
+        if policy in (None, 'never'):
+            return
+        if policy != 'always' and rows is not None and 0 <= rows <= policy:
+            return
+        columns = None
+        if self.analyze_columns:
+            table_columns = self.describe(table_name, options=options) or {}
+            columns = [x for x in self.analyze_columns if x in table_columns] or None
+        self.analyze(table_name, columns, options)
+
     def drop(self, object_name: str, options: str = None):
         '''
         Метод для удаления объектов
@@ -403,6 +1311,7 @@ class GPConnector():
             self.execute("""drop {object_type} if exists {object_name} restrict""".format(object_type=object_type,
                                                                                           object_name=object_name)
                          , options=options)
+            self._set_catalog(object_name)
             print('SUCCESS: Объект {object_type} {object_name} удален'.format(object_type=object_type.upper(),
                                                                               object_name=object_name))
 
@@ -419,11 +1328,130 @@ class GPConnector():
         object_type = self.get_object_type(object_name)
         if object_type == 'MATERIALIZED VIEW':
             self.execute("refresh materialized view {object_name}".format(object_name=object_name), options=options)
+            self._auto_analyze(object_name, None, options)
             print('SUCCESS: MATERIALIZED VIEW {object_name} обновлена'.format(object_name=object_name))
         else:
             print('WARNING: Объект {object_name} с типом {object_type} не обновляется этим методом'.format(
                 object_name=object_name, object_type=object_type.upper()))
 
+    def run_many(self, queries: list, max_workers: int = 4, fetch: str = None, options: str = None) -> list:
+        '''
+        Метод для параллельного выполнения списка запросов на соединениях из пула
+        Результаты возвращаются в порядке запросов, ошибки возвращаются на месте результата в виде объектов исключений
+
+        Параметры
+        ----------
+        queries: list; список sql-запросов/скриптов или функций без аргументов
+        max_workers: int, по умолчанию 4; максимальное количество одновременно выполняемых запросов, не больше размера пула соединений
+        fetch: str, {None, 'list', 'df'}, по умолчанию None; способ выполнения sql-запросов:
+            None - как скрипт через execute,
+            'list' - через select_list без ограничения строк,
+            'df' - через select_df без ограничения строк
+        options: str, по умолчанию None; опции подключения к ДБ
+        '''
+
+        operations = list(getattr(self._local, 'operations', None) or [])
+        workloads = list(getattr(self._local, 'workloads', None) or [])
+
+        def run(query):
+            # запросы в потоках пула относятся к той же операции и профилю нагрузки, что и вызов run_many
+            self._local.operations = list(operations)
+            self._local.workloads = list(workloads)
+            try:
+                if callable(query):
+                    return query()
+                elif fetch == 'list':
+                    return self.select_list(query, limit=None, options=options)
+                elif fetch == 'df':
+                    return self.select_df(query, limit=None, options=options)
+                else:
+                    return self.execute(query, options=options)
+            except Exception as error:
+                return error
+
+        if fetch not in (None, 'list', 'df'):
+            raise Exception("ERROR: Укажите способ выполнения fetch: None, 'list' или 'df'!")
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, self.pool.max_size))) as executor:
+            results = list(executor.map(run, queries))
+
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                print('WARNING: Запрос №{i} завершился ошибкой: {error}'.format(i=i, error=result))
+
+        return results
+
+    def table_health(self, object_names=None, scan: bool = True, max_workers: int = 4, options: str = None) -> pd.DataFrame:
+        '''
+        Метод для получения отчета о распределении по сегментам, размере и статистике таблиц
+        Возвращает датафрейм с колонками:
+            table_name, distributed_by - название таблицы и ключ распределения,
+            rows, segments, empty_segments, min_segment_rows, max_segment_rows - количество строк всего и по сегментам (gp_segment_id),
+            skew_coefficient - коэффициент перекоса: выборочное стандартное отклонение (ddof=1, как stddev в gp_toolkit.gp_skew_coefficients)
+                количества строк по всем первичным сегментам, включая пустые, деленное на среднее и умноженное на 100,
+            max_to_avg - отношение максимального количества строк на сегменте к среднему,
+            size_bytes - размер таблицы на диске с индексами и toast,
+            bloat_ratio - отношение фактического количества страниц к ожидаемому (gp_toolkit.gp_bloat_expected_pages, только heap-таблицы),
+            estimated_rows, last_analyzed - количество строк по статистике и время последнего ANALYZE,
+            stats_stale - статистика отсутствует или расходится с фактическим количеством строк более чем на 20%
+
+        Параметры
+        ----------
+        object_names: str или list, по умолчанию None; названия таблиц в формате схема.название или шаблоны LIKE,
+            None - шаблоны из атрибута health_patterns
+        scan: bool, по умолчанию True; указывает, что нужно посчитать строки по сегментам (полное чтение каждой таблицы),
+            при False отчет строится только по каталогу
+        max_workers: int, по умолчанию 4; количество таблиц, сканируемых одновременно
+        options: str, по умолчанию None; опции подключения к ДБ
+        '''
+
+        if isinstance(object_names, str):
+            object_names = [object_names]
+
+        df = self.select_df(
+            """select n.nspname || '.' || c.relname as table_name
+                    , pg_get_table_distributedby(c.oid) as distributed_by
+                    , (select count(*) from gp_segment_configuration where role = 'p' and content >= 0) as segments
+                    , pg_total_relation_size(c.oid) as size_bytes
+                    , b.btdrelpages::float / nullif(b.btdexppages, 0) as bloat_ratio
+                    , c.reltuples::bigint as estimated_rows
+                    , (select max(o.statime)
+                         from pg_stat_last_operation o
+                        where o.classid = 'pg_class'::regclass and o.objid = c.oid and o.staactionname = 'ANALYZE') as last_analyzed
+                 from pg_class c
+                 join pg_namespace n on n.oid = c.relnamespace
+                 left join gp_toolkit.gp_bloat_expected_pages b on b.btdrelid = c.oid
+                where c.relkind = 'r'
+                  and n.nspname || '.' || c.relname like any(array['{patterns}'])
+                  and not exists (select 1 from pg_inherits i where i.inhrelid = c.oid)
+                order by 1""".format(patterns="', '".join(object_names or self.health_patterns))
+            , limit=None, options=options, engine='read_sql', use_cache=False)
+
+        for column in ('rows', 'empty_segments', 'min_segment_rows', 'max_segment_rows', 'skew_coefficient', 'max_to_avg'):
+            df[column] = np.nan
+        if scan and len(df) > 0:
+            results = self.run_many(["select gp_segment_id, count(*) from {table_name} group by 1".format(table_name=x)
+                                     for x in df['table_name']], max_workers=max_workers, fetch='list', options=options)
+            for i, result in enumerate(results):
+                if isinstance(result, Exception):
+                    continue
+                # сегменты без строк в результат group by не попадают
+                counts = np.array([x[1] for x in result] + [0] * (int(df.at[i, 'segments']) - len(result)), dtype=float)
+                mean = counts.mean() if len(counts) else 0
+                df.at[i, 'rows'] = counts.sum()
+                df.at[i, 'empty_segments'] = (counts == 0).sum()
+                df.at[i, 'min_segment_rows'] = counts.min() if len(counts) else 0
+                df.at[i, 'max_segment_rows'] = counts.max() if len(counts) else 0
+                df.at[i, 'skew_coefficient'] = counts.std(ddof=1) / mean * 100 if mean and len(counts) > 1 else 0
+                df.at[i, 'max_to_avg'] = counts.max() / mean if mean else 0
+
+        rows = df['rows'].fillna(df['estimated_rows'])
+        df['stats_stale'] = df['last_analyzed'].isnull() \
+                            | ((df['estimated_rows'] - rows).abs() > 0.2 * rows.clip(lower=1))
+        return df[['table_name', 'distributed_by', 'rows', 'segments', 'empty_segments', 'min_segment_rows',
+                   'max_segment_rows', 'skew_coefficient', 'max_to_avg', 'size_bytes', 'bloat_ratio', 'estimated_rows',
+                   'last_analyzed', 'stats_stale']]
+
     def explain(self, query: str, analyze: bool = False, options: str = None):
         '''
         Метод для вывода плана запроса
@@ -435,13 +1463,94 @@ class GPConnector():
         options: str, по умолчанию None; опции подключения к ДБ
         '''
 
-        with psycopg2.connect(user=self.user, password=self.password, host=self.host, dbname=self.dbname, options=options) as conn:
-            if analyze:
-                plan = pd.read_sql('explain analyze {query}'.format(query=query), conn)
-            else:
-                plan = pd.read_sql('explain {query}'.format(query=query), conn)
+        statement = '{explain} {query}'.format(explain='explain analyze' if analyze else 'explain', query=query)
+        with self._trace('explain', statement, options) as record, self._connect(options, record) as conn:
+            plan = pd.read_sql(statement, conn)
             print('\n'.join([x for x in plan['QUERY PLAN']]))
 
+    def explain_plan(self, query: str, analyze: bool = False, fmt: str = 'json', options: str = None):
+        '''
+        Метод для получения разобранного плана запроса с анализом motion-операций и перекосов
+        Для fmt='json' возвращает экземпляр класса QueryPlan: узлы плана с оценкой и фактом строк, слайсами,
+        Redistribute/Broadcast Motion, сбросом на диск и перекосом по сегментам (атрибут nodes), список проблем - метод summary
+        Внутри session/transaction план строится в точке сохранения (SAVEPOINT), которая затем откатывается
+
+        Параметры
+        ----------
+        query: str; sql-запрос
+        analyze: bool, по умолчанию False; указывает, что запрос нужно выполнить для получения фактического количества строк и времени
+        fmt: str, {'json', 'text'}, по умолчанию 'json'; формат результата: разобранный план или текст плана
+        options: str, по умолчанию None; опции подключения к ДБ
+        '''
+
+        if fmt not in ('json', 'text'):
+            raise Exception("ERROR: Укажите формат плана fmt: 'json' или 'text'!")
+
+        statement = 'explain ({analyze}format {fmt}) {query}'.format(analyze='analyze, ' if analyze else '', fmt=fmt, query=query)
+        # внутри session/transaction план строится в точке сохранения: ошибка EXPLAIN не прерывает транзакцию вызывающего кода,
+        # а изменения, сделанные EXPLAIN ANALYZE, откатываются
+        pinned = getattr(self._local, 'conn', None) is not None
+        with self._trace('explain', statement, options) as record, self._connect(options, record) as conn:
+            with conn.cursor() as cur:
+                if pinned:
+                    cur.execute("savepoint gp_explain")
+                try:
+                    cur.execute(statement)
+                    rows = cur.fetchall()
+                finally:
+                    if pinned:
+                        cur.execute("rollback to savepoint gp_explain")
+                        cur.execute("release savepoint gp_explain")
+
+        if fmt == 'text':
+            return '\n'.join(x[0] for x in rows)
+        return QueryPlan(rows[0][0])
+
+    def describe(self, target: str, columns: str = None, options: str = None) -> dict:
+        '''
+        Метод для получения колонок и типов таргета за одно обращение к БД
+        Возвращает словарь {название колонки: OID типа} в порядке колонок или None, если таргет некорректен;
+        результат запоминается для текста таргета и сбрасывается после DDL-команд, выполненных через этот коннектор
+
+        Параметры
+        ----------
+        target: str; sql-код запроса или название таблицы в формате схема.название
+        columns: str, по умолчанию None; список колонок таргета в формате 'col1, col2, col3', None - все колонки
+        options: str, по умолчанию None; опции подключения к ДБ
+        '''
+
+        key = (target, columns)
+        if key in self._described:
+            return self._described[key]
+
+        if 'select' not in target.lower():
+            query = "select {columns} from {source_name} limit 0".format(columns=columns or '*', source_name=target)
+        else:
+            query = "select {columns} from ({sql}) as t limit 0".format(columns=columns or '*', sql=target)
+        # внутри session()/transaction() ошибка пробного запроса откатывается до точки сохранения,
+        # чтобы не прервать транзакцию вызывающего кода
+        pinned = getattr(self._local, 'conn', None) is not None
+        try:
+            with self._trace('describe', query, options) as record, self._connect(options, record) as conn:
+                with conn.cursor() as cur:
+                    if pinned:
+                        cur.execute("savepoint gp_describe")
+                    try:
+                        cur.execute(query)
+                        description = {x.name: x.type_code for x in cur.description}
+                    except psycopg2.Error:
+                        if pinned:
+                            cur.execute("rollback to savepoint gp_describe")
+                        raise
+                    finally:
+                        if pinned:
+                            cur.execute("release savepoint gp_describe")
+        except psycopg2.Error:
+            return None
+
+        self._described[key] = description
+        return description
+
     def validate_target(self
                         , target
                         , check_df: bool = True
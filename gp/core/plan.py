@@ -0,0 +1,153 @@
+import json
+import pandas as pd
+
+# ключи плана Greenplum, по которым определяются сброс на диск и перекос по сегментам
+_SPILL_KEYS = ('Workfile Spilling', 'Spill Files', 'Spilled Batches', 'Disk Usage')
+_MAX_ROWS_KEYS = ('Actual Max Rows', 'Max Rows', 'Rows Max')
+_AVG_ROWS_KEYS = ('Actual Avg Rows', 'Avg Rows', 'Rows Avg')
+
+
+def _first(node: dict, keys):
+    for key in keys:
+        if node.get(key) is not None:
+            return node[key]
+
+
+def _is_spilled(node: dict) -> bool:
+    if any(node.get(key) for key in _SPILL_KEYS):
+        return True
+    if node.get('Sort Space Type') == 'Disk':
+        return True
+    return (node.get('Hash Batches') or 1) > 1
+
+
+def _flatten(node: dict, nodes: list, parent_id: int = None, depth: int = 0, slice_id: int = 0):
+    node_id = len(nodes)
+    node_type = node.get('Node Type', '')
+    motion = node_type.split(' ')[0] if node_type.endswith('Motion') else None
+    slice_id = node.get('Slice', slice_id)
+    actual_rows = node.get('Actual Rows')
+    segments = node.get('Segments') or node.get('Senders')
+    max_rows = _first(node, _MAX_ROWS_KEYS)
+    avg_rows = _first(node, _AVG_ROWS_KEYS)
+    if avg_rows is None and actual_rows is not None and segments:
+        avg_rows = actual_rows / segments
+
+    nodes.append({'node_id': node_id
+                  , 'parent_id': parent_id
+                  , 'depth': depth
+                  , 'node_type': node_type
+                  , 'slice': slice_id
+                  , 'motion': motion
+                  , 'senders': node.get('Senders')
+                  , 'receivers': node.get('Receivers')
+                  , 'hash_key': ', '.join(node['Hash Key']) if isinstance(node.get('Hash Key'), list) else node.get('Hash Key')
+                  , 'relation': '.'.join(x for x in (node.get('Schema'), node.get('Relation Name')) if x) or None
+                  , 'join_type': node.get('Join Type')
+                  , 'total_cost': node.get('Total Cost')
+                  , 'plan_rows': node.get('Plan Rows')
+                  , 'actual_rows': actual_rows
+                  , 'rows_ratio': actual_rows / max(node.get('Plan Rows') or 1, 1) if actual_rows is not None else None
+                  , 'actual_time': node.get('Actual Total Time')
+                  , 'max_segment_rows': max_rows
+                  , 'skew': max_rows / avg_rows if max_rows is not None and avg_rows else None
+                  , 'spill': _is_spilled(node)})
+
+    for child in node.get('Plans', []):
+        _flatten(child, nodes, node_id, depth + 1, slice_id)
+
+
+class QueryPlan(object):
+    '''
+    Класс разобранного плана запроса Greenplum
+    Строится из результата EXPLAIN (FORMAT JSON) методом GPConnector.explain_plan
+
+    Параметры
+    ----------
+    plan: list или str; результат EXPLAIN (FORMAT JSON)
+    broadcast_threshold: int, по умолчанию 100000; количество строк, при превышении которого Broadcast Motion считается тяжелым
+    redistribute_threshold: int, по умолчанию 10000000; количество строк, при превышении которого Redistribute Motion считается тяжелым
+    skew_threshold: float, по умолчанию 2; отношение максимального количества строк на сегменте к среднему, при превышении которого узел считается перекошенным
+    misestimate_threshold: float, по умолчанию 10; кратность расхождения оценки и факта строк, при превышении которой оценка считается ошибочной
+
+    Атрибуты
+    ----------
+    raw: dict; исходный план в формате JSON
+    nodes: датафрейм; узлы плана в порядке обхода дерева с оценкой и фактом строк, слайсами, motion-операциями, сбросом на диск и перекосом
+    slices: int; количество слайсов плана
+    planning_time: float; время планирования в мс (только для analyze)
+    execution_time: float; время выполнения в мс (только для analyze)
+
+    Методы
+    ----------
+    summary: метод для получения списка проблемных узлов плана
+    show: метод для вывода дерева плана на печать
+    '''
+
+    def __init__(self, plan, broadcast_threshold: int = 100000, redistribute_threshold: int = 10000000,
+                 skew_threshold: float = 2, misestimate_threshold: float = 10):
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        self.raw = plan[0] if isinstance(plan, list) else plan
+        self.broadcast_threshold = broadcast_threshold
+        self.redistribute_threshold = redistribute_threshold
+        self.skew_threshold = skew_threshold
+        self.misestimate_threshold = misestimate_threshold
+
+        self._nodes = []
+        _flatten(self.raw['Plan'], self._nodes)
+        self.nodes = pd.DataFrame(self._nodes)
+        self.slices = len(set(x['slice'] for x in self._nodes))
+        self.planning_time = self.raw.get('Planning Time')
+        self.execution_time = self.raw.get('Execution Time', self.raw.get('Total Runtime'))
+
+    def summary(self, verbose: bool = True) -> pd.DataFrame:
+        '''
+        Метод для получения списка проблемных узлов плана: тяжелые Broadcast/Redistribute Motion,
+        сброс на диск, перекос строк по сегментам и ошибки оценки количества строк
+
+        Параметры
+        ----------
+        verbose: bool, по умолчанию True; указывает, что найденные проблемы нужно вывести на печать
+        '''
+
+        issues = []
+        for node in self._nodes:
+            rows = node['actual_rows'] if node['actual_rows'] is not None else node['plan_rows']
+            if node['motion'] == 'Broadcast' and rows and rows > self.broadcast_threshold:
+                issues.append((node['node_id'], node['node_type'], 'broadcast',
+                               'Broadcast {rows:.0f} строк на {receivers} сегментов'.format(rows=rows, receivers=node['receivers'])))
+            if node['motion'] == 'Redistribute' and rows and rows > self.redistribute_threshold:
+                issues.append((node['node_id'], node['node_type'], 'redistribute',
+                               'Redistribute {rows:.0f} строк по ключу {hash_key}'.format(rows=rows, hash_key=node['hash_key'])))
+            if node['spill']:
+                issues.append((node['node_id'], node['node_type'], 'spill', 'Сброс промежуточных данных на диск'))
+            if node['skew'] is not None and node['skew'] > self.skew_threshold:
+                issues.append((node['node_id'], node['node_type'], 'skew',
+                               'Перекос по сегментам: максимум в {skew:.1f} раз больше среднего'.format(skew=node['skew'])))
+            if node['rows_ratio'] is not None and node['plan_rows'] \
+                    and not 1 / self.misestimate_threshold <= node['rows_ratio'] <= self.misestimate_threshold:
+                issues.append((node['node_id'], node['node_type'], 'misestimate',
+                               'Оценка {plan_rows:.0f} строк, факт {actual_rows:.0f}'.format(plan_rows=node['plan_rows'],
+                                                                                          actual_rows=node['actual_rows'])))
+
+        issues = pd.DataFrame(issues, columns=['node_id', 'node_type', 'issue', 'detail'])
+        if verbose:
+            for issue in issues.itertuples(index=False):
+                print('WARNING: Узел {node_id} ({node_type}): {detail}'.format(node_id=issue.node_id, node_type=issue.node_type,
+                                                                               detail=issue.detail))
+        return issues
+
+    def show(self):
+        '''
+        Метод для вывода дерева плана на печать
+        '''
+
+        for node in self._nodes:
+            rows = 'rows={plan_rows:.0f}'.format(plan_rows=node['plan_rows'] or 0)
+            if node['actual_rows'] is not None:
+                rows += ' actual={actual_rows:.0f}'.format(actual_rows=node['actual_rows'])
+            print('{indent}-> {node_type}{relation} (slice{slice}, {rows}){spill}'
+                  .format(indent='   ' * node['depth'], node_type=node['node_type']
+                          , relation=' on ' + node['relation'] if node['relation'] else ''
+                          , slice=node['slice'], rows=rows, spill=' [spill]' if node['spill'] else ''))
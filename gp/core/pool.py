@@ -0,0 +1,239 @@
+import time
+import threading
+from contextlib import contextmanager
+import psycopg2
+
+class ConnectionPool(object):
+    '''
+    Класс пула соединений с БД
+    Соединения группируются в подпулы по строке опций подключения, общий размер пула ограничен max_size
+
+    Параметры
+    ----------
+    user: имя пользователя
+    password: пароль пользователя
+    host: хост-адрес базы данных
+    dbname: имя базы данных
+    min_size: int, по умолчанию 0; количество простаивающих соединений каждого подпула, которые не закрываются по idle_timeout;
+        соединения открываются по требованию, заранее пул не заполняется
+    max_size: int, по умолчанию 10; максимальное количество открытых соединений
+    idle_timeout: int, по умолчанию 300; время простоя соединения в секундах, после которого оно закрывается
+        при следующем обращении к пулу (getconn/putconn)
+    timeout: int, по умолчанию 60; время ожидания свободного соединения в секундах
+    check_interval: int, по умолчанию 30; время простоя в секундах, после которого соединение проверяется перед выдачей
+
+    Атрибуты
+    ----------
+    min_size: int; количество простаивающих соединений каждого подпула, которые не закрываются по idle_timeout
+    max_size: int; максимальное количество открытых соединений
+    idle_timeout: int; время простоя соединения в секундах, после которого оно закрывается
+    timeout: int; время ожидания свободного соединения в секундах
+    check_interval: int; время простоя в секундах, после которого соединение проверяется перед выдачей
+    on_close: list; обработчики, вызываемые с соединением перед его закрытием пулом (по idle_timeout, при вытеснении,
+        возврате с discard=True и closeall)
+
+    Методы
+    ----------
+    getconn: метод для получения соединения из пула
+    putconn: метод для возврата соединения в пул
+    connection: контекстный менеджер для получения соединения с фиксацией или откатом транзакции
+    size: метод для получения количества открытых соединений
+    closeall: метод для закрытия всех соединений
+    '''
+
+    def __init__(self, user: str, password: str, host: str, dbname: str, min_size: int = 0, max_size: int = 10,
+                 idle_timeout: int = 300, timeout: int = 60, check_interval: int = 30):
+        if max_size < 1 or min_size > max_size:
+            raise Exception("ERROR: Некорректные размеры пула соединений!")
+
+        self.user = user
+        self.password = password
+        self.host = host
+        self.dbname = dbname
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.on_close = []
+        self._idle = {}
+        self._used = {}
+        self._pending = 0
+        self._condition = threading.Condition(threading.Lock())
+
+    def _open(self, options):
+        return psycopg2.connect(user=self.user, password=self.password, host=self.host, dbname=self.dbname, options=options)
+
+    def _close(self, conn):
+        for handler in list(self.on_close):
+            handler(conn)
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _is_alive(self, conn, released_at) -> bool:
+        if conn.closed:
+            return False
+        if time.time() - released_at <= self.check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("select 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _total(self) -> int:
+        return sum(len(x) for x in self._idle.values()) + len(self._used) + self._pending
+
+    def _expire(self, now):
+        # закрываем соединения, простаивающие дольше idle_timeout, сохраняя min_size в каждом подпуле
+        expired = []
+        for idle in self._idle.values():
+            count = len(idle)
+            for item in list(idle):
+                if count <= self.min_size:
+                    break
+                if now - item[1] > self.idle_timeout:
+                    idle.remove(item)
+                    expired.append(item[0])
+                    count -= 1
+        return expired
+
+    def _evict_other(self, options):
+        # освобождаем место под новое соединение за счет простаивающего соединения из другого подпула
+        for key, idle in self._idle.items():
+            if key != options and idle:
+                return idle.pop(0)[0]
+
+    def getconn(self, options: str = None):
+        '''
+        Метод для получения соединения из пула
+        Соединения, простаивавшие дольше check_interval, перед выдачей проверяются запросом 'select 1'
+        Неработающие соединения заменяются новыми
+
+        Параметры
+        ----------
+        options: str, по умолчанию None; опции подключения к ДБ
+        '''
+
+        deadline = time.time() + self.timeout
+        while True:
+            to_close = []
+            conn, released_at = None, None
+            with self._condition:
+                while True:
+                    to_close += self._expire(time.time())
+                    idle = self._idle.setdefault(options, [])
+                    if idle:
+                        conn, released_at = idle.pop()
+                        self._used[id(conn)] = options
+                        break
+                    if self._total() < self.max_size:
+                        self._pending += 1
+                        break
+                    evicted = self._evict_other(options)
+                    if evicted is not None:
+                        to_close.append(evicted)
+                        self._pending += 1
+                        break
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        for x in to_close:
+                            self._close(x)
+                        raise Exception("ERROR: Превышено время ожидания свободного соединения в пуле ({max_size})!"
+                                        .format(max_size=self.max_size))
+                    self._condition.wait(remaining)
+
+            for x in to_close:
+                self._close(x)
+
+            if conn is not None:
+                if self._is_alive(conn, released_at):
+                    return conn
+                self.putconn(conn, discard=True)
+                continue
+
+            # место под новое соединение зарезервировано счетчиком _pending
+            try:
+                conn = self._open(options)
+            except Exception:
+                with self._condition:
+                    self._pending -= 1
+                    self._condition.notify()
+                raise
+            with self._condition:
+                self._pending -= 1
+                self._used[id(conn)] = options
+            return conn
+
+    def putconn(self, conn, discard: bool = False):
+        '''
+        Метод для возврата соединения в пул
+
+        Параметры
+        ----------
+        conn: соединение, полученное методом getconn
+        discard: bool, по умолчанию False; указывает, что соединение нужно закрыть, а не вернуть в пул
+        '''
+
+        with self._condition:
+            options = self._used.pop(id(conn), None)
+            # простаивающие соединения закрываются и при возврате, чтобы они не оставались открытыми до следующего getconn
+            to_close = self._expire(time.time())
+            if not discard and not conn.closed:
+                self._idle.setdefault(options, []).append((conn, time.time()))
+            else:
+                to_close.append(conn)
+            self._condition.notify()
+
+        for x in to_close:
+            self._close(x)
+
+    @contextmanager
+    def connection(self, options: str = None):
+        '''
+        Контекстный менеджер для получения соединения из пула
+        При успешном выходе транзакция фиксируется, при исключении - откатывается
+
+        Параметры
+        ----------
+        options: str, по умолчанию None; опции подключения к ДБ
+        '''
+
+        conn = self.getconn(options)
+        discard = False
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard or conn.closed != 0)
+
+    def size(self) -> int:
+        '''
+        Метод для получения количества открытых соединений
+        '''
+
+        with self._condition:
+            return self._total()
+
+    def closeall(self):
+        '''
+        Метод для закрытия всех простаивающих соединений пула
+        '''
+
+        with self._condition:
+            idle = [conn for x in self._idle.values() for conn, _ in x]
+            self._idle = {}
+            self._condition.notify_all()
+
+        for conn in idle:
+            self._close(conn)
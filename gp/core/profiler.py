@@ -0,0 +1,112 @@
+import json
+import threading
+from functools import wraps
+import pandas as pd
+
+class QueryProfiler(object):
+    '''
+    Класс профилировщика запросов
+    Подключается к GPConnector как обработчик события 'after' и накапливает по одной записи на каждый выполненный запрос
+
+    Параметры
+    ----------
+    max_records: int, по умолчанию 100000; максимальное количество хранимых записей, при превышении удаляются самые старые
+
+    Атрибуты
+    ----------
+    max_records: int; максимальное количество хранимых записей
+    records: list; записи о выполненных запросах, каждая запись - словарь с полями:
+        operation - высокоуровневая операция, в рамках которой выполнен запрос (например, 'Autocheck.check'),
+        kind - тип вызова ('select', 'prepared', 'describe', 'execute', 'copy_in', 'copy_out', 'iter', 'explain'),
+        statement - sql-код запроса, params - значения параметров запроса, options - опции подключения,
+        started - время начала (unix time), wall_time - общее время выполнения в секундах,
+        connect_time - время получения соединения из пула, execute_time - время выполнения запроса на сервере,
+        fetch_time - время получения результата, rows - количество выбранных/измененных строк,
+        bytes - объем переданных данных для COPY, error - текст ошибки
+
+    Методы
+    ----------
+    to_df: метод для получения записей в виде датафрейма
+    to_jsonl: метод для выгрузки записей в файл формата JSON lines
+    summary: метод для получения статистики по запросам, сгруппированной по операциям и тексту запросов
+    clear: метод для очистки записей
+    '''
+
+    def __init__(self, max_records: int = 100000):
+        self.max_records = max_records
+        self.records = []
+        self._lock = threading.Lock()
+
+    def __call__(self, record: dict):
+        with self._lock:
+            self.records.append(dict(record))
+            if len(self.records) > self.max_records:
+                del self.records[:len(self.records) - self.max_records]
+
+    def to_df(self) -> pd.DataFrame:
+        '''
+        Метод для получения записей в виде датафрейма
+        '''
+
+        with self._lock:
+            df = pd.DataFrame(self.records)
+        if not df.empty:
+            df['started'] = pd.to_datetime(df['started'], unit='s')
+        return df
+
+    def to_jsonl(self, path: str):
+        '''
+        Метод для выгрузки записей в файл формата JSON lines
+
+        Параметры
+        ----------
+        path: str; путь к файлу, записи дописываются в конец файла
+        '''
+
+        with self._lock:
+            records = list(self.records)
+        with open(path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+    def summary(self, top: int = 20) -> pd.DataFrame:
+        '''
+        Метод для получения статистики по запросам, сгруппированной по операциям и тексту запросов
+        Возвращает top групп с наибольшим суммарным временем выполнения
+
+        Параметры
+        ----------
+        top: int, по умолчанию 20; количество выводимых групп
+        '''
+
+        df = self.to_df()
+        if df.empty:
+            return df
+        df['operation'] = df['operation'].fillna('')
+        df['statement'] = df['statement'].str.split().str.join(' ')
+        return df.groupby(['operation', 'kind', 'statement']) \
+                 .agg(calls=('wall_time', 'size'), wall_time=('wall_time', 'sum'), connect_time=('connect_time', 'sum'),
+                      fetch_time=('fetch_time', 'sum'), rows=('rows', 'sum'), bytes=('bytes', 'sum')) \
+                 .sort_values('wall_time', ascending=False).head(top).reset_index()
+
+    def clear(self):
+        '''
+        Метод для очистки записей
+        '''
+
+        with self._lock:
+            self.records = []
+
+
+def traced(method):
+    '''
+    Декоратор методов классов, работающих через атрибут gpconnector: запросы, выполненные внутри метода,
+    записываются профилировщиком и передаются обработчикам с названием операции вида 'Класс.метод'
+    '''
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.gpconnector.operation(method.__qualname__):
+            return method(self, *args, **kwargs)
+
+    return wrapper
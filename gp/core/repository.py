@@ -2,6 +2,8 @@ import pandas as pd
 import numpy as np
 from multipledispatch import dispatch
 from cjm.core import Autocheck
+from .profiler import traced
+from .workload import uses_workload
 
 class RepositoryLoader(object):
     '''
@@ -17,6 +19,9 @@ class RepositoryLoader(object):
     Атрибуты
     ----------
     gpconnector: экземпляр класса cjm.GPConnector() для подключения к БД
+    errors: датафрейм; выборка до 100 записей таргета, не прошедших проверку при последней загрузке (см. Autocheck.errors)
+    correct: None; корректные записи не выгружаются на клиент, а вставляются в репозиторий на сервере,
+        загруженные записи доступны методами select_df/select_list
 
     Методы
     ----------
@@ -45,7 +50,9 @@ class RepositoryLoader(object):
         self.errors = None
         self.correct = None
 
-    def load(self, target, repository_type: str = 'SBC', reload: bool = False):
+    @uses_workload('bulk_load')
+    @traced
+    def load(self, target, repository_type: str = 'SBC', reload: bool = False, incremental: bool = False):
         '''
         Метод для загрузки кампании в репозиторий
 
@@ -58,6 +65,8 @@ class RepositoryLoader(object):
             данные для загрузки в репозиторий
         repository_type: str, {'SBC', 'SAS'}, по умолчанию 'SBC'; указывает на целевой репозиторий (insight_repository/insight_repository_sas)
         reload: bool, по умаолчанию True; указывает требуется ли осуществить очистку репозитория от записей с таким request_id перед загрузкой инсайтов
+        incremental: bool, по умолчанию False; указывает, что результаты проверок по витринам берутся из кэша автопроверок
+            для ключей, проверенных при предыдущих запусках (см. Autocheck.check)
         '''
         # TODO: 
         # подтягивание доп.атрибутов в insight_repository_extra
@@ -82,59 +91,69 @@ class RepositoryLoader(object):
         def get_request_id_dispatch(target):
             source_cd_lv2 = []
             request_id = []
-            if 'select' not in target.lower():
-                if self.gpconnector.validate_target('select request_id from {source_name}'.format(source_name=target), check_function=False):
-                    request_id = list(set(np.array(self.gpconnector.select_list('select request_id from {source_name}'.format(source_name=target)))[:,0]))
-                if self.gpconnector.validate_target('select source_cd_lv2 from {source_name}'.format(source_name=target), check_function=False):
-                    source_cd_lv2 = list(set(np.array(self.gpconnector.select_list('select source_cd_lv2 from {source_name}'.format(source_name=target)))[:,0]))
-            else:
-                if self.gpconnector.validate_target('select request_id from ({sql}) as t'.format(sql=target), check_function=False):
-                    request_id = list(set(np.array(self.gpconnector.select_list('select request_id from ({sql}) as t'.format(sql=target)))[:,0]))
-                if self.gpconnector.validate_target('select source_cd_lv2 from ({sql}) as t'.format(sql=target), check_function=False):
-                    source_cd_lv2 = list(set(np.array(self.gpconnector.select_list('select source_cd_lv2 from ({sql}) as t'.format(sql=target)))[:,0]))                
+            target_columns = self.gpconnector.describe(target) or {}
+            source = target if 'select' not in target.lower() else '({sql}) as t'.format(sql=target)
+            if 'request_id' in target_columns:
+                request_id = list(set(np.array(self.gpconnector.select_list('select request_id from {source}'.format(source=source)))[:,0]))
+            if 'source_cd_lv2' in target_columns:
+                source_cd_lv2 = list(set(np.array(self.gpconnector.select_list('select source_cd_lv2 from {source}'.format(source=source)))[:,0]))
             return source_cd_lv2 + request_id
 
         if self.repository_type == 'SBC':
             autocheck = Autocheck(self.gpconnector, target, columns='request_id, scenario_id, inn, product_id, insight_desc, insight_sum_val, insight_income_val, insight_start_dt, insight_end_dt')
-            autocheck.check(check_attributes = True, limit = 100000)
-            self.errors = autocheck.errors
-            self.correct = autocheck.correct
-            if len(self.errors) == 0:
-                if reload:                    
-                    request_ids = get_request_id_dispatch(target)
-                    if request_ids:
-                        request_ids = '{\"' + '", "'.join(list(map(str, request_ids))) + '\"}'
-                        self.gpconnector.execute("delete from {insight_repository} where request_id = any('{request_ids}')"
-                                                .format(insight_repository=self.insight_repository, request_ids = request_ids))
-                self.gpconnector.insert(self.insight_repository, target, columns='request_id, scenario_id, inn, product_id, insight_desc, insight_sum_val, insight_income_val, insight_start_dt, insight_end_dt')
-            else:
-                autocheck.show_statistics()
-                raise Exception("ERROR: Устраните указанные ошибки для загрузки таргета в репозиторий!")
+            # результат проверки остается во временной таблице сессии, корректные строки загружаются из нее без выгрузки на клиент
+            # типы колонок корректных строк датафрейма/list берутся из репозитория, в который они вставляются
+            autocheck.result_like = self.insight_repository
+            with self.gpconnector.session():
+                autocheck.check(check_attributes = True, limit = 100, mode = 'aggregate', incremental = incremental)
+                self.errors = autocheck.errors
+                self.correct = autocheck.correct
+                if autocheck.summary['Ошибки'] == 0:
+                    # удаление и загрузка выполняются в одной транзакции, чтобы при ошибке загрузки не потерять записи
+                    with self.gpconnector.transaction():
+                        if reload:
+                            request_ids = get_request_id_dispatch(target)
+                            if request_ids:
+                                request_ids = '{\"' + '", "'.join(list(map(str, request_ids))) + '\"}'
+                                self.gpconnector.execute("delete from {insight_repository} where request_id = any('{request_ids}')"
+                                                        .format(insight_repository=self.insight_repository, request_ids = request_ids))
+                        self.gpconnector.insert(self.insight_repository, autocheck.correct_query, columns='request_id, scenario_id, inn, product_id, insight_desc, insight_sum_val, insight_income_val, insight_start_dt, insight_end_dt')
+                else:
+                    autocheck.show_statistics()
+                    raise Exception("ERROR: Устраните указанные ошибки для загрузки таргета в репозиторий!")
         elif self.repository_type == 'SAS':
             autocheck = Autocheck(self.gpconnector, target, columns='source_cd_lv2 , inn , task_priority , task_type , task_km , product_id , offer_desc_pp , offer_desc , entity_type , offer_sum_val , offer_income_val , start_dt , end_dt , num_attr_01 , num_attr_02 , num_attr_03 , text_attr_01 , text_attr_02 , text_attr_03 , date_attr_01 , date_attr_02 , date_attr_03')
-            autocheck.check(check_attributes = True, limit = 100000)
-            self.errors = autocheck.errors
-            self.correct = autocheck.correct
-            if len(self.errors) == 0:
-                if reload:
-                    source_cd_lv2s = get_request_id_dispatch(target)
-                    if source_cd_lv2s:
-                        source_cd_lv2s = '{\"' + '", "'.join(list(map(str, source_cd_lv2s))) + '\"}'
-                        self.gpconnector.execute("delete from {insight_repository} where source_cd_lv2 = any('{source_cd_lv2s}')"
-                                                .format(insight_repository=self.insight_repository, source_cd_lv2s = source_cd_lv2s))
-                self.gpconnector.insert(self.insight_repository, target, columns='source_cd_lv2 , inn , task_priority , task_type , task_km , product_id , offer_desc_pp , offer_desc , entity_type , offer_sum_val , offer_income_val , start_dt , end_dt , num_attr_01 , num_attr_02 , num_attr_03 , text_attr_01 , text_attr_02 , text_attr_03 , date_attr_01 , date_attr_02 , date_attr_03')
-            else:
-                autocheck.show_statistics()
-                raise Exception("ERROR: Устраните указанные ошибки для загрузки таргета в репозиторий!")
+            # результат проверки остается во временной таблице сессии, корректные строки загружаются из нее без выгрузки на клиент
+            # типы колонок корректных строк датафрейма/list берутся из репозитория, в который они вставляются
+            autocheck.result_like = self.insight_repository
+            with self.gpconnector.session():
+                autocheck.check(check_attributes = True, limit = 100, mode = 'aggregate', incremental = incremental)
+                self.errors = autocheck.errors
+                self.correct = autocheck.correct
+                if autocheck.summary['Ошибки'] == 0:
+                    with self.gpconnector.transaction():
+                        if reload:
+                            source_cd_lv2s = get_request_id_dispatch(target)
+                            if source_cd_lv2s:
+                                source_cd_lv2s = '{\"' + '", "'.join(list(map(str, source_cd_lv2s))) + '\"}'
+                                self.gpconnector.execute("delete from {insight_repository} where source_cd_lv2 = any('{source_cd_lv2s}')"
+                                                        .format(insight_repository=self.insight_repository, source_cd_lv2s = source_cd_lv2s))
+                        self.gpconnector.insert(self.insight_repository, autocheck.correct_query, columns='source_cd_lv2 , inn , task_priority , task_type , task_km , product_id , offer_desc_pp , offer_desc , entity_type , offer_sum_val , offer_income_val , start_dt , end_dt , num_attr_01 , num_attr_02 , num_attr_03 , text_attr_01 , text_attr_02 , text_attr_03 , date_attr_01 , date_attr_02 , date_attr_03')
+                else:
+                    autocheck.show_statistics()
+                    raise Exception("ERROR: Устраните указанные ошибки для загрузки таргета в репозиторий!")
         else:
             raise Exception("ERROR: Укажите нужный тип репозитория(SBC/SAS)!")
 
+    @uses_workload('bulk_load')
+    @traced
     def load_to_sbc(self, request_id):
-        self.gpconnector.execute("delete from {insight_repository} where request_id = {request_id}"
-                                 .format(insight_repository=self.insight_repository_sbc, request_id = request_id))
-        self.gpconnector.insert(self.insight_repository_sbc, "select * from {insight_repository} where request_id = {request_id}"
-                                .format(insight_repository=self.insight_repository, request_id = request_id)
-                                , columns='insight_id, creation_dttm, request_id, scenario_id, inn, kpp, customer_id, epk_id, product_id, insight_desc, insight_sum_val, insight_income_val, insight_start_dt, insight_end_dt')
+        with self.gpconnector.transaction():
+            self.gpconnector.execute("delete from {insight_repository} where request_id = {request_id}"
+                                     .format(insight_repository=self.insight_repository_sbc, request_id = request_id))
+            self.gpconnector.insert(self.insight_repository_sbc, "select * from {insight_repository} where request_id = {request_id}"
+                                    .format(insight_repository=self.insight_repository, request_id = request_id)
+                                    , columns='insight_id, creation_dttm, request_id, scenario_id, inn, kpp, customer_id, epk_id, product_id, insight_desc, insight_sum_val, insight_income_val, insight_start_dt, insight_end_dt')
 
     def delete(self, request_id):
         '''
@@ -164,11 +183,13 @@ class RepositoryLoader(object):
         '''
 
         if self.repository_type == 'SBC':
-            self.gpconnector.select("""select * from {insight_repository} where request_id = {request_id}"""
-                                    .format(insight_repository = self.insight_repository, request_id = request_id), limit)
+            print(self.gpconnector.select_prepared("""select * from {insight_repository} where request_id = $1"""
+                                                   .format(insight_repository = self.insight_repository), (request_id,), limit, as_df=True)
+                  .to_string(index=False))
         elif self.repository_type == 'SAS':
-            self.gpconnector.select("""select * from {insight_repository} where source_cd_lv2 = '{source_cd_lv2}'"""
-                                    .format(insight_repository = self.insight_repository, source_cd_lv2 = request_id), limit)
+            print(self.gpconnector.select_prepared("""select * from {insight_repository} where source_cd_lv2 = $1"""
+                                                   .format(insight_repository = self.insight_repository), (request_id,), limit, as_df=True)
+                  .to_string(index=False))
 
     def select_list(self, request_id: int, limit: int = 100) -> list:
         '''
@@ -181,13 +202,13 @@ class RepositoryLoader(object):
         '''
 
         if self.repository_type == 'SBC':
-            return self.gpconnector.select_list(
-                """select * from {insight_repository} where request_id = {request_id}"""
-                .format(insight_repository = self.insight_repository, request_id = request_id), limit)
+            return self.gpconnector.select_prepared(
+                """select * from {insight_repository} where request_id = $1"""
+                .format(insight_repository = self.insight_repository), (request_id,), limit)
         elif self.repository_type == 'SAS':
-            return self.gpconnector.select_list(
-                """select * from {insight_repository} where source_cd_lv2 = '{source_cd_lv2}'"""
-                .format(insight_repository = self.insight_repository, source_cd_lv2 = request_id), limit)
+            return self.gpconnector.select_prepared(
+                """select * from {insight_repository} where source_cd_lv2 = $1"""
+                .format(insight_repository = self.insight_repository), (request_id,), limit)
 
     def select_df(self, request_id: int, limit: int = 100) -> pd.DataFrame:
         '''
@@ -200,10 +221,10 @@ class RepositoryLoader(object):
         '''
 
         if self.repository_type == 'SBC':
-            return self.gpconnector.select_df(
-                """select * from {insight_repository} where request_id = {request_id}"""
-                .format(insight_repository = self.insight_repository, request_id = request_id), limit)
+            return self.gpconnector.select_prepared(
+                """select * from {insight_repository} where request_id = $1"""
+                .format(insight_repository = self.insight_repository), (request_id,), limit, as_df=True)
         elif self.repository_type == 'SAS':
-            return self.gpconnector.select_df(
-                """select * from {insight_repository} where source_cd_lv2 = '{source_cd_lv2}'"""
-                .format(insight_repository = self.insight_repository, source_cd_lv2 = request_id), limit)
\ No newline at end of file
+            return self.gpconnector.select_prepared(
+                """select * from {insight_repository} where source_cd_lv2 = $1"""
+                .format(insight_repository = self.insight_repository), (request_id,), limit, as_df=True)
\ No newline at end of file
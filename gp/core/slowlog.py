@@ -0,0 +1,165 @@
+import os
+import re
+import json
+import random
+import difflib
+import hashlib
+import threading
+import pandas as pd
+from .plan import QueryPlan
+
+# типы вызовов, для которых можно получить план запроса
+_EXPLAIN_KINDS = ('select', 'execute', 'copy_out', 'iter', 'describe')
+
+
+def fingerprint(query: str) -> str:
+    '''
+    Функция для получения отпечатка sql-запроса: запросы, отличающиеся только значениями литералов,
+    комментариями и пробельными символами, имеют одинаковый отпечаток
+
+    Параметры
+    ----------
+    query: str; sql-код запроса
+    '''
+
+    query = re.sub(r'--[^\n]*', ' ', query)
+    query = re.sub(r'/\*.*?\*/', ' ', query, flags=re.DOTALL)
+    query = re.sub(r"'(?:[^']|'')*'", '?', query)
+    query = re.sub(r'\b\d+(?:\.\d+)?\b', '?', query)
+    query = ' '.join(query.lower().split())
+    return hashlib.sha1(query.encode('utf-8')).hexdigest()[:16]
+
+
+def _explain_query(record: dict) -> str:
+    statement = record['statement']
+    if record['kind'] == 'copy_out':
+        # из COPY (query) TO STDOUT план строится для внутреннего запроса
+        match = re.match(r"\s*copy\s*\((.*)\)\s*to\s+stdout", statement, flags=re.IGNORECASE | re.DOTALL)
+        return match.group(1) if match else None
+    # запросы с параметрами нельзя выполнить без значений, а повторный EXPLAIN для DDL (create ... as) завершится ошибкой
+    if record['params'] is not None or not re.match(r'\s*(select|with|insert|update|delete)\b', statement,
+                                                    flags=re.IGNORECASE):
+        return None
+    return statement
+
+
+class SlowQueryLog(object):
+    '''
+    Класс журнала медленных запросов
+    Подключается к GPConnector как обработчик события 'after' (см. GPConnector.enable_slow_log): для каждого запроса,
+    выполнявшегося дольше threshold секунд, в файл формата JSON lines записываются sql-код, параметры, время выполнения
+    и план запроса (EXPLAIN), а для доли analyze_sample читающих запросов - план с фактическими показателями (EXPLAIN ANALYZE)
+
+    Параметры
+    ----------
+    gpconnector: экземпляр класса GPConnector, через который строятся планы запросов
+    path: str, по умолчанию '~/.cache/gp/slow_queries.jsonl'; файл журнала
+    threshold: float, по умолчанию 60; время выполнения запроса в секундах, начиная с которого запрос записывается в журнал
+    explain: bool, по умолчанию True; указывает, что для медленного запроса нужно сохранить план
+    analyze_sample: float, по умолчанию 0; доля медленных читающих запросов, которые повторно выполняются с EXPLAIN ANALYZE
+
+    Атрибуты
+    ----------
+    path: str; файл журнала
+    threshold: float; порог времени выполнения в секундах
+    explain: bool; указывает, что сохраняется план запроса
+    analyze_sample: float; доля запросов, повторно выполняемых с EXPLAIN ANALYZE
+
+    Методы
+    ----------
+    entries: метод для получения записей журнала в виде датафрейма
+    diff_plans: метод для сравнения двух планов одного запроса
+    '''
+
+    def __init__(self, gpconnector, path: str = '~/.cache/gp/slow_queries.jsonl', threshold: float = 60,
+                 explain: bool = True, analyze_sample: float = 0):
+        self.gpconnector = gpconnector
+        self.path = os.path.expanduser(path)
+        self.threshold = threshold
+        self.explain = explain
+        self.analyze_sample = analyze_sample
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+    def __call__(self, record: dict):
+        if record['kind'] not in _EXPLAIN_KINDS or (record['wall_time'] or 0) < self.threshold:
+            return
+
+        entry = dict(record, fingerprint=fingerprint(record['statement']), plan=None, analyzed=False, plan_error=None)
+        query = _explain_query(record) if self.explain else None
+        if query is not None:
+            analyze = record['error'] is None and re.match(r'\s*(select|with)\b', query, flags=re.IGNORECASE) is not None \
+                      and random.random() < self.analyze_sample
+            try:
+                entry['plan'] = self.gpconnector.explain_plan(query, analyze=analyze, options=record['options']).raw
+                entry['analyzed'] = analyze
+            except Exception as error:
+                # план не должен ломать основной сценарий, например если транзакция сессии уже прервана
+                entry['plan_error'] = str(error).strip()
+
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+
+    def entries(self, fingerprint: str = None) -> pd.DataFrame:
+        '''
+        Метод для получения записей журнала в виде датафрейма в порядке записи
+
+        Параметры
+        ----------
+        fingerprint: str, по умолчанию None; отпечаток запроса (см. функцию fingerprint), None - все записи
+        '''
+
+        entries = []
+        if os.path.exists(self.path):
+            with self._lock:
+                with open(self.path, encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue
+                        if fingerprint is None or entry.get('fingerprint') == fingerprint:
+                            entries.append(entry)
+        df = pd.DataFrame(entries)
+        if not df.empty:
+            df['started'] = pd.to_datetime(df['started'], unit='s')
+        return df
+
+    def diff_plans(self, fingerprint: str, old: int = -2, new: int = -1, rows: bool = False) -> str:
+        '''
+        Метод для сравнения двух планов одного запроса
+        Возвращает unified diff деревьев планов: изменившиеся типы узлов, motion-операции, ключи перераспределения и таблицы
+
+        Параметры
+        ----------
+        fingerprint: str; отпечаток запроса
+        old: int, по умолчанию -2; номер старой записи среди записей запроса с планом
+        new: int, по умолчанию -1; номер новой записи среди записей запроса с планом
+        rows: bool, по умолчанию False; указывает, что в сравнение нужно включить оценку количества строк
+        '''
+
+        df = self.entries(fingerprint)
+        if df.empty or 'plan' not in df.columns:
+            raise Exception("ERROR: Планы для запроса {fingerprint} не найдены!".format(fingerprint=fingerprint))
+        df = df[df['plan'].notnull()].reset_index(drop=True)
+        if len(df) < 2:
+            raise Exception("ERROR: Для сравнения необходимо минимум два плана запроса {fingerprint}!".format(fingerprint=fingerprint))
+
+        def plan_lines(plan):
+            lines = []
+            for node in QueryPlan(plan)._nodes:
+                line = '{indent}{node_type}'.format(indent='  ' * node['depth'], node_type=node['node_type'])
+                if node['relation']:
+                    line += ' on {relation}'.format(relation=node['relation'])
+                if node['hash_key']:
+                    line += ' by {hash_key}'.format(hash_key=node['hash_key'])
+                if rows:
+                    line += ' rows={rows:.0f}'.format(rows=node['plan_rows'] or 0)
+                lines.append(line)
+            return lines
+
+        old_entry, new_entry = df.iloc[old], df.iloc[new]
+        return '\n'.join(difflib.unified_diff(plan_lines(old_entry['plan']), plan_lines(new_entry['plan'])
+                                              , fromfile=str(old_entry['started']), tofile=str(new_entry['started'])
+                                              , lineterm=''))
@@ -5,6 +5,8 @@ import plotly.graph_objects as go
 import plotly.express as px
 from datetime import datetime
 from PIL import ImageColor
+from .profiler import traced
+from .workload import uses_workload
 # from matplotlib_venn import venn2, venn3
 # from plotly.subplots import make_subplots
 
@@ -64,16 +66,17 @@ class Stop(object):
 
         if not stop_id and stop_cd:
             self.stop_id, self.description, self.stop_type, self.schedule, self.create_dt, self.refresh_dt = \
-            gpconnector.select_list(
-                """select stop_id, description, stop_type, schedule, create_dt, refresh_dt from {stop_dict} 
-                where stop_cd = '{stop_cd}'""".format(stop_dict = self.stop_dict, stop_cd = stop_cd))[0]
+            gpconnector.select_prepared(
+                """select stop_id, description, stop_type, schedule, create_dt, refresh_dt from {stop_dict}
+                where stop_cd = $1""".format(stop_dict = self.stop_dict), (stop_cd,))[0]
         if not stop_cd and stop_id:
             self.stop_cd, self.description, self.stop_type, self.schedule, self.create_dt, self.refresh_dt = \
-            gpconnector.select_list(
+            gpconnector.select_prepared(
                 """select stop_cd, description, stop_type, schedule, create_dt, refresh_dt from {stop_dict}
-                where stop_id = {stop_id}""".format(stop_dict = self.stop_dict, stop_id = stop_id))[0]
+                where stop_id = $1""".format(stop_dict = self.stop_dict), (stop_id,))[0]
 
-    def create(self, target, description: str, stop_cd: str = None, stop_type: str = 'MATERIALIZED VIEW', schedule: str = '7d'):
+    def create(self, target, description: str, stop_cd: str = None, stop_type: str = 'MATERIALIZED VIEW', schedule: str = '7d',
+               distributed_by: str = 'auto', storage=None):
         '''
         Метод для создания стопа
 
@@ -89,6 +92,8 @@ class Stop(object):
         stop_type: {MATERIALIZED VIEW', 'VIEW', 'TABLE', 'FUNCTION'}, по умолчанию 'MATERIALIZED VIEW'
         тип стопа, указывает создается ли стоп как материализованное представление (MATERIALIZED VIEW) или обычное представление
         schedule: расписание обновления стопа с типом MATERIALIZED VIEW, указывается в формате 1h - каждый час/1d - каждый день/7d - каждые семь дней/1m - каждый месяц
+        distributed_by: str, по умолчанию 'auto'; ключ распределения стопа с типом TABLE/MATERIALIZED VIEW (см. GPConnector.create)
+        storage: dict или str, по умолчанию None; параметры хранения стопа WITH (...) (см. GPConnector.create)
         '''
 
         if self.stop_id:
@@ -115,7 +120,8 @@ class Stop(object):
             try:
                 self.gpconnector.drop("{stop_template}{stop_id}".format(stop_template=self.stop_template, stop_id=self.stop_id))
                 self.gpconnector.create(stop_type, "{stop_template}{stop_id}"
-                                        .format(stop_template=self.stop_template, stop_id=self.stop_id), target)
+                                        .format(stop_template=self.stop_template, stop_id=self.stop_id), target
+                                        , distributed_by=distributed_by, storage=storage)
                 print("""SUCCESS: Стоп №{stop_id} "{stop_cd}" создан как {stop_type} {stop_template}{stop_id}"""
                       .format(stop_template=self.stop_template
                               , stop_id=self.stop_id
@@ -152,7 +158,8 @@ class Stop(object):
                 self.gpconnector.drop(
                     "{stop_template}{stop_id}".format(stop_template=self.stop_template, stop_id=self.stop_id))
                 self.gpconnector.create(stop_type or self.stop_type, "{stop_template}{stop_id}"
-                                        .format(stop_template=self.stop_template, stop_id=self.stop_id), target)
+                                        .format(stop_template=self.stop_template, stop_id=self.stop_id), target
+                                        , distributed_by=distributed_by, storage=storage)
             else:
                 raise Exception("ERROR: Некорректный таргет!")
 
@@ -231,6 +238,7 @@ class Stop(object):
                                          .format(stop_dict=self.stop_dict, stop_id=self.stop_id)).to_string(
             index=False))
 
+    @traced
     def refresh(self):
         '''
         Метод для обновления стопа
@@ -332,6 +340,7 @@ class Stop(object):
                                               .format(stop_template=self.stop_template
                                                       , stop_id=self.stop_id), limit)
 
+    @traced
     def load(self):
         '''
         Метод для загрузки стопа типа 'MATERIALIZED VIEW' или 'TABLE' в репозиторий стопов
@@ -369,6 +378,8 @@ class StopList(object):
     change: метод для изменения списка стопов;
     delete: метод для удаления списка стопов;
     get: метод для получения списка стопов в виде словаря;
+    refresh: метод для параллельного обновления стопов из списка стопов
+    load: метод для параллельной загрузки стопов из списка стопов в репозиторий стопов
     select: метод для вывода списка стопов на печать
     select_list: метод для вывода списка стопов в list
     select_df: метод для вывода списка стопов в датафрейм
@@ -489,11 +500,37 @@ class StopList(object):
         '''
 
         if self.stop_list_cd or stop_list_cd:
-            return dict(self.gpconnector.select_list("""select stop_cd, stop_arguments from {stop_list_dict} where stop_list_cd = '{stop_list_cd}'"""
-                                                    .format(stop_list_dict=self.stop_list_dict, stop_list_cd=self.stop_list_cd or stop_list_cd), limit = 1000))
+            return dict(self.gpconnector.select_prepared("""select stop_cd, stop_arguments from {stop_list_dict} where stop_list_cd = $1"""
+                                                        .format(stop_list_dict=self.stop_list_dict), (self.stop_list_cd or stop_list_cd,), limit = 1000))
         else:
             raise Exception("ERROR: Укажите stop_list_cd!")
 
+    @traced
+    def refresh(self, max_workers: int = 4) -> list:
+        '''
+        Метод для параллельного обновления стопов из списка стопов
+
+        Параметры
+        ----------
+        max_workers: int, по умолчанию 4; максимальное количество одновременно обновляемых стопов
+        '''
+
+        return self.gpconnector.run_many([lambda stop_cd=stop_cd: Stop(self.gpconnector, stop_cd=stop_cd).refresh()
+                                          for stop_cd in self.get()], max_workers=max_workers)
+
+    @traced
+    def load(self, max_workers: int = 4) -> list:
+        '''
+        Метод для параллельной загрузки стопов из списка стопов в репозиторий стопов
+
+        Параметры
+        ----------
+        max_workers: int, по умолчанию 4; максимальное количество одновременно загружаемых стопов
+        '''
+
+        return self.gpconnector.run_many([lambda stop_cd=stop_cd: Stop(self.gpconnector, stop_cd=stop_cd).load()
+                                          for stop_cd in self.get()], max_workers=max_workers)
+
     def select(self):
         '''
         Метод для вывода таргета на печать
@@ -583,7 +620,8 @@ class StopFilter(object):
                                                                                       where target_id = {target_id}""".format(
                 stop_target_dict=self.stop_target_dict, target_id=target_id))[0]
 
-    def create_target(self, target, target_cd: str, columns: str = None):
+    @traced
+    def create_target(self, target, target_cd: str, columns: str = None, distributed_by: str = 'auto', storage=None):
         '''
         Метод для добавления таргета в справочник таргетов prom.stop_target_dict и создания временной таблицы с таргетом
 
@@ -596,6 +634,8 @@ class StopFilter(object):
             данные для фильтрации
         target_cd: str; краткое описание таргета, 100 символов
         columns: str, по умолчанию None; список колонок для таргета типа list
+        distributed_by: str, по умолчанию 'auto'; ключ распределения таблицы таргета (см. GPConnector.create)
+        storage: dict или str, по умолчанию None; параметры хранения таблицы таргета WITH (...) (см. GPConnector.create)
         '''
 
         if self.target_id:
@@ -620,7 +660,8 @@ class StopFilter(object):
                 self.target_id = self.gpconnector.select_list("select last_value from {stop_target_dict}_target_id_seq"
                                                             .format(stop_target_dict=self.stop_target_dict))[0][0]
                 self.gpconnector.create('TABLE', '{target_template}{target_id}'
-                                        .format(target_template=self.target_template, target_id=self.target_id), target, columns)
+                                        .format(target_template=self.target_template, target_id=self.target_id), target, columns
+                                        , distributed_by=distributed_by, storage=storage)
             else:
                 raise Exception("ERROR: В параметр target подан некорректный тип таргета!")
 
@@ -697,18 +738,22 @@ class StopFilter(object):
         return self.gpconnector.select_list("""select * from {target_flags_template}{target_id}"""
                                             .format(target_flags_template=self.target_flags_template, target_id=self.target_id), limit)
 
-    def select_target_flags_df(self, limit: int = 100) -> pd.DataFrame:
+    def select_target_flags_df(self, limit: int = 100, engine: str = None) -> pd.DataFrame:
         '''
         Метод для вывода таргета с признаками стопов в датафрейм
 
         Параметры
         ----------
         limit: int, по умолчанию 100; ограничение количества выводимых строк
+        engine: str, {'read_sql', 'copy'}, по умолчанию None; способ выборки данных (см. GPConnector.select_df)
         '''
 
         return self.gpconnector.select_df("""select * from {target_flags_template}{target_id}"""
-                                          .format(target_flags_template=self.target_flags_template, target_id=self.target_id), limit)
+                                          .format(target_flags_template=self.target_flags_template, target_id=self.target_id), limit,
+                                          engine=engine)
 
+    @uses_workload('stop_filter')
+    @traced
     def exclude(self, stop_list: dict, limit: int = 100) -> pd.DataFrame:
         '''
         Метод для исключения из таргета клиентов, попадающих под указанные стопы
@@ -789,7 +834,7 @@ class StopFilter(object):
         Метод для вывода статистики исключения из таргета клиентов, попадающих под указанные стопы
         '''
 
-        df = self.select_target_flags_df(limit=1000000)
+        df = self.select_target_flags_df(limit=1000000, engine='copy')
         stop_dict = dict(self.gpconnector.select_list("select 'stop_'||cast(stop_id as varchar), stop_cd from {stop_dict}"
                                                       .format(stop_dict = self.stop_dict)))
         df = df.rename(columns=stop_dict)
@@ -0,0 +1,31 @@
+from functools import wraps
+
+# профили нагрузки по умолчанию: параметры сессии (GUC), передаваемые при подключении через options
+WORKLOADS = {
+    'bulk_load': {'statement_mem': '1000MB', 'optimizer': 'on', 'statement_timeout': 0},
+    'autocheck': {'statement_mem': '1000MB', 'optimizer': 'on', 'gp_enable_agg_distinct_pruning': 'on',
+                  'statement_timeout': '60min'},
+    'stop_filter': {'statement_mem': '1000MB', 'optimizer': 'on', 'statement_timeout': '60min'},
+    'interactive_preview': {'statement_mem': '125MB', 'optimizer': 'off', 'statement_timeout': '5min'},
+}
+
+
+def uses_workload(name: str):
+    '''
+    Декоратор методов классов, работающих через атрибут gpconnector: запросы, выполненные внутри метода без явно
+    переданных опций подключения, выполняются с параметрами профиля нагрузки name (см. GPConnector.workload)
+
+    Параметры
+    ----------
+    name: str; название профиля нагрузки из GPConnector.workloads
+    '''
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.gpconnector.workload(name):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
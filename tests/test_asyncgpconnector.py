@@ -0,0 +1,56 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+from gp.core.asyncgpconnector import AsyncGPConnector
+
+
+class FakePool(object):
+    max_size = 2
+
+
+class FakeConnector(object):
+    def __init__(self):
+        self.pool = FakePool()
+        self._local = threading.local()
+        # оба запроса должны дойти до барьера одновременно, иначе select_list завершится ошибкой по таймауту
+        self.barrier = threading.Barrier(2, timeout=5)
+
+    @contextmanager
+    def session(self):
+        self._local.conn = object()
+        try:
+            yield self
+        finally:
+            self._local.conn = None
+
+    def select_list(self, query, limit=1000000, options=None):
+        self.barrier.wait()
+        return [(query, threading.current_thread().name)]
+
+    def close(self):
+        pass
+
+
+def test_gather_runs_queries_concurrently():
+    async_connector = AsyncGPConnector(gpconnector=FakeConnector())
+
+    async def run():
+        return await asyncio.gather(async_connector.select_list('select 1'), async_connector.select_list('select 2'))
+
+    first, second = asyncio.run(run())
+    async_connector.close()
+
+    assert first[0][0] == 'select 1' and second[0][0] == 'select 2'
+    assert first[0][1] != second[0][1]
+
+
+def test_pinned_session_rejected():
+    gpconnector = FakeConnector()
+    async_connector = AsyncGPConnector(gpconnector=gpconnector)
+
+    with gpconnector.session(), pytest.raises(Exception, match='session/transaction'):
+        asyncio.run(async_connector.select_list('select 1'))
+    async_connector.close()
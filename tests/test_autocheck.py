@@ -0,0 +1,124 @@
+from contextlib import contextmanager
+
+import pandas as pd
+
+from gp.core.autocheck import Autocheck
+
+
+class FakeConnector(object):
+    def __init__(self):
+        self.created = []
+        self.statements = []
+
+    @contextmanager
+    def session(self):
+        yield self
+
+    @contextmanager
+    def workload(self, name):
+        yield
+
+    @contextmanager
+    def operation(self, name):
+        yield
+
+    def create(self, object_type, object_name, target, columns=None, method='values', **kwargs):
+        if isinstance(target, pd.DataFrame) and method != 'values' and target.empty:
+            raise Exception("ERROR: Для создания таблицы через COPY таргет не должен быть пустым!")
+        self.created.append((object_type, object_name, target))
+
+    def execute(self, script, data=None, options=None):
+        self.statements.append(script)
+
+    def insert(self, table_name, target, columns=None, options=None, method='values'):
+        self.created.append(('INSERT', table_name, target))
+
+    def describe(self, target, columns=None, options=None):
+        return {'inn': 1043, 'product_id': 20} if target == 'prom.insight_repository' else None
+
+    def select_list(self, query, limit=1000000, options=None, params=None):
+        self.statements.append(query)
+        return [tuple('{i}:{i}'.format(i=i) for i in range(query.count('hashtext')))]
+
+
+def _local_only(autocheck):
+    # проверки по витринам выключены, поэтому все проверки выполняются на клиенте
+    return dict((x.option, False) for x in autocheck.checks if x.local is None)
+
+
+def test_aggregate_all_rows_fail():
+    gpconnector = FakeConnector()
+    target = pd.DataFrame({'inn': ['123', '123', '45'], 'product_id': [1, 1, 2]})
+    autocheck = Autocheck(gpconnector, target)
+
+    summary = autocheck.check(mode='aggregate', checks=_local_only(autocheck), use_flag_mart=False)
+
+    assert summary['Ошибки'] == 3
+    assert len(autocheck.errors) == 3
+    assert gpconnector.created[-1][1] == 'pg_temp.autocheck_result'
+    assert autocheck.correct_query.endswith('where false')
+
+
+def test_aggregate_correct_rows():
+    gpconnector = FakeConnector()
+    target = pd.DataFrame({'inn': ['7707083893', '123'], 'product_id': [1, 2]})
+    autocheck = Autocheck(gpconnector, target)
+
+    summary = autocheck.check(mode='aggregate', checks=_local_only(autocheck), use_flag_mart=False)
+
+    assert summary['Ошибки'] == 1
+    assert gpconnector.created[-1][2]['inn'].tolist() == ['7707083893']
+    assert not autocheck.correct_query.endswith('where false')
+
+
+def test_aggregate_result_types_from_result_like():
+    gpconnector = FakeConnector()
+    # колонка product_id без значений по первым строкам создалась бы с типом text
+    target = pd.DataFrame({'inn': ['7707083893'], 'product_id': [None], 'insight_desc': ['a']})
+    autocheck = Autocheck(gpconnector, target)
+    autocheck.result_like = 'prom.insight_repository'
+
+    autocheck.check(mode='aggregate', checks=_local_only(autocheck), use_flag_mart=False)
+
+    (_, result_table, query), (_, insert_table, df) = gpconnector.created[-2:]
+    assert result_table == insert_table == 'pg_temp.autocheck_result'
+    assert query == 'select inn, product_id, null::text as insight_desc from prom.insight_repository limit 0'
+    assert df['inn'].tolist() == ['7707083893']
+
+
+def _cached_checks(autocheck, names):
+    checks = [x for x in autocheck.checks if x.name in names]
+    return autocheck._cached_checks(['inn', 'product_id', 'request_id'], checks, {})
+
+
+def test_incremental_hash_freshness_by_default():
+    gpconnector = FakeConnector()
+    autocheck = Autocheck(gpconnector, 'sandbox.target')
+
+    checks = _cached_checks(autocheck, ['product_deal'])
+
+    assert autocheck.freshness == 'hash'
+    hashes = [x for x in gpconnector.statements if 'hashtext' in x][0]
+    assert "from (select distinct inn, host_prod_id as product_id from prom.ma_deal where deal_status_nm = 'Заключена') as s" in hashes
+    assert 'count(*) from prom.ma_deal' not in hashes
+    assert checks[0].tables == []
+
+
+def test_incremental_key_keeps_nulls_distinct():
+    gpconnector = FakeConnector()
+    autocheck = Autocheck(gpconnector, 'sandbox.target')
+
+    checks = _cached_checks(autocheck, ['segment'])
+
+    insert = [x for x in gpconnector.statements if x.strip().startswith('insert')][0]
+    assert 'row(t.inn, t.request_id)::text' in insert
+    assert 'coalesce' not in checks[0].joins(['inn', 'request_id'], autocheck.tables)
+
+
+def test_incremental_warns_for_flag_mart_checks(capsys):
+    autocheck = Autocheck(FakeConnector(), 'sandbox.target')
+    checks = [x for x in autocheck.checks if x.name in ('product_deal', 'inn_len')]
+
+    autocheck._check_query(['inn', 'product_id'], checks, {}, incremental=True, flag_mart=True)
+
+    assert 'WARNING: Проверки product_deal' in capsys.readouterr().out
@@ -0,0 +1,57 @@
+import json
+import os
+
+import pandas as pd
+
+from gp.core.cache import QueryCache
+from gp.core.gpconnecor import GPConnector
+
+_DF = pd.DataFrame({'inn': ['7707083893'], 'product_id': [1]})
+
+
+def test_key_normalizes_query(tmp_path):
+    cache = QueryCache(str(tmp_path), fmt='pickle')
+    cache.put('select inn\n  from prom.ma_deal -- сделки\n;', _DF)
+
+    assert cache.get('select inn from /* витрина */ prom.ma_deal').equals(_DF)
+    # опции подключения и способ выборки входят в ключ
+    assert cache.get('select inn from prom.ma_deal', options='-c statement_timeout=0') is None
+    assert cache.get('select inn from prom.ma_deal', engine='copy') is None
+
+
+def test_ttl_expires_entry(tmp_path):
+    cache = QueryCache(str(tmp_path), ttl=60, fmt='pickle')
+    cache.put('select * from prom.ma_deal', _DF)
+    meta_file = cache._files(cache._key('select * from prom.ma_deal'))[1]
+    with open(meta_file) as f:
+        meta = json.load(f)
+    meta['created'] -= 61
+    with open(meta_file, 'w') as f:
+        json.dump(meta, f)
+
+    assert cache.get('select * from prom.ma_deal') is None
+    assert not os.path.exists(meta_file)
+
+
+def test_invalidate_by_table(tmp_path):
+    cache = QueryCache(str(tmp_path), fmt='pickle')
+    cache.put('select * from prom.ma_deal d join prom.ma_task t on t.inn = d.inn', _DF)
+    cache.put('prom.MA_TASK', _DF)
+    cache.put('select * from prom.ma_agreement', _DF)
+
+    assert QueryCache.tables('select * from prom.ma_deal d join prom.ma_task t on t.inn = d.inn') == ['prom.ma_deal',
+                                                                                                      'prom.ma_task']
+    assert cache.invalidate('prom.ma_task') == 2
+    assert cache.get('select * from prom.ma_agreement').equals(_DF)
+
+
+def test_connector_writes_invalidate_cache(tmp_path):
+    gpconnector = GPConnector()
+    gpconnector.enable_cache(str(tmp_path), fmt='pickle')
+    gpconnector.cache.put('select * from prom.ma_deal', _DF)
+    gpconnector.cache.put('select * from prom.ma_task', _DF)
+
+    gpconnector._invalidate_cache('delete from prom.ma_deal where inn is null; insert into "prom"."ma_deal" select 1')
+
+    assert gpconnector.cache.get('select * from prom.ma_deal') is None
+    assert gpconnector.cache.get('select * from prom.ma_task').equals(_DF)
@@ -0,0 +1,58 @@
+import pytest
+
+from gp.core import checks
+from gp.core.checks import Check, CHECKS
+
+TABLES = {'deal': 'prom.ma_deal', 'unified_customer': 'prom.ma_unified_customer',
+          'request_segment': 'prom.request_segment'}
+
+
+def _check(name):
+    return [x for x in CHECKS if x.name == name][0]
+
+
+def test_lookup_check_compiles_to_left_join():
+    check = _check('product_deal')
+
+    sql = check.sql(['inn', 'product_id'], TABLES)
+    joins = check.joins(['inn', 'product_id'], TABLES)
+
+    assert sql == "case when l_product_deal_d.inn is not null then 1 end as check_product_deal"
+    assert 'exists' not in sql
+    assert joins.strip().startswith("left join (select distinct inn, host_prod_id as product_id from prom.ma_deal")
+    assert joins.strip().endswith("on l_product_deal_d.inn = t.inn and l_product_deal_d.product_id = t.product_id")
+    assert check.tables == ['deal']
+
+
+def test_disabled_or_incomplete_check_has_no_join():
+    check = _check('segment')
+
+    assert check.sql(['inn'], TABLES) == "1 as check_segment"
+    assert check.joins(['inn'], TABLES) == ''
+    assert check.sql(['inn', 'request_id'], TABLES, enabled=False) == "cast(null as int) as check_segment"
+    assert check.joins(['inn', 'request_id'], TABLES, enabled=False) == ''
+    assert check.tables == ['request_segment', 'unified_customer']
+
+
+def test_lookup_keys_as_expressions():
+    check = Check('cached', 'Кэш', "{c}.key is not null", ['inn'],
+                  lookups={'c': ("select key from sandbox.cache", {'key': 'row(t.inn)::text'})})
+
+    assert check.joins(['inn'], TABLES).strip() == \
+        "left join (select key from sandbox.cache) as l_cached_c on l_cached_c.key = row(t.inn)::text"
+    assert check.tables == []
+
+
+def test_register_check(monkeypatch):
+    monkeypatch.setattr(checks, 'CHECKS', list(CHECKS))
+    check = Check('kpp', 'Нет КПП', "t.kpp is null", ['kpp'])
+
+    checks.register_check(check)
+    with pytest.raises(Exception):
+        checks.register_check(Check('kpp', 'Нет КПП', "t.kpp = ''", ['kpp']))
+    replacement = Check('kpp', 'Нет КПП', "t.kpp = ''", ['kpp'])
+    checks.register_check(replacement, replace=True)
+
+    assert checks.CHECKS[-1] is replacement
+    assert [x.name for x in checks.CHECKS].count('kpp') == 1
+    assert 'kpp' not in [x.name for x in CHECKS]
@@ -0,0 +1,55 @@
+import io
+from collections import namedtuple
+from decimal import Decimal
+
+import pandas as pd
+import pyarrow as pa
+
+from gp.core.columnar import _read_columnar
+
+Column = namedtuple('Column', ['name', 'type_code'])
+
+
+def test_arrow_timestamptz():
+    buffer = io.BytesIO(b'1,2024-01-01 12:00:00,2024-01-01 12:00:00+03\n2,\\N,\\N\n')
+    description = [Column('id', 20), Column('created_dttm', 1114), Column('loaded_dttm', 1184)]
+
+    table = _read_columnar(buffer, description, backend='arrow', categories=[])
+
+    assert table.schema.field('created_dttm').type == pa.timestamp('us')
+    assert table.schema.field('loaded_dttm').type == pa.timestamp('us', tz='UTC')
+    assert table.column('loaded_dttm')[0].as_py().hour == 9
+    assert table.column('loaded_dttm')[1].as_py() is None
+
+
+Numeric = namedtuple('Numeric', ['name', 'type_code', 'precision', 'scale'])
+_NUMERIC_DESCRIPTION = [Numeric('amount', 1700, 30, 10), Numeric('rate', 1700, None, None)]
+_NUMERIC_DATA = b'12345678901234567.0123456789,0.5\n\\N,-12.345\n'
+
+
+def test_arrow_numeric_decimal():
+    table = _read_columnar(io.BytesIO(_NUMERIC_DATA), _NUMERIC_DESCRIPTION, backend='arrow')
+
+    assert table.schema.field('amount').type == pa.decimal128(30, 10)
+    # для numeric без модификатора точность и масштаб определяются по значениям
+    assert table.schema.field('rate').type == pa.decimal128(5, 3)
+    assert table.column('amount').to_pylist() == [Decimal('12345678901234567.0123456789'), None]
+    assert table.column('rate').to_pylist() == [Decimal('0.5'), Decimal('-12.345')]
+
+
+def test_arrow_numeric_nan_stays_text():
+    table = _read_columnar(io.BytesIO(b'NaN\n1.5\n'), [Numeric('rate', 1700, None, None)], backend='arrow')
+
+    assert table.column('rate').to_pylist() == ['NaN', '1.5']
+
+
+def test_pandas_numeric_and_timestamptz():
+    buffer = io.BytesIO(b'12345678901234567.0123456789,2024-03-30 12:00:00+03\n\\N,2024-03-31 13:00:00+04\n')
+    description = [Numeric('amount', 1700, 30, 10), Column('loaded_dttm', 1184)]
+
+    df = _read_columnar(buffer, description, categories=[])
+
+    assert df['amount'].tolist() == [Decimal('12345678901234567.0123456789'), None]
+    assert str(df['loaded_dttm'].dtype).endswith(', UTC]')
+    assert df['loaded_dttm'].tolist() == [pd.Timestamp('2024-03-30 09:00:00', tz='UTC')
+                                         , pd.Timestamp('2024-03-31 09:00:00', tz='UTC')]
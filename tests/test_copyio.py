@@ -0,0 +1,102 @@
+import io
+import struct
+from collections import namedtuple
+from datetime import date
+from decimal import Decimal
+
+import pandas as pd
+
+from gp.core.copyio import _CopyStream, _BINARY_HEADER, _BINARY_TRAILER, _read_csv
+from gp.core.gpconnecor import GPConnector
+
+Column = namedtuple('Column', ['name', 'type_code'])
+
+
+def _rows():
+    df = pd.DataFrame({'id': pd.array([1, None, 3], dtype='Int64'), 'name': ['a', 'b', None]})
+    return list(df.itertuples(index=False, name=None))
+
+
+def test_text_nullable_int():
+    data = _CopyStream(_rows()).read()
+
+    assert data == b'1\ta\n\\N\tb\n3\t\\N\n'
+
+
+def test_binary_nullable_int():
+    data = _CopyStream(_rows(), type_codes=[20, 25]).read()
+
+    assert data.startswith(_BINARY_HEADER) and data.endswith(_BINARY_TRAILER)
+    second_row = struct.pack('!h', 2) + struct.pack('!i', -1) + struct.pack('!i', 1) + b'b'
+    assert second_row in data
+
+
+_DESCRIPTION = [Column('amount', 1700), Column('report_dt', 1082), Column('loaded_dttm', 1184)]
+# смещение часового пояса сессии меняется при переходе на летнее время
+_DATA = b'12345678901234567.0123456789,2024-03-30,2024-03-30 12:00:00+03\n' \
+        b'\\N,\\N,\\N\n' \
+        b'0.10,9999-12-31,2024-03-31 13:00:00+04\n'
+
+
+def _check_types(df):
+    assert df['amount'].tolist() == [Decimal('12345678901234567.0123456789'), None, Decimal('0.10')]
+    assert df['report_dt'].tolist() == [date(2024, 3, 30), None, date(9999, 12, 31)]
+    assert str(df['loaded_dttm'].dtype).endswith(', UTC]')
+    assert df['loaded_dttm'][0] == pd.Timestamp('2024-03-30 09:00:00', tz='UTC')
+    assert pd.isna(df['loaded_dttm'][1])
+    assert df['loaded_dttm'][2] == pd.Timestamp('2024-03-31 09:00:00', tz='UTC')
+
+
+def test_read_csv_types():
+    _check_types(_read_csv(io.BytesIO(_DATA), _DESCRIPTION))
+
+
+class CopyCursor(object):
+    description = _DESCRIPTION
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, params=None):
+        self.conn.statements.append(query)
+
+    def copy_expert(self, statement, buffer, size=8192):
+        self.conn.statements.append(statement)
+        buffer.write(_DATA)
+
+
+class CopyConnection(object):
+    closed = 0
+    encoding = 'UTF8'
+
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self):
+        return CopyCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+def test_copy_out_types():
+    gpconnector = GPConnector()
+    conn = CopyConnection()
+    gpconnector.pool._open = lambda options: conn
+
+    df = gpconnector.select_df('select * from prom.ma_deal', engine='copy')
+
+    _check_types(df)
+    assert any(x.startswith('copy (') and x.endswith("to stdout with csv null '\\N'") for x in conn.statements)
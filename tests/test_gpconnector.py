@@ -0,0 +1,273 @@
+import pandas as pd
+import psycopg2
+
+from gp.core.gpconnecor import GPConnector
+
+
+def _capture_iter(gpconnector):
+    calls = []
+    gpconnector.select_iter = lambda query, **kwargs: calls.append(kwargs) or iter([])
+    return calls
+
+
+def test_select_df_chunks_without_limit():
+    gpconnector = GPConnector()
+    calls = _capture_iter(gpconnector)
+
+    gpconnector.select_df('select * from prom.ma_deal', chunksize=1000)
+    gpconnector.select_df('select * from prom.ma_deal', 500, chunksize=1000)
+
+    assert calls[0]['limit'] is None
+    assert calls[1]['limit'] == 500
+
+
+class FakeCursor(object):
+    rowcount = 1
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, params=None):
+        self.conn.statements.append((query, params))
+        if 'sandbox.missing' in query:
+            raise psycopg2.ProgrammingError('relation "sandbox.missing" does not exist')
+
+    def fetchone(self):
+        return tuple('previous' for _ in self.conn.statements[-1][1])
+
+    def fetchall(self):
+        return [('Result',)]
+
+    def fetchmany(self, size):
+        return []
+
+
+class FakeConnection(object):
+    closed = 0
+
+    def __init__(self):
+        self.statements = []
+        self.cursors = []
+
+    def cursor(self, name=None, withhold=False):
+        self.cursors.append((name, withhold))
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+def test_prepared_forgotten_on_close():
+    gpconnector = GPConnector()
+    gpconnector.pool._open = lambda options: FakeConnection()
+    conn = gpconnector.pool.getconn()
+    gpconnector._prepare(conn, 'select 1')
+    gpconnector.pool.putconn(conn)
+
+    gpconnector.close()
+
+    assert conn.closed
+    assert gpconnector._prepared == {}
+
+
+def test_workload_options_override_select_default():
+    gpconnector = GPConnector()
+
+    with gpconnector.workload('autocheck'):
+        options = gpconnector._options(None, 'interactive_preview')
+
+    assert 'statement_timeout=60min' in options
+    assert 'statement_timeout=5min' in gpconnector._options(None, 'interactive_preview')
+
+
+def test_workload_sets_settings_in_session():
+    gpconnector = GPConnector()
+    gpconnector.pool._open = lambda options: FakeConnection()
+
+    with gpconnector.session():
+        conn = gpconnector._local.conn
+        with gpconnector.workload('bulk_load'):
+            applied = list(conn.statements)
+        with gpconnector.transaction(), gpconnector.workload('bulk_load'):
+            pass
+
+    assert ('set statement_mem = %s', ('1000MB',)) in applied
+    assert ('set statement_mem = %s', ('previous',)) in conn.statements
+    assert ('set local statement_mem = %s', ('1000MB',)) in conn.statements
+
+
+def test_explain_in_transaction_uses_savepoint():
+    gpconnector = GPConnector()
+    gpconnector.pool._open = lambda options: FakeConnection()
+
+    with gpconnector.transaction():
+        conn = gpconnector._local.conn
+        plan = gpconnector.explain_plan('select 1', fmt='text')
+
+    assert plan == 'Result'
+    statements = [x[0] for x in conn.statements]
+    assert statements[:2] == ['savepoint gp_explain', 'explain (format text) select 1']
+    assert statements[2:4] == ['rollback to savepoint gp_explain', 'release savepoint gp_explain']
+
+
+def test_describe_failure_in_transaction_rolls_back_to_savepoint():
+    gpconnector = GPConnector()
+    gpconnector.pool._open = lambda options: FakeConnection()
+
+    with gpconnector.transaction():
+        conn = gpconnector._local.conn
+        description = gpconnector.describe('sandbox.missing')
+
+    assert description is None
+    statements = [x[0] for x in conn.statements]
+    assert statements[:4] == ['savepoint gp_describe', 'select * from sandbox.missing limit 0'
+                              , 'rollback to savepoint gp_describe', 'release savepoint gp_describe']
+
+
+def test_execute_traces_params():
+    gpconnector = GPConnector()
+    gpconnector.pool._open = lambda options: FakeConnection()
+    records = []
+    gpconnector.add_hook('after', records.append)
+
+    with gpconnector.session():
+        gpconnector.execute('insert into sandbox.t values (%s)', [(1,)])
+
+    assert records[-1]['params'] == [(1,)]
+
+
+def test_source_codes_keep_name_case():
+    gpconnector = GPConnector()
+    calls = []
+    gpconnector.select_list = lambda query, limit=None, params=None: calls.append(params) or [('prom', 'Stop_1', ' select 1 ')]
+
+    source_codes = gpconnector.get_source_codes(['prom.Stop_1'])
+
+    assert calls[0] == {'schemas': ['prom'], 'names': ['Stop_1']}
+    assert source_codes == {'prom.Stop_1': 'select 1'}
+
+
+def test_select_iter_holds_cursor_in_session():
+    gpconnector = GPConnector()
+    conn = FakeConnection()
+    gpconnector.pool._open = lambda options: conn
+
+    with gpconnector.session():
+        list(gpconnector.select_iter('select 1'))
+        with gpconnector.transaction():
+            list(gpconnector.select_iter('select 2'))
+
+    named = [withhold for name, withhold in conn.cursors if name is not None]
+    # в сессии запросы между порциями фиксируются, поэтому курсор должен пережить фиксацию
+    assert named == [True, False]
+    assert 'close all' in [x[0] for x in conn.statements]
+
+
+def test_table_health_segment_counts():
+    gpconnector = GPConnector()
+    gpconnector.select_df = lambda query, **kwargs: pd.DataFrame(
+        {'table_name': ['prom.ma_deal', 'prom.ma_task'], 'distributed_by': ['DISTRIBUTED BY (inn)'] * 2, 'segments': [4, 4],
+         'size_bytes': [0, 0], 'bloat_ratio': [None, None], 'estimated_rows': [40, 5],
+         'last_analyzed': [pd.Timestamp('2024-01-01'), None]})
+    # сегменты 2 и 3 без строк в результат group by не попадают, вторая таблица не прочиталась
+    gpconnector.run_many = lambda queries, **kwargs: [[(0, 10), (1, 30)], Exception('permission denied')]
+
+    df = gpconnector.table_health(['prom.%'])
+
+    first = df.iloc[0]
+    assert (first['rows'], first['empty_segments'], first['min_segment_rows'], first['max_segment_rows']) == (40, 2, 0, 30)
+    # выборочное стандартное отклонение [10, 30, 0, 0]: sqrt((0 + 400 + 100 + 100) / 3)
+    assert round(first['skew_coefficient'], 2) == round(200 ** 0.5 / 10 * 100, 2)
+    assert first['max_to_avg'] == 3
+    assert not first['stats_stale']
+    assert pd.isna(df.iloc[1]['rows']) and df.iloc[1]['stats_stale']
+
+
+def _catalog_connector():
+    gpconnector = GPConnector()
+    gpconnector.pool._open = lambda options: FakeConnection()
+    queries = []
+
+    def select_list(query, limit=1000000, options=None, params=None):
+        queries.append('refresh' if 'pg_class c' in query else 'lookup')
+        return [('prom', 'ma_deal', 'TABLE')] if 'pg_class c' in query else [('TABLE',)]
+
+    gpconnector.select_list = select_list
+    return gpconnector, queries
+
+
+def test_catalog_ttl():
+    gpconnector, queries = _catalog_connector()
+
+    assert gpconnector.get_object_type('prom.ma_deal') == 'TABLE'
+    assert gpconnector.get_object_type('prom.MA_DEAL') == 'TABLE'
+    assert gpconnector.get_object_type('prom.missing') is None
+    assert queries == ['refresh']
+
+    gpconnector._catalog_loaded -= gpconnector.catalog_ttl + 1
+    gpconnector.get_object_type('prom.ma_deal')
+    assert queries == ['refresh', 'refresh']
+
+
+def test_catalog_invalidated_by_ddl():
+    gpconnector, queries = _catalog_connector()
+    gpconnector.get_object_type('prom.ma_deal')
+
+    # созданный объект помечается устаревшим и ищется запросом, результат возвращается в кэш
+    gpconnector.execute('create table prom.new_table as select 1 as inn')
+    assert gpconnector.get_object_type('prom.new_table') == 'TABLE'
+    assert gpconnector.get_object_type('prom.new_table') == 'TABLE'
+    assert queries == ['refresh', 'lookup']
+
+    # ALTER может переименовать объект, поэтому кэш загружается заново
+    gpconnector.execute('alter table prom.new_table rename to old_table')
+    gpconnector.get_object_type('prom.ma_deal')
+    assert queries == ['refresh', 'lookup', 'refresh']
+
+
+def test_distributed_clause_auto_chooses_inn():
+    gpconnector = GPConnector()
+    gpconnector.describe = lambda target, columns=None, options=None: {'INN': 1043, 'product_id': 20} \
+        if target == 'prom.ma_deal' else {'product_id': 20}
+
+    assert gpconnector._distributed_clause('auto', pd.DataFrame({'inn': [], 'product_id': []})) == '\ndistributed by (inn)'
+    assert gpconnector._distributed_clause('auto', [('1', 1)], 'product_id, inn') == '\ndistributed by (inn)'
+    assert gpconnector._distributed_clause('auto', 'prom.ma_deal') == '\ndistributed by (inn)'
+    assert gpconnector._distributed_clause('auto', 'select product_id from prom.ma_task') == ''
+    assert gpconnector._distributed_clause('auto', 'create or replace function {function_name}() ...') == ''
+    assert gpconnector._distributed_clause('RANDOMLY', 'prom.ma_deal') == '\ndistributed randomly'
+    assert gpconnector._distributed_clause('inn, product_id', 'prom.ma_deal') == '\ndistributed by (inn, product_id)'
+    assert gpconnector._distributed_clause(None, 'prom.ma_deal') == ''
+
+
+def _analyzed(policy, rows, analyze_columns=None):
+    gpconnector = GPConnector(analyze_policy=policy)
+    gpconnector.analyze_columns = analyze_columns
+    gpconnector.describe = lambda target, columns=None, options=None: {'inn': 1043, 'product_id': 20}
+    calls = []
+    gpconnector.analyze = lambda table_name, columns=None, options=None: calls.append((table_name, columns))
+    gpconnector._auto_analyze('sandbox.target', rows)
+    return calls
+
+
+def test_auto_analyze_policy():
+    assert _analyzed('always', 5) == [('sandbox.target', None)]
+    assert _analyzed('never', 10 ** 9) == []
+    assert _analyzed(None, 10 ** 9) == []
+    # порог: небольшие загрузки без ANALYZE, неизвестное количество строк (CREATE ... AS) - с ANALYZE
+    assert _analyzed(1000, 1000) == []
+    assert _analyzed(1000, 1001) == [('sandbox.target', None)]
+    assert _analyzed(1000, None) == [('sandbox.target', None)]
+    assert _analyzed(1000, 5000, ['inn', 'deal_status_nm']) == [('sandbox.target', ['inn'])]
@@ -0,0 +1,56 @@
+import json
+
+from gp.core.plan import QueryPlan
+
+# сокращенный результат EXPLAIN (ANALYZE, FORMAT JSON) Greenplum
+_PLAN = [{'Plan': {'Node Type': 'Gather Motion', 'Senders': 4, 'Receivers': 1, 'Slice': 3, 'Plan Rows': 1000,
+                   'Actual Rows': 1000,
+                   'Plans': [{'Node Type': 'Hash Join', 'Join Type': 'Inner', 'Slice': 2, 'Plan Rows': 1000, 'Actual Rows': 1000,
+                              'Segments': 4, 'Actual Max Rows': 250,
+                              'Plans': [{'Node Type': 'Redistribute Motion', 'Senders': 4, 'Receivers': 4, 'Slice': 1,
+                                         'Hash Key': ['d.inn'], 'Plan Rows': 20000000, 'Actual Rows': 20000000,
+                                         'Segments': 4, 'Actual Max Rows': 17000000,
+                                         'Plans': [{'Node Type': 'Seq Scan', 'Schema': 'prom', 'Relation Name': 'ma_deal',
+                                                    'Plan Rows': 20000000, 'Actual Rows': 20000000}]},
+                                        {'Node Type': 'Hash', 'Hash Batches': 4, 'Plan Rows': 500000, 'Actual Rows': 500000,
+                                         'Plans': [{'Node Type': 'Broadcast Motion', 'Senders': 4, 'Receivers': 4,
+                                                    'Slice': 4, 'Plan Rows': 10, 'Actual Rows': 500000,
+                                                    'Plans': [{'Node Type': 'Seq Scan', 'Schema': 'prom',
+                                                               'Relation Name': 'ma_task', 'Plan Rows': 10,
+                                                               'Actual Rows': 125000}]}]}]}]},
+          'Planning Time': 1.5, 'Execution Time': 2500.0}]
+
+
+def test_flatten_motions():
+    plan = QueryPlan(json.dumps(_PLAN))
+    nodes = plan.nodes.set_index('node_type')
+
+    assert list(plan.nodes['node_type']) == ['Gather Motion', 'Hash Join', 'Redistribute Motion', 'Seq Scan', 'Hash',
+                                             'Broadcast Motion', 'Seq Scan']
+    assert [x['parent_id'] for x in plan._nodes] == [None, 0, 1, 2, 1, 4, 5]
+    assert nodes.loc['Redistribute Motion', 'motion'] == 'Redistribute'
+    assert nodes.loc['Redistribute Motion', 'hash_key'] == 'd.inn'
+    assert nodes.loc['Broadcast Motion', 'motion'] == 'Broadcast'
+    # узлы без Slice наследуют слайс родителя
+    assert [x['slice'] for x in plan._nodes] == [3, 2, 1, 1, 2, 4, 4]
+    assert plan.slices == 4
+    assert plan.execution_time == 2500.0
+
+
+def test_flatten_skew_and_spill():
+    plan = QueryPlan(_PLAN)
+    nodes = plan.nodes.set_index('node_type')
+
+    # максимум на сегменте относительно среднего actual_rows / segments
+    assert nodes.loc['Redistribute Motion', 'skew'] == 17000000 / 5000000
+    assert nodes.loc['Hash Join', 'skew'] == 1
+    assert nodes.loc['Hash', 'spill']
+    assert not nodes.loc['Hash Join', 'spill']
+
+    issues = plan.summary(verbose=False)
+    assert set(zip(issues['node_type'], issues['issue'])) == {('Redistribute Motion', 'redistribute'),
+                                                              ('Redistribute Motion', 'skew'),
+                                                              ('Hash', 'spill'),
+                                                              ('Broadcast Motion', 'broadcast'),
+                                                              ('Broadcast Motion', 'misestimate'),
+                                                              ('Seq Scan', 'misestimate')}
@@ -0,0 +1,45 @@
+from gp.core.pool import ConnectionPool
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.closed = 0
+
+    def close(self):
+        self.closed = 1
+
+
+def _age(pool):
+    # соединения считаются простаивающими с начала эпохи
+    pool._idle = dict((key, [(conn, 0) for conn, _ in idle]) for key, idle in pool._idle.items())
+
+
+def _pool(**kwargs):
+    pool = ConnectionPool('user', 'password', 'localhost', 'postgres', **kwargs)
+    pool._open = lambda options: FakeConnection()
+    return pool
+
+
+def test_idle_connections_expire_on_putconn():
+    pool = _pool()
+    first, second = pool.getconn(), pool.getconn()
+    pool.putconn(first)
+    _age(pool)
+
+    pool.putconn(second)
+
+    assert first.closed and not second.closed
+    assert pool.size() == 1
+
+
+def test_min_size_connections_are_kept():
+    pool = _pool(min_size=1)
+    first, second, third = pool.getconn(), pool.getconn(), pool.getconn()
+    pool.putconn(first)
+    pool.putconn(second)
+    _age(pool)
+
+    pool.putconn(third)
+
+    assert first.closed + second.closed == 1 and not third.closed
+    assert pool.size() == 2
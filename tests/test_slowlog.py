@@ -0,0 +1,12 @@
+from gp.core.slowlog import _explain_query
+
+
+def _record(statement, kind='execute', params=None):
+    return {'kind': kind, 'statement': statement, 'params': params}
+
+
+def test_explain_query():
+    assert _explain_query(_record('select * from prom.ma_deal')) == 'select * from prom.ma_deal'
+    assert _explain_query(_record("copy (select 1) to stdout with csv", 'copy_out')) == 'select 1'
+    assert _explain_query(_record('create table sandbox.t as select 1')) is None
+    assert _explain_query(_record('insert into sandbox.t values (%s)', params=[(1,)])) is None